@@ -0,0 +1,43 @@
+# account_status.py - Tập user bị khóa giữ trong bộ nhớ, thay cho truy vấn nguoi_dung ở mỗi request
+import threading
+import time
+
+LOCKED = 'Bị khóa'
+
+
+class LockedUsers:
+    """
+    Tập id user đang bị khóa.
+    - Route khóa/mở khóa đẩy thay đổi vào ngay (lock/unlock) -> có hiệu lực tức thì trong process đó
+    - Cứ refresh_interval giây nạp lại toàn bộ từ DB bằng loader -> các worker gunicorn khác
+      thấy thay đổi chậm nhất sau chừng ấy giây
+    loader: hàm trả về iterable id bị khóa, được gọi trong request nên đã có app context
+    """
+
+    def __init__(self, loader, refresh_interval=5):
+        self.loader = loader
+        self.refresh_interval = refresh_interval
+        self._ids = set()
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def _refresh_if_stale(self):
+        if time.time() - self._loaded_at < self.refresh_interval:
+            return
+        with self._lock:
+            if time.time() - self._loaded_at < self.refresh_interval:
+                return
+            self._ids = set(self.loader())
+            self._loaded_at = time.time()
+
+    def is_locked(self, user_id):
+        self._refresh_if_stale()
+        return int(user_id) in self._ids
+
+    def lock(self, user_id):
+        with self._lock:
+            self._ids = self._ids | {int(user_id)}
+
+    def unlock(self, user_id):
+        with self._lock:
+            self._ids = self._ids - {int(user_id)}
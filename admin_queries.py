@@ -0,0 +1,73 @@
+# admin_queries.py - Danh sách user cho trang admin: phân trang, tìm theo tiền tố, sắp xếp, hoạt động
+# Dùng chung cho api_routes.py, app_admin.py, admin_simple.py (mỗi nơi truyền model của mình)
+from sqlalchemy import and_, func, or_
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 500
+USER_SORTS = ('id', 'so_du', 'created_at')
+
+def prefix_filter(expr, prefix):
+    """expr LIKE 'prefix%' viết dạng khoảng để dùng được index trên expr (SQLite lẫn PostgreSQL)"""
+    return and_(expr >= prefix, expr < prefix + '\uffff')
+
+def parse_paging(args):
+    try:
+        page = max(1, int(args.get('page', 1)))
+        per_page = max(1, min(int(args.get('per_page', DEFAULT_PER_PAGE)), MAX_PER_PAGE))
+    except ValueError:
+        raise ValueError('page/per_page không hợp lệ')
+    return page, per_page
+
+def list_users(db, NguoiDung, GiaoDich, args, fields):
+    """
+    Tham số (query string):
+      page, per_page   - phân trang (mặc định 1, 50; tối đa 500 dòng/trang)
+      q                - tiền tố email hoặc họ tên (không phân biệt hoa thường)
+      sort             - id | so_du | created_at, thêm '-' để giảm dần (vd: sort=-so_du)
+      activity=1       - thêm so_giao_dich và hoat_dong_cuoi của từng user (một câu GROUP BY)
+    Trả về (items, total); tham số sai -> ValueError
+    """
+    page, per_page = parse_paging(args)
+    query = NguoiDung.query
+
+    q = (args.get('q') or '').strip().lower()
+    if q:
+        # Khớp index idx_nguoi_dung_email_lower / idx_nguoi_dung_ho_ten_lower
+        query = query.filter(or_(
+            prefix_filter(func.lower(NguoiDung.email), q),
+            prefix_filter(func.lower(NguoiDung.ho_ten), q)
+        ))
+
+    sort = args.get('sort', 'id')
+    column = sort.lstrip('-')
+    if column not in USER_SORTS:
+        raise ValueError(f"sort phải là một trong: {', '.join(USER_SORTS)}")
+    order = getattr(NguoiDung, column)
+    order = order.desc() if sort.startswith('-') else order.asc()
+
+    total = query.order_by(None).count()
+    users = query.order_by(order, NguoiDung.id).offset((page - 1) * per_page).limit(per_page).all()
+
+    items = []
+    for u in users:
+        item = {f: getattr(u, f) for f in fields}
+        if 'created_at' in item:
+            item['created_at'] = u.created_at.isoformat() if u.created_at else None
+        items.append(item)
+
+    if args.get('activity') in ('1', 'true') and users:
+        # Số giao dịch và lần hoạt động cuối của cả trang trong một câu
+        activity = dict((row[0], row[1:]) for row in db.session.query(
+            GiaoDich.nguoi_dung_id,
+            func.count(GiaoDich.id),
+            func.max(GiaoDich.ngay)
+        ).filter(
+            GiaoDich.nguoi_dung_id.in_([u.id for u in users])
+        ).group_by(GiaoDich.nguoi_dung_id).all())
+
+        for item, u in zip(items, users):
+            so_giao_dich, cuoi = activity.get(u.id, (0, None))
+            item['so_giao_dich'] = so_giao_dich
+            item['hoat_dong_cuoi'] = cuoi.isoformat() if cuoi else None
+
+    return items, total
@@ -1,13 +1,16 @@
 from flask import Flask, jsonify, request
-from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity, create_access_token
+from flask_jwt_extended import JWTManager, jwt_required, get_jwt, get_jwt_identity, create_access_token
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
-from datetime import timedelta
+from datetime import datetime, timedelta
 import bcrypt
 import os
+from roles import ADMIN, RoleCache
+from admin_queries import list_users
+from money import Money
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['X-Total-Count'])
 
 # Cấu hình database
 import os
@@ -22,6 +25,11 @@ db = SQLAlchemy(app)
 jwt = JWTManager(app)
 
 # Models đơn giản
+class VaiTro(db.Model):
+    __tablename__ = 'vai_tro'
+    id = db.Column(db.Integer, primary_key=True)
+    loai_vai_tro = db.Column(db.String(50), nullable=False)
+
 class NguoiDung(db.Model):
     __tablename__ = 'nguoi_dung'
     id = db.Column(db.Integer, primary_key=True)
@@ -29,12 +37,24 @@ class NguoiDung(db.Model):
     ho_ten = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(100), unique=True, nullable=False)
     mat_khau = db.Column(db.String(255), nullable=False)
-    so_du = db.Column(db.Float, default=0)
+    so_du = db.Column(Money, default=0)
     trang_thai = db.Column(db.String(20), default='Hoạt động')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class GiaoDich(db.Model):
     __tablename__ = 'giao_dich'
     id = db.Column(db.Integer, primary_key=True)
+    danh_muc_id = db.Column(db.Integer)
+    nguoi_dung_id = db.Column(db.Integer)
+    ngay = db.Column(db.DateTime)
+
+# Vai trò lấy từ claim 'vai_tro' trong token + bảng vai_tro/tập admin cache trong bộ nhớ
+roles = RoleCache(
+    lambda: db.session.query(VaiTro.id, VaiTro.loai_vai_tro).all(),
+    lambda role_ids: [id for (id,) in db.session.query(NguoiDung.id).filter(NguoiDung.vai_tro_id.in_(role_ids))],
+    refresh_interval=60
+)
+roles.watch(VaiTro, NguoiDung)
 
 # Admin Login
 @app.route('/api/auth/login', methods=['POST'])
@@ -56,13 +76,13 @@ def admin_login():
         return jsonify({'message': 'Lỗi xác thực mật khẩu'}), 401
     
     # Kiểm tra quyền admin
-    if user.vai_tro_id != 1:
+    if roles.role_name(user.vai_tro_id) != ADMIN:
         return jsonify({'message': 'Bạn không có quyền truy cập admin'}), 403
     
     if user.trang_thai == 'Bị khóa':
         return jsonify({'message': 'Tài khoản đã bị khóa'}), 403
     
-    access_token = create_access_token(identity=str(user.id))
+    access_token = create_access_token(identity=str(user.id), additional_claims=roles.claims_for(user))
     return jsonify({'access_token': access_token, 'user_id': user.id}), 200
 
 # Get all users
@@ -70,21 +90,16 @@ def admin_login():
 @jwt_required()
 def get_all_users():
     try:
-        admin_id = int(get_jwt_identity())
-        admin = NguoiDung.query.get(admin_id)
-        
-        if not admin or admin.vai_tro_id != 1:
+        if not roles.is_admin(get_jwt_identity(), get_jwt()):
             return jsonify({'message': 'Không có quyền'}), 403
         
-        users = NguoiDung.query.all()
-        return jsonify([{
-            'id': u.id,
-            'ho_ten': u.ho_ten,
-            'email': u.email,
-            'so_du': u.so_du,
-            'trang_thai': u.trang_thai,
-            'vai_tro_id': u.vai_tro_id
-        } for u in users]), 200
+        users, total = list_users(
+            db, NguoiDung, GiaoDich, request.args,
+            ('id', 'ho_ten', 'email', 'so_du', 'trang_thai', 'vai_tro_id', 'created_at')
+        )
+        return jsonify(users), 200, {'X-Total-Count': str(total)}
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         return jsonify({'message': f'Lỗi: {str(e)}'}), 500
 
@@ -93,10 +108,7 @@ def get_all_users():
 @jwt_required()
 def lock_user(user_id):
     try:
-        admin_id = int(get_jwt_identity())
-        admin = NguoiDung.query.get(admin_id)
-        
-        if not admin or admin.vai_tro_id != 1:
+        if not roles.is_admin(get_jwt_identity(), get_jwt()):
             return jsonify({'message': 'Không có quyền'}), 403
         
         user = NguoiDung.query.get(user_id)
@@ -114,10 +126,7 @@ def lock_user(user_id):
 @jwt_required()
 def unlock_user(user_id):
     try:
-        admin_id = int(get_jwt_identity())
-        admin = NguoiDung.query.get(admin_id)
-        
-        if not admin or admin.vai_tro_id != 1:
+        if not roles.is_admin(get_jwt_identity(), get_jwt()):
             return jsonify({'message': 'Không có quyền'}), 403
         
         user = NguoiDung.query.get(user_id)
@@ -0,0 +1,124 @@
+# admin_stats.py - Bảng thống kê hệ thống theo ngày (thong_ke_he_thong) cho trang admin
+# Dòng của một ngày: hoạt động trong ngày (số giao dịch, tổng tiền, số user có giao dịch)
+# + các tổng toàn hệ thống tại lần làm mới gần nhất. Mỗi app truyền db và model của mình.
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from money import money_sum
+from stats_queries import period_expression
+
+def day_key(dt):
+    return dt.strftime('%Y-%m-%d')
+
+def refresh_snapshot(db, NguoiDung, GiaoDich, ThongKeHeThong, days=1):
+    """
+    Tính lại `days` ngày gần nhất (tính cả hôm nay) bằng một câu GROUP BY theo ngày
+    và một câu đếm tổng, rồi ghi đè vào thong_ke_he_thong. Có commit.
+    Trả về dòng của hôm nay
+    """
+    now = datetime.utcnow()
+    start = (now - timedelta(days=days - 1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    ngay = period_expression(db, GiaoDich.ngay, 'day')
+    per_day = {
+        row.ngay: row for row in db.session.query(
+            ngay.label('ngay'),
+            func.count(GiaoDich.id).label('so_giao_dich'),
+            money_sum(GiaoDich.so_tien).label('tong_tien'),
+            func.count(func.distinct(GiaoDich.nguoi_dung_id)).label('nguoi_dung_giao_dich')
+        ).filter(
+            GiaoDich.ngay >= start
+        ).group_by(ngay).all()
+    }
+
+    totals = db.session.query(
+        db.session.query(func.count(NguoiDung.id)).scalar_subquery().label('tong_nguoi_dung'),
+        db.session.query(func.count(NguoiDung.id)).filter(
+            NguoiDung.trang_thai == 'Hoạt động'
+        ).scalar_subquery().label('nguoi_dung_hoat_dong'),
+        db.session.query(func.count(GiaoDich.id)).scalar_subquery().label('tong_giao_dich')
+    ).one()
+
+    keys = [day_key(start + timedelta(days=i)) for i in range(days)]
+    existing = {r.ngay: r for r in ThongKeHeThong.query.filter(ThongKeHeThong.ngay.in_(keys))}
+    today = keys[-1]
+
+    for key in keys:
+        row = existing.get(key)
+        if not row:
+            row = ThongKeHeThong(ngay=key)
+            db.session.add(row)
+        day = per_day.get(key)
+        row.so_giao_dich = day.so_giao_dich if day else 0
+        row.tong_tien = day.tong_tien if day else 0
+        row.nguoi_dung_giao_dich = day.nguoi_dung_giao_dich if day else 0
+        # Các tổng toàn hệ thống chỉ đúng cho thời điểm hiện tại -> chỉ ghi vào dòng hôm nay,
+        # dòng các ngày trước giữ giá trị đã chụp lúc ngày đó còn là hôm nay (lịch sử tăng trưởng)
+        if key == today:
+            row.tong_nguoi_dung = totals.tong_nguoi_dung
+            row.nguoi_dung_hoat_dong = totals.nguoi_dung_hoat_dong
+            row.tong_giao_dich = totals.tong_giao_dich
+        row.cap_nhat_luc = now
+        existing[key] = row
+
+    db.session.commit()
+    return existing[today]
+
+def record_transactions(ThongKeHeThong, deltas):
+    """
+    Cộng dồn ngay khi ghi giao dịch, chưa commit: deltas = {'YYYY-MM-DD': (so_giao_dich, so_tien)}
+    Dùng UPDATE ... SET x = x + :delta nên không đua nhau đọc-sửa-ghi.
+    Ngày chưa có dòng thì bỏ qua, lần làm mới kế tiếp sẽ tính đủ.
+    Số user có giao dịch trong ngày không cộng dồn được, chỉ cập nhật khi làm mới
+    """
+    total = 0
+    for key, (so_giao_dich, so_tien) in deltas.items():
+        ThongKeHeThong.query.filter_by(ngay=key).update({
+            ThongKeHeThong.so_giao_dich: ThongKeHeThong.so_giao_dich + so_giao_dich,
+            ThongKeHeThong.tong_tien: ThongKeHeThong.tong_tien + so_tien
+        }, synchronize_session=False)
+        total += so_giao_dich
+
+    ThongKeHeThong.query.filter_by(ngay=day_key(datetime.utcnow())).update({
+        ThongKeHeThong.tong_giao_dich: ThongKeHeThong.tong_giao_dich + total
+    }, synchronize_session=False)
+
+def serialize_snapshot(row):
+    return {
+        'ngay': row.ngay,
+        'so_giao_dich': row.so_giao_dich,
+        'tong_tien': row.tong_tien,
+        'nguoi_dung_giao_dich': row.nguoi_dung_giao_dich,
+        'tong_nguoi_dung': row.tong_nguoi_dung,
+        'nguoi_dung_hoat_dong': row.nguoi_dung_hoat_dong,
+        'tong_giao_dich': row.tong_giao_dich,
+        'cap_nhat_luc': row.cap_nhat_luc.isoformat() if row.cap_nhat_luc else None
+    }
+
+
+class PeriodicTask:
+    """Chạy func mỗi interval giây trên thread nền (daemon); lỗi được in ra và lần sau chạy tiếp"""
+
+    def __init__(self, interval, func):
+        self.interval = interval
+        self.func = func
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or self._thread:
+            return
+        self._thread = threading.Thread(target=self._loop, name='periodic-task', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.func()
+            except Exception as e:
+                print(f"❌ Lỗi tác vụ định kỳ: {e}")
@@ -3,70 +3,91 @@ from collections import defaultdict, OrderedDict
 from datetime import datetime
 import statistics
 
-def full_financial_analysis(transactions):
+from forecast import fit_all, forecast, month_index, month_key
+from money import to_money
+
+def full_financial_analysis(transactions, fitter=None):
     """
     Nhận list giao dịch từ DB (dict: so_tien, mo_ta, danh_muc, ngay)
     Nếu không có 'ngay', lấy datetime.utcnow()
-    Trả về dự đoán chi tiêu, summary, cảnh báo, gợi ý
+    Trả về dự đoán chi tiêu, summary, cảnh báo, gợi ý.
+    fitter(month_cat) -> (thang_cuoi, {danh mục: params}) để dùng mô hình đã lưu (forecast.cached_models);
+    không truyền thì fit tại chỗ
     """
     if not transactions:
         return {"status": "error", "error": "Không có dữ liệu"}
 
-    month_map = defaultdict(float)
-    parsed_items = []
+    month_cat = defaultdict(lambda: defaultdict(int))
 
     for tx in transactions:
         try:
             dt = tx.get('ngay') or tx.get('created_at') or datetime.utcnow()
             if isinstance(dt, str):
                 dt = datetime.fromisoformat(dt)
-            amt = float(tx.get('so_tien', 0))
+            amt = to_money(tx.get('so_tien', 0))
             category = tx.get('danh_muc') or tx.get('mo_ta', 'khác')
-            category = str(category).lower().strip() or 'khác'
-            month = dt.strftime('%Y-%m')
-            month_map[month] += amt
-            parsed_items.append((dt, amt, category))
+            month_cat[dt.strftime('%Y-%m')][_normalize_category(category)] += amt
         except:
             continue
 
+    return _analyze_month_cat(month_cat, fitter)
+
+def monthly_aggregate_analysis(rows, fitter=None):
+    """
+    Giống full_financial_analysis nhưng nhận tổng đã gộp sẵn
+    theo (thang 'YYYY-MM', danh_muc, tong_tien) từ bảng tong_hop_thang,
+    nên chi phí là O(tháng × danh mục) thay vì O(giao dịch)
+    """
+    if not rows:
+        return {"status": "error", "error": "Không có dữ liệu"}
+
+    month_cat = defaultdict(lambda: defaultdict(int))
+    for month, category, amt in rows:
+        month_cat[month][_normalize_category(category)] += to_money(amt or 0)
+
+    return _analyze_month_cat(month_cat, fitter)
+
+def _normalize_category(category):
+    return str(category).lower().strip() or 'khác'
+
+def _analyze_month_cat(month_cat, fitter=None):
+    # Số tiền là int đồng nên tổng chính xác, không phụ thuộc thứ tự cộng; vẫn duyệt theo thứ tự
+    # tháng/danh mục đã sắp xếp để JSON trả về giống hệt engine numpy (ai_numpy.py)
+    month_map = {m: sum(cats[c] for c in sorted(cats)) for m, cats in month_cat.items()}
+
     sorted_months = OrderedDict(sorted(month_map.items()))
     history = list(sorted_months.values())
     history_months = list(sorted_months.keys())
 
-    # Dự đoán tháng tiếp theo
-    n = len(history)
-    if n <= 1:
-        pred = history[-1] if n else 0.0
+    # Dự đoán tháng tiếp theo sau tháng cuối có dữ liệu: cộng dự báo của từng danh mục,
+    # mô hình fit trên các tháng đã kết thúc (forecast.py)
+    last_closed, models = (fitter or fit_all)(month_cat)
+    target = month_key(month_index(history_months[-1]) + 1)
+    category_prediction = OrderedDict()
+    if not models:
+        pred = history[-1]
         method = "not_enough_data"
     else:
-        x_mean = (n-1)/2
-        y_mean = sum(history)/n
-        num = sum((i-x_mean)*(y-y_mean) for i,y in enumerate(history))
-        den = sum((i-x_mean)**2 for i in range(n))
-        if den == 0:
-            pred = history[-1]
-            method = "flat_data"
-        else:
-            a = num/den
-            b = y_mean - a*x_mean
-            pred = max(a*n + b, 0)
-            method = "linear_regression"
+        steps = month_index(target) - month_index(last_closed)
+        for cat in sorted(models):
+            category_prediction[cat] = forecast(models[cat], steps)
+        pred = sum(category_prediction.values())
+        methods = {m['method'] for m in models.values()}
+        method = next(m for m in ('holt_winters', 'holt', 'average') if m in methods)
 
     # Summary theo category
-    cat_map = defaultdict(float)
-    for _, amt, cat in parsed_items:
-        cat_map[cat] += amt
+    cat_map = defaultdict(int)
+    for m in sorted(month_cat):
+        for cat in sorted(month_cat[m]):
+            cat_map[cat] += month_cat[m][cat]
     cat_map = OrderedDict(sorted(cat_map.items(), key=lambda x: -x[1]))
 
     # Cảnh báo chi tiêu tăng đột biến
     spikes = []
-    month_cat = defaultdict(lambda: defaultdict(float))
-    for dt, amt, cat in parsed_items:
-        month_cat[dt.strftime('%Y-%m')][cat] += amt
     months = sorted(month_cat.keys())
     if len(months) >= 2:
         cats = {c for m in months for c in month_cat[m]}
-        for cat in cats:
+        for cat in sorted(cats):
             values = [month_cat[m].get(cat,0.0) for m in months]
             last = values[-1]
             baseline = statistics.median(values[:-1])
@@ -78,37 +99,74 @@ def full_financial_analysis(transactions):
                     "message": f"Chi tiêu '{cat}' tăng mạnh {round(last/baseline,2)}x so với trước."
                 })
 
-    # Gợi ý chi tiêu
+    # Gợi ý chi tiêu dạng object: route dùng các trường số, giao diện hiển thị 'message'
     total = sum(history) or 1
     advice = []
-    try:
-        for cat, amt in list(cat_map.items())[:5]:
-            pct = amt/total*100
-            if pct >= 40:
-                advice.append(f"Chi tiêu '{cat}' chiếm {pct:.1f}% — nên giảm xuống 25-30%.")
-            elif pct >= 20:
-                advice.append(f"Chi tiêu '{cat}' chiếm {pct:.1f}% — nên kiểm soát.")
-        months_count = len(set([dt.strftime('%Y-%m') for dt,_,_ in parsed_items])) or 1
-        avg_month = total / months_count
-        advice.append(f"Trung bình mỗi tháng chi {avg_month:.0f}. Hãy dành 10% để tiết kiệm.")
-    except:
-        pass
-
-    hist_list = [{"month": m, "amount": round(v,2)} for m,v in zip(history_months, history)]
+    for cat, amt in list(cat_map.items())[:5]:
+        share = amt/total
+        if share >= 0.4:
+            advice.append({
+                "type": "reduce_category",
+                "category": cat,
+                "share": round(share, 4),
+                "target_share": [0.25, 0.30],
+                "message": f"Chi tiêu '{cat}' chiếm {share*100:.1f}% — nên giảm xuống 25-30%."
+            })
+        elif share >= 0.2:
+            advice.append({
+                "type": "watch_category",
+                "category": cat,
+                "share": round(share, 4),
+                "message": f"Chi tiêu '{cat}' chiếm {share*100:.1f}% — nên kiểm soát."
+            })
+    avg_month = total / (len(month_cat) or 1)
+    advice.append({
+        "type": "save",
+        "ratio": 0.10,
+        "monthly_average": round(avg_month),
+        "message": f"Trung bình mỗi tháng chi {avg_month:.0f}. Hãy dành 10% để tiết kiệm."
+    })
+
+    hist_list = [{"month": m, "amount": v} for m,v in zip(history_months, history)]
 
     return {
         "status": "ok",
         "summary": {
             "months_count": len(history),
-            "total_history_amount": round(total,2),
+            "total_history_amount": total,
             "last_month": hist_list[-1] if hist_list else None
         },
         "monthly_prediction": {
-            "predicted_amount": round(pred,2),
+            "month": target,
+            "predicted_amount": round(pred),
             "method": method,
+            "fitted_through": last_closed,
+            "by_category": {k: round(v) for k,v in category_prediction.items()},
             "history": hist_list
         },
-        "category_summary": {k: round(v,2) for k,v in cat_map.items()},
+        "category_summary": dict(cat_map),
         "category_warnings": spikes,
         "advice": advice
     }
+
+def apply_advice(result):
+    """
+    Dự đoán nếu làm theo gợi ý: danh mục 'reduce_category' về giữa khoảng target_share của tổng dự đoán
+    (không bao giờ tăng so với dự đoán của chính danh mục), rồi trừ phần tiết kiệm 'save'. Trả về số tiền (làm tròn)
+    """
+    prediction = result['monthly_prediction']
+    current_total = prediction['predicted_amount']
+    amounts = dict(prediction['by_category'])
+
+    for item in result['advice']:
+        # Chỉ đổi danh mục có trong dự đoán; thêm danh mục mới sẽ làm tổng tăng thay vì giảm
+        if item['type'] == 'reduce_category' and item['category'] in amounts:
+            low, high = item['target_share']
+            cat = item['category']
+            amounts[cat] = min(amounts[cat], (low + high) / 2 * current_total)
+
+    predicted_total = sum(amounts.values()) if amounts else current_total
+    for item in result['advice']:
+        if item['type'] == 'save':
+            predicted_total *= (1 - item['ratio'])
+    return round(predicted_total)
@@ -1,14 +1,41 @@
 from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
 from datetime import datetime, timedelta
-from models import db, NguoiDung, DanhMuc, GiaoDich, TichLuy, VayNo, ThanhToan, LichSuTichLuy, PhuongPhap
-from sqlalchemy import func, extract
+from models import db, NguoiDung, DanhMuc, GiaoDich, TichLuy, VayNo, ThanhToan, LichSuTichLuy, PhuongPhap, VaiTro, ledger
+from response_cache import ResourceVersions, make_backend, shared_store
+from account_status import LOCKED, LockedUsers
+from roles import RoleCache
+from admin_queries import list_users
+from money import money_sum, to_money
+from ledger import NGUON_THANH_TOAN, NGUON_TICH_LUY, NGUON_VAY_NO, thanh_toan_delta, tich_luy_delta, vay_no_delta
+import os
 
 api = Blueprint('api', __name__, url_prefix='/api')
 
+# ETag cho các danh sách (RESOURCE_VERSION_STORE: đường dẫn file SQLite, 'memory' hoặc 'off');
+# mặc định file SQLite dùng chung cho mọi worker, cùng database với app_complete.py
+resource_versions = ResourceVersions(make_backend(
+    os.getenv('RESOURCE_VERSION_STORE') or shared_store(os.getenv('DATABASE_URL', 'sqlite:///expense.db'))
+))
+
+# User bị khóa, app_complete.check_user_status đọc tập này thay vì query DB mỗi request
+locked_users = LockedUsers(
+    lambda: [id for (id,) in db.session.query(NguoiDung.id).filter_by(trang_thai=LOCKED)],
+    refresh_interval=float(os.getenv('LOCK_REFRESH_SECONDS', 5))
+)
+
+# Vai trò lấy từ claim 'vai_tro' trong token + bảng vai_tro/tập admin cache trong bộ nhớ
+roles = RoleCache(
+    lambda: db.session.query(VaiTro.id, VaiTro.loai_vai_tro).all(),
+    lambda role_ids: [id for (id,) in db.session.query(NguoiDung.id).filter(NguoiDung.vai_tro_id.in_(role_ids))],
+    refresh_interval=float(os.getenv('ROLE_REFRESH_SECONDS', 60))
+)
+roles.watch(VaiTro, NguoiDung)
+
 # Vay nợ routes
 @api.route('/vay-no', methods=['GET'])
 @jwt_required()
+@resource_versions.conditional('vay-no')
 def get_vay_no():
     user_id = get_jwt_identity()
     vay_nos = VayNo.query.filter_by(nguoi_dung_id=user_id).all()
@@ -20,22 +47,30 @@ def get_vay_no():
 
 @api.route('/vay-no', methods=['POST'])
 @jwt_required()
+@resource_versions.bumps('vay-no')
 def create_vay_no():
     user_id = get_jwt_identity()
     data = request.get_json()
+    try:
+        so_tien = to_money(data['so_tien'])
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     vay_no = VayNo(
         nguoi_dung_id=user_id, ho_ten_vay_no=data['ho_ten_vay_no'],
-        loai=data['loai'], so_tien=data['so_tien'], lai_suat=data.get('lai_suat', 0),
+        loai=data['loai'], so_tien=so_tien, lai_suat=data.get('lai_suat', 0),
         han_tra=datetime.fromisoformat(data['han_tra']) if data.get('han_tra') else None,
         mo_ta=data.get('mo_ta', '')
     )
     db.session.add(vay_no)
+    db.session.flush()
+    ledger.post(vay_no.nguoi_dung_id, [(NGUON_VAY_NO, vay_no.id, vay_no_delta(vay_no.loai, so_tien), vay_no.ngay_vay_no)])
     db.session.commit()
     return jsonify({'message': 'Tạo thành công', 'id': vay_no.id}), 201
 
 # Tích lũy routes
 @api.route('/tich-luy', methods=['GET'])
 @jwt_required()
+@resource_versions.conditional('tich-luy')
 def get_tich_luy():
     user_id = get_jwt_identity()
     tich_luys = TichLuy.query.filter_by(nguoi_dung_id=user_id).all()
@@ -47,12 +82,17 @@ def get_tich_luy():
 
 @api.route('/tich-luy', methods=['POST'])
 @jwt_required()
+@resource_versions.bumps('tich-luy')
 def create_tich_luy():
     user_id = get_jwt_identity()
     data = request.get_json()
+    try:
+        so_tien_muc_tieu = to_money(data['so_tien_muc_tieu'])
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     tich_luy = TichLuy(
         nguoi_dung_id=user_id, ten_tich_luy=data['ten_tich_luy'],
-        so_tien_muc_tieu=data['so_tien_muc_tieu'],
+        so_tien_muc_tieu=so_tien_muc_tieu,
         ngay_ket_thuc=datetime.fromisoformat(data['ngay_ket_thuc']) if data.get('ngay_ket_thuc') else None
     )
     db.session.add(tich_luy)
@@ -70,16 +110,26 @@ def get_phuong_phap():
 
 @api.route('/thanh-toan', methods=['POST'])
 @jwt_required()
+@resource_versions.bumps('vay-no')
 def create_thanh_toan():
+    user_id = get_jwt_identity()
     data = request.get_json()
+    try:
+        so_tien = to_money(data['so_tien'])
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    vay_no = VayNo.query.filter_by(id=data['vay_no_id'], nguoi_dung_id=user_id).first()
+    if not vay_no:
+        return jsonify({'message': 'Khoản vay không tồn tại'}), 404
     thanh_toan = ThanhToan(
-        vay_no_id=data['vay_no_id'], so_tien=data['so_tien'], mo_ta=data.get('mo_ta', '')
+        vay_no_id=vay_no.id, so_tien=so_tien, mo_ta=data.get('mo_ta', '')
     )
-    vay_no = VayNo.query.get(data['vay_no_id'])
-    tong_da_tra = db.session.query(func.sum(ThanhToan.so_tien)).filter_by(vay_no_id=data['vay_no_id']).scalar() or 0
-    if tong_da_tra + data['so_tien'] >= vay_no.so_tien:
+    tong_da_tra = db.session.query(money_sum(ThanhToan.so_tien)).filter_by(vay_no_id=data['vay_no_id']).scalar()
+    if tong_da_tra + so_tien >= vay_no.so_tien:
         vay_no.trang_thai = 'Đã hoàn thành'
     db.session.add(thanh_toan)
+    db.session.flush()
+    ledger.post(vay_no.nguoi_dung_id, [(NGUON_THANH_TOAN, thanh_toan.id, thanh_toan_delta(vay_no.loai, so_tien), thanh_toan.created_at)])
     db.session.commit()
     return jsonify({'message': 'Thanh toán thành công'}), 201
 
@@ -89,9 +139,13 @@ def create_thanh_toan():
 def set_gioi_han():
     user_id = get_jwt_identity()
     data = request.get_json()
+    try:
+        gioi_han = to_money(data['gioi_han'])
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     danh_muc = DanhMuc.query.filter_by(id=data['danh_muc_id'], nguoi_dung_id=user_id).first()
     if danh_muc:
-        danh_muc.gioi_han = data['gioi_han']
+        danh_muc.gioi_han = gioi_han
         db.session.commit()
         return jsonify({'message': 'Đặt giới hạn thành công'}), 200
     return jsonify({'message': 'Không tìm thấy danh mục'}), 404
@@ -107,10 +161,10 @@ def check_limit(danh_muc_id):
     
     now = datetime.utcnow()
     month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    tong_chi = db.session.query(func.sum(GiaoDich.so_tien)).filter(
+    tong_chi = db.session.query(money_sum(GiaoDich.so_tien)).filter(
         GiaoDich.danh_muc_id == danh_muc_id,
         GiaoDich.ngay >= month_start
-    ).scalar() or 0
+    ).scalar()
     
     return jsonify({
         'vuot_muc': tong_chi > danh_muc.gioi_han,
@@ -121,6 +175,7 @@ def check_limit(danh_muc_id):
 # Lịch sử tích lũy
 @api.route('/lich-su-tich-luy/<int:tich_luy_id>', methods=['GET'])
 @jwt_required()
+@resource_versions.conditional('tich-luy')
 def get_lich_su_tich_luy(tich_luy_id):
     lich_su = LichSuTichLuy.query.filter_by(tich_luy_id=tich_luy_id).all()
     return jsonify([{
@@ -129,14 +184,25 @@ def get_lich_su_tich_luy(tich_luy_id):
 
 @api.route('/lich-su-tich-luy', methods=['POST'])
 @jwt_required()
+@resource_versions.bumps('tich-luy')
 def add_lich_su_tich_luy():
+    user_id = get_jwt_identity()
     data = request.get_json()
+    try:
+        so_tien = to_money(data['so_tien'])
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    tich_luy = TichLuy.query.filter_by(id=data['tich_luy_id'], nguoi_dung_id=user_id).first()
+    if not tich_luy:
+        return jsonify({'message': 'Không tìm thấy tích lũy'}), 404
     lich_su = LichSuTichLuy(
-        tich_luy_id=data['tich_luy_id'],
-        so_tien=data['so_tien'],
+        tich_luy_id=tich_luy.id,
+        so_tien=so_tien,
         mo_ta=data.get('mo_ta', '')
     )
     db.session.add(lich_su)
+    db.session.flush()
+    ledger.post(tich_luy.nguoi_dung_id, [(NGUON_TICH_LUY, lich_su.id, tich_luy_delta(so_tien), lich_su.ngay)])
     db.session.commit()
     return jsonify({'message': 'Thêm thành công'}), 201
 
@@ -148,23 +214,27 @@ def get_thong_ke_chi_tiet():
     thang = request.args.get('thang', datetime.utcnow().month, type=int)
     nam = request.args.get('nam', datetime.utcnow().year, type=int)
     
-    danh_mucs = DanhMuc.query.filter_by(nguoi_dung_id=user_id).all()
-    danh_muc_ids = [dm.id for dm in danh_mucs]
+    if not 1 <= thang <= 12:
+        return jsonify({'message': 'Tháng không hợp lệ'}), 400
+    
+    # Khoảng [đầu tháng, đầu tháng sau) thay cho extract() để dùng index (nguoi_dung_id, ngay)
+    start = datetime(nam, thang, 1)
+    end = datetime(nam + thang // 12, thang % 12 + 1, 1)
     
     giao_dichs = db.session.query(
         DanhMuc.ten_danh_muc,
         DanhMuc.loai_danh_muc,
-        func.sum(GiaoDich.so_tien).label('tong')
-    ).join(GiaoDich).filter(
-        GiaoDich.danh_muc_id.in_(danh_muc_ids),
-        extract('month', GiaoDich.ngay) == thang,
-        extract('year', GiaoDich.ngay) == nam
+        money_sum(GiaoDich.so_tien).label('tong')
+    ).select_from(GiaoDich).join(DanhMuc, DanhMuc.id == GiaoDich.danh_muc_id).filter(
+        GiaoDich.nguoi_dung_id == user_id,
+        GiaoDich.ngay >= start,
+        GiaoDich.ngay < end
     ).group_by(DanhMuc.id).all()
     
     return jsonify([{
         'ten_danh_muc': g[0],
         'loai': g[1],
-        'tong': float(g[2])
+        'tong': g[2]
     } for g in giao_dichs]), 200
 
 # Nhắc nhở thanh toán
@@ -194,39 +264,38 @@ def get_nhac_nho():
 @api.route('/admin/users', methods=['GET'])
 @jwt_required()
 def get_all_users():
-    user_id = get_jwt_identity()
-    user = NguoiDung.query.get(user_id)
-    if user.vai_tro_id != 1:
+    if not roles.is_admin(get_jwt_identity(), get_jwt()):
         return jsonify({'message': 'Không có quyền truy cập'}), 403
     
-    users = NguoiDung.query.all()
-    return jsonify([{
-        'id': u.id, 'ho_ten': u.ho_ten, 'email': u.email,
-        'so_du': u.so_du, 'trang_thai': u.trang_thai
-    } for u in users]), 200
+    try:
+        users, total = list_users(
+            db, NguoiDung, GiaoDich, request.args,
+            ('id', 'ho_ten', 'email', 'so_du', 'trang_thai', 'created_at')
+        )
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    return jsonify(users), 200, {'X-Total-Count': str(total)}
 
 @api.route('/admin/users/<int:user_id>/lock', methods=['PUT'])
 @jwt_required()
 def lock_user(user_id):
-    admin_id = get_jwt_identity()
-    admin = NguoiDung.query.get(admin_id)
-    if admin.vai_tro_id != 1:
+    if not roles.is_admin(get_jwt_identity(), get_jwt()):
         return jsonify({'message': 'Không có quyền'}), 403
     
     user = NguoiDung.query.get(user_id)
-    user.trang_thai = 'Bị khóa'
+    user.trang_thai = LOCKED
     db.session.commit()
+    locked_users.lock(user.id)
     return jsonify({'message': 'Đã khóa tài khoản'}), 200
 
 @api.route('/admin/users/<int:user_id>/unlock', methods=['PUT'])
 @jwt_required()
 def unlock_user(user_id):
-    admin_id = get_jwt_identity()
-    admin = NguoiDung.query.get(admin_id)
-    if admin.vai_tro_id != 1:
+    if not roles.is_admin(get_jwt_identity(), get_jwt()):
         return jsonify({'message': 'Không có quyền'}), 403
     
     user = NguoiDung.query.get(user_id)
     user.trang_thai = 'Hoạt động'
     db.session.commit()
+    locked_users.unlock(user.id)
     return jsonify({'message': 'Đã mở khóa'}), 200
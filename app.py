@@ -1,18 +1,37 @@
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, jsonify, request, send_from_directory, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from flask_cors import CORS
 from datetime import datetime, timedelta
-import bcrypt
 import os
+import io
+import csv
 import json
 from dotenv import load_dotenv
-from ai_module import full_financial_analysis
+from ai_module import apply_advice, monthly_aggregate_analysis
+from forecast import cached_models
+from job_queue import JobQueue, make_store
+from transaction_queries import list_transactions, parse_date_range
+from export_stream import EXPORT_FORMATS, stream_export
+from stats_queries import dashboard_summary
+from response_cache import ResourceVersions, ResponseCache, make_backend, shared_store
+from password_hasher import HasherBusy, PasswordHasher
+from admin_stats import day_key, record_transactions
+from receipt_search import ensure_search_index, search_receipts
+from receipt_items import add_items, parse_items, product_spending, serialize_item
+from receipt_parser import MAX_BATCH, ReceiptParser
+from receipt_batch import MAX_RECEIPTS, ensure_receipt_columns, parse_receipt_row
+from db_indexes import ensure_indexes
+from transaction_owner import ensure_owner_column, watch_owner
+from money import Money, money_sum, to_money
+from balance import balance_delta
+from ledger import NGUON_GIAO_DICH, NGUON_VAY_NO, Ledger, ledger_sources, vay_no_delta
+from sqlalchemy.exc import IntegrityError
 
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app, origins=['*'], allow_headers=['Content-Type', 'Authorization'])
+CORS(app, origins=['*'], allow_headers=['Content-Type', 'Authorization', 'If-None-Match'], expose_headers=['X-Next-Cursor', 'ETag', 'X-Total-Count'])
 # Database configuration with fallback
 database_url = os.getenv('DATABASE_URL')
 if database_url and database_url.startswith('postgres://'):
@@ -20,10 +39,52 @@ if database_url and database_url.startswith('postgres://'):
 app.config['SQLALCHEMY_DATABASE_URI'] = database_url or 'sqlite:///expense.db'
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-secret-key')
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=30)
+# Engine phân tích AI: 'aggregate' (bảng tong_hop_thang) hoặc 'numpy' (quét giao dịch dạng cột)
+app.config['AI_ENGINE'] = os.getenv('AI_ENGINE', 'aggregate')
 
 db = SQLAlchemy(app)
 jwt = JWTManager(app)
 
+# Giới hạn nhập hàng loạt (POST /api/giao-dich/bulk)
+BULK_MAX_ROWS = int(os.getenv('BULK_MAX_ROWS', 10000))
+BULK_CHUNK_SIZE = 1000
+
+# Hàng đợi phân tích AI chạy nền (AI_JOB_STORE: 'memory' hoặc đường dẫn file SQLite)
+ai_jobs = JobQueue(
+    store=make_store(os.getenv('AI_JOB_STORE', 'memory')),
+    max_workers=int(os.getenv('AI_JOB_WORKERS', 2)),
+    debounce=float(os.getenv('AI_JOB_DEBOUNCE', 2))
+)
+
+# Cache response GET theo user (RESPONSE_CACHE: đường dẫn file SQLite, 'memory' hoặc 'off');
+# mặc định file SQLite trong thư mục tạm để các worker gunicorn thấy cùng lần xóa cache
+response_cache = ResponseCache(
+    backend=make_backend(
+        os.getenv('RESPONSE_CACHE') or shared_store(app.config['SQLALCHEMY_DATABASE_URI']),
+        int(os.getenv('RESPONSE_CACHE_SIZE', 1024))
+    ),
+    ttl=float(os.getenv('RESPONSE_CACHE_TTL', 60))
+)
+
+# ETag cho các danh sách (RESOURCE_VERSION_STORE: đường dẫn file SQLite, 'memory' hoặc 'off');
+# mặc định dùng chung file với cache response: số phiên bản riêng từng worker sẽ trả 304 cho danh sách đã đổi
+resource_versions = ResourceVersions(make_backend(
+    os.getenv('RESOURCE_VERSION_STORE') or shared_store(app.config['SQLALCHEMY_DATABASE_URI'])
+))
+
+# Băm mật khẩu trong pool giới hạn (BCRYPT_ROUNDS: work factor, mặc định 12 như bcrypt.gensalt);
+# workers + queue = 4 < 8 thread gthread của mỗi worker gunicorn (Procfile) nên pool đầy thì trả 429
+password_hasher = PasswordHasher(
+    rounds=int(os.getenv('BCRYPT_ROUNDS', 12)),
+    max_workers=int(os.getenv('PASSWORD_HASH_WORKERS', 2)),
+    max_pending=int(os.getenv('PASSWORD_HASH_QUEUE', 2))
+)
+
+# Phân tích văn bản OCR hóa đơn, cache theo hash văn bản (RECEIPT_PARSE_CACHE giống RESPONSE_CACHE)
+receipt_parser = ReceiptParser(
+    make_backend(os.getenv('RECEIPT_PARSE_CACHE', 'memory'), int(os.getenv('RECEIPT_PARSE_CACHE_SIZE', 4096)))
+)
+
 # Models
 class VaiTro(db.Model):
     __tablename__ = 'vai_tro'
@@ -37,10 +98,17 @@ class NguoiDung(db.Model):
     ho_ten = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(100), unique=True, nullable=False)
     mat_khau = db.Column(db.String(255), nullable=False)
-    so_du = db.Column(db.Float, default=0)
+    so_du = db.Column(Money, default=0)
     trang_thai = db.Column(db.String(20), default='Hoạt động')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Tìm theo tiền tố email/họ tên và sắp xếp danh sách admin (admin_queries.list_users)
+    __table_args__ = (
+        db.Index('idx_nguoi_dung_email_lower', db.func.lower(email)),
+        db.Index('idx_nguoi_dung_ho_ten_lower', db.func.lower(ho_ten)),
+        db.Index('idx_nguoi_dung_so_du', so_du),
+        db.Index('idx_nguoi_dung_created_at', created_at),
+    )
 
 class DanhMuc(db.Model):
     __tablename__ = 'danh_muc'
@@ -50,25 +118,54 @@ class DanhMuc(db.Model):
     ten_danh_muc = db.Column(db.String(100), nullable=False)
     mo_ta = db.Column(db.String(255))
     icon = db.Column(db.String(50))
+    
+    # Danh mục của user theo loại (Chi tiêu / Thu nhập)
+    __table_args__ = (
+        db.Index('idx_danh_muc_nguoi_dung_loai', 'nguoi_dung_id', 'loai_danh_muc'),
+    )
 
 class GiaoDich(db.Model):
     __tablename__ = 'giao_dich'
     id = db.Column(db.Integer, primary_key=True)
     danh_muc_id = db.Column(db.Integer, db.ForeignKey('danh_muc.id'), nullable=False)
-    so_tien = db.Column(db.Float, nullable=False)
+    # Chủ của danh mục, chép sang để lọc theo user không cần join (transaction_owner.py).
+    # Cho phép NULL: giao dịch mồ côi (danh mục đã bị xóa) và dòng cũ chưa chạy migrate_giao_dich_owner.py
+    nguoi_dung_id = db.Column(db.Integer, db.ForeignKey('nguoi_dung.id'), nullable=True)
+    so_tien = db.Column(Money, nullable=False)
     mo_ta = db.Column(db.String(255))
     ngay = db.Column(db.DateTime, default=datetime.utcnow)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Giao dịch của user / của danh mục trong khoảng ngày, sắp theo ngày
+    __table_args__ = (
+        db.Index('idx_giao_dich_nguoi_dung_ngay', 'nguoi_dung_id', 'ngay'),
+        db.Index('idx_giao_dich_danh_muc_ngay', 'danh_muc_id', 'ngay'),
+    )
+
+class TongHopThang(db.Model):
+    # Tổng giao dịch theo (người dùng, danh mục, tháng), cập nhật khi thêm/xóa giao dịch
+    __tablename__ = 'tong_hop_thang'
+    __table_args__ = (db.UniqueConstraint('nguoi_dung_id', 'danh_muc_id', 'thang'),)
+    id = db.Column(db.Integer, primary_key=True)
+    nguoi_dung_id = db.Column(db.Integer, db.ForeignKey('nguoi_dung.id'), nullable=False)
+    danh_muc_id = db.Column(db.Integer, db.ForeignKey('danh_muc.id'), nullable=False)
+    thang = db.Column(db.String(7), nullable=False)  # 'YYYY-MM'
+    tong_tien = db.Column(Money, default=0)
+    so_giao_dich = db.Column(db.Integer, default=0)
 
 class TichLuy(db.Model):
     __tablename__ = 'tich_luy'
     id = db.Column(db.Integer, primary_key=True)
     nguoi_dung_id = db.Column(db.Integer, db.ForeignKey('nguoi_dung.id'), nullable=False)
     ten_tich_luy = db.Column(db.String(100), nullable=False)
-    so_tien_muc_tieu = db.Column(db.Float, nullable=False)
+    so_tien_muc_tieu = db.Column(Money, nullable=False)
     ngay_ket_thuc = db.Column(db.DateTime)
     trang_thai = db.Column(db.String(20), default='Đang thực hiện')
+    
+    __table_args__ = (
+        db.Index('idx_tich_luy_user', 'nguoi_dung_id'),
+    )
 
 class VayNo(db.Model):
     __tablename__ = 'vay_no'
@@ -77,13 +174,18 @@ class VayNo(db.Model):
     ho_ten_vay_no = db.Column(db.String(100), nullable=False)
     loai = db.Column(db.String(20), nullable=False)
     trang_thai = db.Column(db.String(20), default='Đang trả')
-    so_tien = db.Column(db.Float, nullable=False)
+    so_tien = db.Column(Money, nullable=False)
     lai_suat = db.Column(db.Float, default=0)
     ngay_vay_no = db.Column(db.DateTime, default=datetime.utcnow)
     han_tra = db.Column(db.DateTime)
     mo_ta = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Khoản vay của user theo trạng thái và hạn trả (nhắc nợ sắp đến hạn)
+    __table_args__ = (
+        db.Index('idx_vay_no_nguoi_dung_trang_thai_han_tra', 'nguoi_dung_id', 'trang_thai', 'han_tra'),
+    )
 
 class HoaDon(db.Model):
     __tablename__ = 'hoa_don'
@@ -91,12 +193,136 @@ class HoaDon(db.Model):
     nguoi_dung_id = db.Column(db.Integer, db.ForeignKey('nguoi_dung.id'), nullable=False)
     ten_cua_hang = db.Column(db.String(200), nullable=False)
     ngay_hoa_don = db.Column(db.DateTime, nullable=False)
-    tong_tien = db.Column(db.Float, nullable=False)
-    san_pham = db.Column(db.Text)  # JSON string
+    tong_tien = db.Column(Money, nullable=False)
+    san_pham = db.Column(db.Text)  # JSON gốc từ OCR (tìm kiếm, xuất file); đọc từng dòng ở san_pham_hoa_don
     van_ban_goc = db.Column(db.Text)
+    ma_noi_dung = db.Column(db.String(40))  # hash chống lưu trùng (receipt_batch.py)
+    giao_dich_id = db.Column(db.Integer, db.ForeignKey('giao_dich.id'))  # giao dịch chi tiêu tạo kèm
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_hoa_don_ma_noi_dung', 'nguoi_dung_id', 'ma_noi_dung', unique=True),
+        # Danh sách hóa đơn mới nhất trước (receipt_search.search_receipts)
+        db.Index('idx_hoa_don_nguoi_dung_created_at', 'nguoi_dung_id', 'created_at', 'id'),
+    )
+
+class SanPhamHoaDon(db.Model):
+    """Dòng sản phẩm của hóa đơn (receipt_items.py)"""
+    __tablename__ = 'san_pham_hoa_don'
+    id = db.Column(db.Integer, primary_key=True)
+    hoa_don_id = db.Column(db.Integer, db.ForeignKey('hoa_don.id', ondelete='CASCADE'), nullable=False, index=True)
+    ten_san_pham = db.Column(db.String(200), nullable=False)
+    so_luong = db.Column(db.Float, default=1)
+    don_gia = db.Column(Money, default=0)
+    danh_muc_id = db.Column(db.Integer, db.ForeignKey('danh_muc.id'))
+
+class ThongKeHeThong(db.Model):
+    """Thống kê hệ thống theo ngày cho admin (admin_stats.py)"""
+    __tablename__ = 'thong_ke_he_thong'
+    id = db.Column(db.Integer, primary_key=True)
+    ngay = db.Column(db.String(10), unique=True, nullable=False)  # 'YYYY-MM-DD'
+    so_giao_dich = db.Column(db.Integer, default=0)
+    tong_tien = db.Column(Money, default=0)
+    nguoi_dung_giao_dich = db.Column(db.Integer, default=0)  # số user có giao dịch trong ngày
+    tong_nguoi_dung = db.Column(db.Integer)
+    nguoi_dung_hoat_dong = db.Column(db.Integer)
+    tong_giao_dich = db.Column(db.Integer)
+    cap_nhat_luc = db.Column(db.DateTime, default=datetime.utcnow)
+
+class MoHinhDuBao(db.Model):
+    """Tham số dự báo đã fit của từng danh mục (forecast.py), fit lại khi có tháng mới kết thúc"""
+    __tablename__ = 'mo_hinh_du_bao'
+    id = db.Column(db.Integer, primary_key=True)
+    nguoi_dung_id = db.Column(db.Integer, db.ForeignKey('nguoi_dung.id'), nullable=False)
+    danh_muc = db.Column(db.String(100), nullable=False)  # tên danh mục đã chuẩn hóa như ai_module
+    thang_cuoi = db.Column(db.String(7), nullable=False)  # 'YYYY-MM' tháng cuối đã fit
+    so_thang = db.Column(db.Integer, nullable=False)
+    tong_lich_su = db.Column(Money, nullable=False)
+    tham_so = db.Column(db.Text, nullable=False)  # JSON
+    cap_nhat_luc = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('nguoi_dung_id', 'danh_muc', name='uq_mo_hinh_du_bao'),
+    )
+
+class SoCai(db.Model):
+    """Sổ cái số dư (ledger.py): mỗi thay đổi so_du một dòng, chỉ thêm không sửa/xóa"""
+    __tablename__ = 'so_cai'
+    id = db.Column(db.Integer, primary_key=True)
+    nguoi_dung_id = db.Column(db.Integer, db.ForeignKey('nguoi_dung.id'), nullable=False)
+    so_tien = db.Column(Money, nullable=False)  # dương: cộng vào số dư, âm: trừ
+    nguon = db.Column(db.String(20), nullable=False)  # giao_dich, vay_no, thanh_toan, lich_su_tich_luy, so_du_dau
+    nguon_id = db.Column(db.Integer)
+    ngay_ghi = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # ngày của nguồn
+    
+    __table_args__ = (
+        db.Index('idx_so_cai_nguoi_dung_ngay_ghi', 'nguoi_dung_id', 'ngay_ghi'),
+    )
+
+class SoDuThang(db.Model):
+    """Ảnh chụp số dư cuối tháng tính từ so_cai (ledger.py)"""
+    __tablename__ = 'so_du_thang'
+    id = db.Column(db.Integer, primary_key=True)
+    nguoi_dung_id = db.Column(db.Integer, db.ForeignKey('nguoi_dung.id'), nullable=False)
+    thang = db.Column(db.String(7), nullable=False)  # 'YYYY-MM'
+    so_du = db.Column(Money, nullable=False)
+    so_but_toan = db.Column(db.Integer, nullable=False)  # số dòng sổ cái trong tháng
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('nguoi_dung_id', 'thang', name='uq_so_du_thang'),
+    )
+
+# Giao dịch thêm mới / đổi danh mục tự lấy nguoi_dung_id theo danh mục
+watch_owner(GiaoDich, DanhMuc)
+
+# Sổ cái số dư: mọi chỗ đổi so_du ghi qua ledger.post
+ledger = Ledger(db, NguoiDung, SoCai, SoDuThang, ledger_sources(GiaoDich, DanhMuc, VayNo))
+
+def update_monthly_aggregate(user_id, danh_muc_id, ngay, so_tien, so_luong=1):
+    """Cộng dồn (hoặc trừ khi so_luong âm) vào tong_hop_thang, chưa commit"""
+    thang = (ngay or datetime.utcnow()).strftime('%Y-%m')
+    apply_monthly_aggregates(user_id, {(danh_muc_id, thang): (so_tien, so_luong)})
+
+def apply_monthly_aggregates(user_id, deltas):
+    """
+    Áp nhiều thay đổi một lúc: deltas = {(danh_muc_id, 'YYYY-MM'): (so_tien, so_luong)}
+    Các dòng tong_hop_thang liên quan được đọc bằng một query, chưa commit
+    """
+    if not deltas:
+        return
+    
+    existing = {
+        (th.danh_muc_id, th.thang): th
+        for th in TongHopThang.query.filter(
+            TongHopThang.nguoi_dung_id == user_id,
+            TongHopThang.danh_muc_id.in_({k[0] for k in deltas}),
+            TongHopThang.thang.in_({k[1] for k in deltas})
+        )
+    }
+    
+    for (danh_muc_id, thang), (so_tien, so_luong) in deltas.items():
+        tong_hop = existing.get((danh_muc_id, thang))
+        if not tong_hop:
+            tong_hop = TongHopThang(
+                nguoi_dung_id=user_id, danh_muc_id=danh_muc_id, thang=thang,
+                tong_tien=0, so_giao_dich=0
+            )
+            db.session.add(tong_hop)
+        
+        tong_hop.tong_tien += so_tien
+        tong_hop.so_giao_dich += so_luong
+        if tong_hop.so_giao_dich <= 0:
+            if tong_hop in db.session.new:
+                db.session.expunge(tong_hop)
+            else:
+                db.session.delete(tong_hop)
 
 # Auth Routes
+@app.errorhandler(HasherBusy)
+def hasher_busy(e):
+    return jsonify({'message': str(e)}), 429, {'Retry-After': '1'}
+
 @app.route('/api/auth/register', methods=['POST'])
 def register():
     try:
@@ -108,17 +334,21 @@ def register():
         if NguoiDung.query.filter_by(email=data['email']).first():
             return jsonify({'message': 'Email đã tồn tại'}), 400
         
-        hashed_password = bcrypt.hashpw(data['mat_khau'].encode('utf-8'), bcrypt.gensalt())
+        try:
+            so_du = to_money(data.get('so_du', 0))
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
         
         user = NguoiDung(
             ho_ten=data['ho_ten'],
             email=data['email'],
-            mat_khau=hashed_password.decode('utf-8'),
-            so_du=data.get('so_du', 0)
+            mat_khau=password_hasher.hash(data['mat_khau']),
+            so_du=so_du
         )
         
         db.session.add(user)
         db.session.flush()
+        ledger.open(user.id, so_du)
         
         # Tạo danh mục mặc định
         default_categories = [
@@ -142,6 +372,8 @@ def register():
         db.session.commit()
         
         return jsonify({'message': 'Đăng ký thành công', 'user_id': user.id}), 201
+    except HasherBusy as e:
+        return hasher_busy(e)
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': f'Lỗi server: {str(e)}'}), 500
@@ -155,21 +387,26 @@ def login():
     
     user = NguoiDung.query.filter_by(email=data['email']).first()
     
-    if not user or not bcrypt.checkpw(data['mat_khau'].encode('utf-8'), user.mat_khau.encode('utf-8')):
+    if not user or not password_hasher.verify(data['mat_khau'], user.mat_khau):
         return jsonify({'message': 'Email hoặc mật khẩu không đúng'}), 401
     
     if user.trang_thai == 'Bị khóa':
         return jsonify({'message': 'Tài khoản đã bị khóa'}), 403
     
+    # Đổi BCRYPT_ROUNDS thì hash cũ được băm lại lúc đăng nhập (lúc duy nhất có mật khẩu gốc)
+    if password_hasher.needs_rehash(user.mat_khau):
+        user.mat_khau = password_hasher.hash(data['mat_khau'])
+        db.session.commit()
+    
     access_token = create_access_token(identity=str(user.id))
     return jsonify({'access_token': access_token, 'user_id': user.id}), 200
 
 # Transaction Routes
 @app.route('/api/giao-dich', methods=['POST'])
 @jwt_required()
+@response_cache.invalidates
+@resource_versions.bumps('giao-dich')
 def create_transaction():
-    from ai_module import full_financial_analysis  # import AI module ở đây
-
     user_id = int(get_jwt_identity())
     data = request.get_json()
     
@@ -187,60 +424,197 @@ def create_transaction():
         if not danh_muc:
             return jsonify({'message': 'Danh mục không tồn tại'}), 404
     
+    try:
+        so_tien = to_money(data['so_tien'])
+    except KeyError:
+        return jsonify({'message': 'Thiếu so_tien'}), 400
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
     giao_dich = GiaoDich(
         danh_muc_id=danh_muc_id,
-        so_tien=data['so_tien'],
+        nguoi_dung_id=user_id,
+        so_tien=so_tien,
         mo_ta=data.get('mo_ta', ''),
         ngay=datetime.fromisoformat(data['ngay']) if 'ngay' in data else datetime.utcnow()
     )
     
-    user = NguoiDung.query.get(user_id)
-    if danh_muc.loai_danh_muc == 'Chi tiêu':
-        user.so_du -= data['so_tien']
-    else:
-        user.so_du += data['so_tien']
-    
     db.session.add(giao_dich)
+    db.session.flush()
+    # Số dư (qua sổ cái) cập nhật trước: khóa dòng user để tong_hop_thang đọc sau đó không đua với request khác
+    so_du_moi = ledger.post(user_id, [(NGUON_GIAO_DICH, giao_dich.id, balance_delta(danh_muc.loai_danh_muc, so_tien), giao_dich.ngay)])
+    update_monthly_aggregate(user_id, danh_muc_id, giao_dich.ngay, giao_dich.so_tien)
+    record_transactions(ThongKeHeThong, {day_key(giao_dich.ngay): (1, giao_dich.so_tien)})
     db.session.commit()
     
-    # --- Gọi AI dự đoán chi tiêu sau khi thêm giao dịch ---
-    danh_mucs = DanhMuc.query.filter_by(nguoi_dung_id=user_id).all()
-    danh_muc_ids = [dm.id for dm in danh_mucs]
-    giao_dichs = GiaoDich.query.filter(GiaoDich.danh_muc_id.in_(danh_muc_ids)).all()
-    transactions_history = [{
-        'amount': g.so_tien,
-        'category': g.danh_muc_id,
-        'date': g.ngay.isoformat(),
-        'description': g.mo_ta
-    } for g in giao_dichs]
-
-    ai_result = full_financial_analysis(transactions_history)
+    # --- Xếp job AI dự đoán chi tiêu, không chặn request ghi ---
+    ai_job_id = ai_jobs.submit(('analysis', user_id), user_id, run_ai_analysis, user_id)
     
     return jsonify({
         'message': 'Giao dịch thành công',
-        'so_du_moi': user.so_du,
-        'ai_prediction': ai_result
+        'so_du_moi': so_du_moi,
+        'ai_job_id': ai_job_id
+    }), 201
+
+def parse_bulk_row(row, loai_theo_id, mac_dinh, now):
+    """Kiểm tra một dòng nhập hàng loạt, trả về (danh_muc_id, so_tien, ngay) hoặc ValueError"""
+    if not isinstance(row, dict):
+        raise ValueError('Dòng phải là object')
+    
+    danh_muc_id = row.get('danh_muc_id')
+    if danh_muc_id:
+        try:
+            danh_muc_id = int(danh_muc_id)
+        except (TypeError, ValueError):
+            raise ValueError('danh_muc_id không hợp lệ')
+        if danh_muc_id not in loai_theo_id:
+            raise ValueError('Danh mục không tồn tại')
+    else:
+        loai_danh_muc = 'Chi tiêu' if (row.get('loai') or 'chi') == 'chi' else 'Thu nhập'
+        danh_muc_id = mac_dinh.get(loai_danh_muc)
+        if not danh_muc_id:
+            raise ValueError('Không tìm thấy danh mục mặc định')
+    
+    try:
+        so_tien = to_money(row['so_tien'])
+    except KeyError:
+        raise ValueError('Thiếu so_tien')
+    except ValueError:
+        raise ValueError('so_tien không hợp lệ')
+    
+    try:
+        ngay = datetime.fromisoformat(row['ngay']) if row.get('ngay') else now
+    except (TypeError, ValueError):
+        raise ValueError('ngay không hợp lệ')
+    
+    return danh_muc_id, so_tien, ngay
+
+def load_category_defaults(user_id):
+    """Một query cho toàn bộ danh mục của user: ({id: loai_danh_muc}, {loai_danh_muc: id mặc định})"""
+    danh_mucs = DanhMuc.query.filter_by(nguoi_dung_id=user_id).order_by(DanhMuc.id).all()
+    loai_theo_id = {dm.id: dm.loai_danh_muc for dm in danh_mucs}
+    mac_dinh = {}
+    for dm in danh_mucs:
+        mac_dinh.setdefault(dm.loai_danh_muc, dm.id)
+    return loai_theo_id, mac_dinh
+
+def apply_transaction_effects(user_id, mappings, loai_theo_id):
+    """
+    Sổ cái + số dư, tong_hop_thang, thong_ke_he_thong cho các giao dịch vừa thêm (mapping có 'id');
+    một câu UPDATE số dư, chưa commit. Trả về số dư mới
+    """
+    entries = []
+    deltas = {}
+    ngay_deltas = {}
+    for m in mappings:
+        entries.append((NGUON_GIAO_DICH, m['id'], balance_delta(loai_theo_id[m['danh_muc_id']], m['so_tien']), m['ngay']))
+        key = (m['danh_muc_id'], m['ngay'].strftime('%Y-%m'))
+        tong, dem = deltas.get(key, (0, 0))
+        deltas[key] = (tong + m['so_tien'], dem + 1)
+        dem_ngay, tong_ngay = ngay_deltas.get(day_key(m['ngay']), (0, 0))
+        ngay_deltas[day_key(m['ngay'])] = (dem_ngay + 1, tong_ngay + m['so_tien'])
+    
+    so_du = ledger.post(user_id, entries)
+    apply_monthly_aggregates(user_id, deltas)
+    record_transactions(ThongKeHeThong, ngay_deltas)
+    return so_du
+
+@app.route('/api/giao-dich/bulk', methods=['POST'])
+@jwt_required()
+@response_cache.invalidates
+@resource_versions.bumps('giao-dich')
+def create_transactions_bulk():
+    """
+    Nhập nhiều giao dịch một lần: body là mảng JSON, hoặc CSV (file 'file' hay body text/csv)
+    với các cột danh_muc_id, so_tien, mo_ta, ngay, loai (giống POST /api/giao-dich).
+    Dòng hợp lệ được ghi trong một transaction, dòng lỗi trả về kèm số thứ tự.
+    """
+    user_id = int(get_jwt_identity())
+    
+    try:
+        if 'file' in request.files:
+            rows = list(csv.DictReader(io.StringIO(request.files['file'].read().decode('utf-8-sig'))))
+        elif request.mimetype == 'text/csv':
+            rows = list(csv.DictReader(io.StringIO(request.get_data().decode('utf-8-sig'))))
+        else:
+            rows = request.get_json()
+    except Exception:
+        return jsonify({'message': 'Dữ liệu không đọc được'}), 400
+    
+    if not isinstance(rows, list) or not rows:
+        return jsonify({'message': 'Cần một danh sách giao dịch'}), 400
+    if len(rows) > BULK_MAX_ROWS:
+        return jsonify({'message': f'Tối đa {BULK_MAX_ROWS} giao dịch mỗi lần'}), 400
+    
+    loai_theo_id, mac_dinh = load_category_defaults(user_id)
+    
+    now = datetime.utcnow()
+    mappings, errors = [], []
+    
+    for i, row in enumerate(rows):
+        try:
+            danh_muc_id, so_tien, ngay = parse_bulk_row(row, loai_theo_id, mac_dinh, now)
+        except ValueError as e:
+            errors.append({'row': i, 'message': str(e)})
+            continue
+        
+        mappings.append({
+            'danh_muc_id': danh_muc_id,
+            'nguoi_dung_id': user_id,
+            'so_tien': so_tien,
+            'mo_ta': row.get('mo_ta') or '',
+            'ngay': ngay,
+            'created_at': now,
+            'updated_at': now
+        })
+    
+    if not mappings:
+        return jsonify({'message': 'Không có giao dịch hợp lệ', 'inserted': 0, 'errors': errors}), 400
+    
+    try:
+        for start in range(0, len(mappings), BULK_CHUNK_SIZE):
+            # return_defaults điền 'id' vào mapping để ghi sổ cái
+            db.session.bulk_insert_mappings(GiaoDich, mappings[start:start + BULK_CHUNK_SIZE], return_defaults=True)
+        so_du_moi = apply_transaction_effects(user_id, mappings, loai_theo_id)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': f'Lỗi nhập giao dịch: {str(e)}'}), 500
+    
+    ai_job_id = ai_jobs.submit(('analysis', user_id), user_id, run_ai_analysis, user_id)
+    
+    return jsonify({
+        'message': 'Nhập giao dịch thành công',
+        'inserted': len(mappings),
+        'errors': errors,
+        'so_du_moi': so_du_moi,
+        'ai_job_id': ai_job_id
     }), 201
 
 @app.route('/api/giao-dich', methods=['GET'])
 @jwt_required()
+@resource_versions.conditional('giao-dich')
 def get_transactions():
     user_id = int(get_jwt_identity())
-    danh_mucs = DanhMuc.query.filter_by(nguoi_dung_id=user_id).all()
-    danh_muc_ids = [dm.id for dm in danh_mucs]
     
-    giao_dichs = GiaoDich.query.filter(GiaoDich.danh_muc_id.in_(danh_muc_ids)).all()
+    try:
+        items, next_cursor = list_transactions(
+            GiaoDich, user_id, request.args,
+            default_fields=('id', 'so_tien', 'mo_ta', 'ngay')
+        )
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     
-    return jsonify([{
-        'id': g.id,
-        'so_tien': g.so_tien,
-        'mo_ta': g.mo_ta,
-        'ngay': g.ngay.isoformat()
-    } for g in giao_dichs]), 200
+    response = jsonify(items)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, 200
 
 # Category Routes
 @app.route('/api/danh-muc', methods=['POST'])
 @jwt_required()
+@response_cache.invalidates
+@resource_versions.bumps('danh-muc')
 def create_category():
     user_id = int(get_jwt_identity())
     data = request.get_json()
@@ -260,6 +634,8 @@ def create_category():
 
 @app.route('/api/danh-muc', methods=['GET'])
 @jwt_required()
+@resource_versions.conditional('danh-muc')
+@response_cache.cached('danh-muc')
 def get_categories():
     user_id = int(get_jwt_identity())
     danh_mucs = DanhMuc.query.filter_by(nguoi_dung_id=user_id).all()
@@ -274,6 +650,7 @@ def get_categories():
 # User Routes
 @app.route('/api/user/profile', methods=['GET'])
 @jwt_required()
+@response_cache.cached('user-profile')
 def get_profile():
     user_id = int(get_jwt_identity())
     user = NguoiDung.query.get(user_id)
@@ -288,6 +665,7 @@ def get_profile():
 
 @app.route('/api/user/profile', methods=['PUT'])
 @jwt_required()
+@response_cache.invalidates
 def update_profile():
     user_id = int(get_jwt_identity())
     data = request.get_json()
@@ -296,7 +674,7 @@ def update_profile():
     if 'ho_ten' in data:
         user.ho_ten = data['ho_ten']
     if 'mat_khau' in data:
-        user.mat_khau = bcrypt.hashpw(data['mat_khau'].encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        user.mat_khau = password_hasher.hash(data['mat_khau'])
     
     db.session.commit()
     return jsonify({'message': 'Cập nhật thành công'}), 200
@@ -304,95 +682,109 @@ def update_profile():
 # Statistics Routes
 @app.route('/api/thong-ke', methods=['GET'])
 @jwt_required()
+@response_cache.cached('thong-ke')
 def get_statistics():
     user_id = int(get_jwt_identity())
-    danh_mucs = DanhMuc.query.filter_by(nguoi_dung_id=user_id).all()
-    danh_muc_ids = [dm.id for dm in danh_mucs]
-    
     now = datetime.utcnow()
     month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     
-    chi_tieu = db.session.query(db.func.sum(GiaoDich.so_tien)).filter(
-        GiaoDich.danh_muc_id.in_(danh_muc_ids),
-        GiaoDich.ngay >= month_start,
-        DanhMuc.loai_danh_muc == 'Chi tiêu'
-    ).join(DanhMuc).scalar() or 0
-    
-    thu_nhap = db.session.query(db.func.sum(GiaoDich.so_tien)).filter(
-        GiaoDich.danh_muc_id.in_(danh_muc_ids),
-        GiaoDich.ngay >= month_start,
-        DanhMuc.loai_danh_muc == 'Thu nhập'
-    ).join(DanhMuc).scalar() or 0
+    # Một câu SQL cho cả số dư, chi tiêu và thu nhập tháng này
+    stats = dashboard_summary(db, NguoiDung, DanhMuc, GiaoDich, user_id, month_start)
+    if not stats:
+        return jsonify({'message': 'Người dùng không tồn tại'}), 404
     
     return jsonify({
-        'chi_tieu_thang_nay': chi_tieu,
-        'thu_nhap_thang_nay': thu_nhap,
-        'so_du': NguoiDung.query.get(user_id).so_du
+        'chi_tieu_thang_nay': stats.chi_tieu,
+        'thu_nhap_thang_nay': stats.thu_nhap,
+        'so_du': stats.so_du
     }), 200
 
-#AI
-@app.route('/api/ai/prediction', methods=['GET'])
+@app.route('/api/thong-ke/so-du', methods=['GET'])
 @jwt_required()
-def ai_prediction():
+def get_balance_history():
+    """Số dư theo sổ cái tại cuối ngày ?ngay=YYYY-MM-DD (hoặc thời điểm ISO) theo ngày giao dịch, không truyền thì hiện tại"""
     user_id = int(get_jwt_identity())
 
-    # 1. Lấy danh mục và giao dịch
-    danh_mucs = DanhMuc.query.filter_by(nguoi_dung_id=user_id).all()
-    danh_muc_ids = [dm.id for dm in danh_mucs]
-
-    giao_dichs = GiaoDich.query.filter(GiaoDich.danh_muc_id.in_(danh_muc_ids)).all()
-
-    transactions = []
-    for g in giao_dichs:
-        danh_muc = next((dm.ten_danh_muc for dm in danh_mucs if dm.id == g.danh_muc_id), 'khác')
-        transactions.append({
-            'danh_muc': danh_muc,
-            'so_tien': g.so_tien,
-            'mo_ta': g.mo_ta,
-            'ngay': g.ngay.isoformat() if g.ngay else None
-        })
-
-    # 2. Lấy phân tích hiện tại + gợi ý
-    result = full_financial_analysis(transactions)
+    try:
+        _, at = parse_date_range(None, request.args.get('ngay'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
 
-    advice = result.get('advice', [])
-    category_summary = result.get('category_summary', {})
-    current_total = result.get('monthly_prediction', {}).get('predicted_amount', 0)
+    return jsonify({
+        'ngay': request.args.get('ngay'),
+        'so_du': ledger.balance_at(user_id, at)
+    }), 200
 
-    # 3. Tạo dict category mới theo gợi ý
-    new_category_amounts = category_summary.copy()
+#AI
+def load_ai_aggregates(user_id):
+    """Đọc tổng theo tháng × danh mục từ tong_hop_thang thay vì quét toàn bộ giao dịch"""
+    return db.session.query(
+        TongHopThang.thang,
+        DanhMuc.ten_danh_muc,
+        TongHopThang.tong_tien
+    ).join(DanhMuc, DanhMuc.id == TongHopThang.danh_muc_id).filter(
+        # Lọc trên tong_hop_thang để dùng unique index (nguoi_dung_id, danh_muc_id, thang)
+        TongHopThang.nguoi_dung_id == user_id
+    ).all()
 
-    import re
+def analyze_user(user_id):
+    """Chạy phân tích AI cho user bằng engine chọn trong AI_ENGINE, mô hình dự báo lấy từ mo_hinh_du_bao"""
+    fitter = lambda month_cat: cached_models(db, MoHinhDuBao, user_id, month_cat)
+    if app.config['AI_ENGINE'] == 'numpy':
+        from ai_numpy import columnar_financial_analysis  # numpy chỉ cần khi bật engine này
 
-    for item in advice:
-        # Giảm category xuống target % tổng
-        match_cat = re.search(r"Chi tiêu '(.+?)' chiếm [\d\.]+% — nên giảm xuống (\d+)-(\d+)%", item)
-        if match_cat:
-            cat_name = match_cat.group(1)
-            low_pct = int(match_cat.group(2))
-            high_pct = int(match_cat.group(3))
-            target_ratio = (low_pct + high_pct) / 2 / 100  # trung bình
-            # cập nhật category mới = target_ratio * tổng hiện tại
-            new_category_amounts[cat_name] = target_ratio * current_total
+        danh_mucs = DanhMuc.query.filter_by(nguoi_dung_id=user_id).all()
+        rows = db.session.query(GiaoDich.ngay, GiaoDich.danh_muc_id, GiaoDich.so_tien).filter(
+            GiaoDich.nguoi_dung_id == user_id
+        ).all()
+        ngay, danh_muc_ids, so_tien = zip(*rows) if rows else ((), (), ())
+        return columnar_financial_analysis(
+            ngay, danh_muc_ids, so_tien, {dm.id: dm.ten_danh_muc for dm in danh_mucs}, fitter
+        )
+    
+    return monthly_aggregate_analysis(load_ai_aggregates(user_id), fitter)
 
-    # 4. Tính tổng dự đoán mới từ category mới
-    predicted_total = sum(new_category_amounts.values())
+def run_ai_analysis(user_id):
+    """Chạy trong worker của ai_jobs nên cần app context riêng"""
+    with app.app_context():
+        return analyze_user(user_id)
 
-    # 5. Áp dụng tiết kiệm nếu có
-    for item in advice:
-        match_save = re.search(r'Hãy dành (\d+)% để tiết kiệm', item)
-        if match_save:
-            save_ratio = int(match_save.group(1)) / 100
-            predicted_total *= (1 - save_ratio)
+@app.route('/api/ai/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_ai_job(job_id):
+    user_id = int(get_jwt_identity())
+    job = ai_jobs.get(job_id)
+    
+    if not job or job['owner_id'] != user_id:
+        return jsonify({'message': 'Không tìm thấy job'}), 404
+    
+    return jsonify({
+        'id': job['id'],
+        'status': job['status'],
+        'result': job['result'],
+        'error': job['error']
+    }), 200
 
-    # 6. Cập nhật dự đoán
-    result['monthly_prediction']['predicted_amount'] = round(predicted_total)
+@app.route('/api/ai/prediction', methods=['GET'])
+@jwt_required()
+@response_cache.cached('ai-prediction')
+def ai_prediction():
+    user_id = int(get_jwt_identity())
 
+    result = analyze_user(user_id)
+    if result.get('status') != 'ok':
+        return jsonify(result), 200
+    
+    # Dự đoán nếu làm theo gợi ý (gợi ý là object có sẵn số liệu, không phải đọc lại từ chuỗi)
+    result['monthly_prediction']['predicted_amount'] = apply_advice(result)
+    
     return jsonify(result), 200
 
 # Debt Routes
 @app.route('/api/vay-no', methods=['POST'])
 @jwt_required()
+@response_cache.invalidates
+@resource_versions.bumps('vay-no')
 def create_debt():
     try:
         user_id = int(get_jwt_identity())
@@ -401,17 +793,24 @@ def create_debt():
         if not data or not data.get('ho_ten_vay_no') or not data.get('so_tien'):
             return jsonify({'message': 'Thiếu thông tin bắt buộc'}), 400
         
+        try:
+            so_tien = to_money(data['so_tien'])
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
         vay_no = VayNo(
             nguoi_dung_id=user_id,
             ho_ten_vay_no=data['ho_ten_vay_no'],
             loai=data.get('loai', 'Cho Vay'),
-            so_tien=float(data['so_tien']),
+            so_tien=so_tien,
             lai_suat=float(data.get('lai_suat', 0)),
             han_tra=datetime.fromisoformat(data['han_tra']) if data.get('han_tra') else None,
             mo_ta=data.get('mo_ta', '')
         )
         
         db.session.add(vay_no)
+        db.session.flush()
+        ledger.post(user_id, [(NGUON_VAY_NO, vay_no.id, vay_no_delta(vay_no.loai, so_tien), vay_no.ngay_vay_no)])
         db.session.commit()
         
         return jsonify({'message': 'Tạo khoản vay nợ thành công', 'id': vay_no.id}), 201
@@ -421,6 +820,7 @@ def create_debt():
 
 @app.route('/api/vay-no', methods=['GET'])
 @jwt_required()
+@resource_versions.conditional('vay-no')
 def get_debts():
     try:
         user_id = int(get_jwt_identity())
@@ -430,7 +830,7 @@ def get_debts():
             'id': vn.id,
             'ho_ten_vay_no': vn.ho_ten_vay_no,
             'loai': vn.loai,
-            'so_tien': float(vn.so_tien),
+            'so_tien': vn.so_tien,
             'lai_suat': float(vn.lai_suat),
             'trang_thai': vn.trang_thai,
             'han_tra': vn.han_tra.isoformat() if vn.han_tra else None,
@@ -442,6 +842,8 @@ def get_debts():
 # Savings Routes
 @app.route('/api/tich-luy', methods=['POST'])
 @jwt_required()
+@response_cache.invalidates
+@resource_versions.bumps('tich-luy')
 def create_saving():
     try:
         user_id = int(get_jwt_identity())
@@ -450,10 +852,15 @@ def create_saving():
         if not data or not data.get('ten_tich_luy') or not data.get('so_tien_muc_tieu'):
             return jsonify({'message': 'Thiếu thông tin bắt buộc'}), 400
         
+        try:
+            so_tien_muc_tieu = to_money(data['so_tien_muc_tieu'])
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+        
         tich_luy = TichLuy(
             nguoi_dung_id=user_id,
             ten_tich_luy=data['ten_tich_luy'],
-            so_tien_muc_tieu=float(data['so_tien_muc_tieu']),
+            so_tien_muc_tieu=so_tien_muc_tieu,
             ngay_ket_thuc=datetime.fromisoformat(data['ngay_ket_thuc']) if data.get('ngay_ket_thuc') else None
         )
         
@@ -467,6 +874,7 @@ def create_saving():
 
 @app.route('/api/tich-luy', methods=['GET'])
 @jwt_required()
+@resource_versions.conditional('tich-luy')
 def get_savings():
     try:
         user_id = int(get_jwt_identity())
@@ -475,7 +883,7 @@ def get_savings():
         return jsonify([{
             'id': tl.id,
             'ten_tich_luy': tl.ten_tich_luy,
-            'so_tien_muc_tieu': float(tl.so_tien_muc_tieu),
+            'so_tien_muc_tieu': tl.so_tien_muc_tieu,
             'trang_thai': tl.trang_thai,
             'ngay_ket_thuc': tl.ngay_ket_thuc.isoformat() if tl.ngay_ket_thuc else None
         } for tl in tich_luys]), 200
@@ -485,6 +893,7 @@ def get_savings():
 # Detailed Statistics Route
 @app.route('/api/thong-ke-chi-tiet', methods=['GET'])
 @jwt_required()
+@response_cache.cached('thong-ke-chi-tiet')
 def get_detailed_statistics():
     try:
         user_id = int(get_jwt_identity())
@@ -498,20 +907,13 @@ def get_detailed_statistics():
         else:
             end_date = datetime(year, month + 1, 1)
         
-        # Lấy danh mục của user
-        danh_mucs = DanhMuc.query.filter_by(nguoi_dung_id=user_id).all()
-        if not danh_mucs:
-            return jsonify([]), 200
-            
-        danh_muc_ids = [dm.id for dm in danh_mucs]
-        
-        # Thống kê theo danh mục
+        # Thống kê theo danh mục: quét giao dịch của user trong tháng theo (nguoi_dung_id, ngay)
         stats = db.session.query(
             DanhMuc.ten_danh_muc,
             DanhMuc.loai_danh_muc,
-            db.func.sum(GiaoDich.so_tien).label('tong')
-        ).join(GiaoDich).filter(
-            DanhMuc.nguoi_dung_id == user_id,
+            money_sum(GiaoDich.so_tien).label('tong')
+        ).select_from(GiaoDich).join(DanhMuc, DanhMuc.id == GiaoDich.danh_muc_id).filter(
+            GiaoDich.nguoi_dung_id == user_id,
             GiaoDich.ngay >= start_date,
             GiaoDich.ngay < end_date
         ).group_by(DanhMuc.id, DanhMuc.ten_danh_muc, DanhMuc.loai_danh_muc).all()
@@ -519,7 +921,7 @@ def get_detailed_statistics():
         return jsonify([{
             'ten_danh_muc': stat.ten_danh_muc,
             'loai': stat.loai_danh_muc,
-            'tong': float(stat.tong or 0)
+            'tong': stat.tong
         } for stat in stats]), 200
     except Exception as e:
         return jsonify({'message': f'Lỗi server: {str(e)}'}), 500
@@ -527,63 +929,218 @@ def get_detailed_statistics():
 # Receipt OCR Routes
 @app.route('/api/hoa-don', methods=['POST'])
 @jwt_required()
+@response_cache.invalidates
+@resource_versions.bumps('hoa-don')
 def save_receipt():
+    user_id = int(get_jwt_identity())
+    data = request.get_json(silent=True)
+    
+    try:
+        values = parse_receipt_row(data, datetime.utcnow())
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    # Gửi lại cùng hóa đơn (bấm hai lần, mạng chập chờn) thì trả hóa đơn đã lưu
+    da_luu = HoaDon.query.filter_by(nguoi_dung_id=user_id, ma_noi_dung=values['ma_noi_dung']).first()
+    if da_luu:
+        return jsonify({'message': 'Hóa đơn đã được lưu trước đó', 'id': da_luu.id, 'duplicate': True}), 200
+    
     try:
-        user_id = int(get_jwt_identity())
-        data = request.get_json()
-        
-        if not data or not data.get('storeName') or not data.get('total'):
-            return jsonify({'message': 'Thiếu thông tin bắt buộc'}), 400
-        
         hoa_don = HoaDon(
             nguoi_dung_id=user_id,
-            ten_cua_hang=data['storeName'],
-            ngay_hoa_don=datetime.fromisoformat(data['date']) if data.get('date') else datetime.utcnow(),
-            tong_tien=float(data['total']),
             san_pham=json.dumps(data.get('items', []), ensure_ascii=False),
-            van_ban_goc=data.get('rawText', '')
+            **values
         )
         
         db.session.add(hoa_don)
+        db.session.flush()
+        danh_muc_ids = {id for (id,) in db.session.query(DanhMuc.id).filter_by(nguoi_dung_id=user_id)}
+        add_items(db, SanPhamHoaDon, hoa_don.id, parse_items(data.get('items')), danh_muc_ids)
         db.session.commit()
         
         return jsonify({'message': 'Lưu hóa đơn thành công', 'id': hoa_don.id}), 201
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'message': 'Hóa đơn đang được lưu, vui lòng thử lại'}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': f'Lỗi lưu hóa đơn: {str(e)}'}), 500
 
-@app.route('/api/hoa-don', methods=['GET'])
+@app.route('/api/hoa-don/batch', methods=['POST'])
 @jwt_required()
-def get_receipts():
+@response_cache.invalidates
+@resource_versions.bumps('hoa-don', 'giao-dich')
+def save_receipts_batch():
+    """
+    Lưu nhiều hóa đơn trong một transaction:
+      {"receipts": [{storeName, date, total, items, rawText, danh_muc_id}, ...], "tao_giao_dich": true}
+    tao_giao_dich: tạo kèm một giao dịch chi tiêu cho mỗi hóa đơn (danh_muc_id hoặc danh mục chi tiêu mặc định).
+    Hóa đơn trùng (cùng cửa hàng, ngày, tổng tiền, văn bản gốc) không lưu lại mà trả id cũ,
+    và không tạo giao dịch thứ hai nên gửi lại cả lô vẫn an toàn
+    """
+    user_id = int(get_jwt_identity())
+    data = request.get_json(silent=True) or {}
+    receipts = data.get('receipts')
+    
+    if not isinstance(receipts, list) or not receipts:
+        return jsonify({'message': 'Cần một danh sách hóa đơn'}), 400
+    if len(receipts) > MAX_RECEIPTS:
+        return jsonify({'message': f'Tối đa {MAX_RECEIPTS} hóa đơn mỗi lần'}), 400
+    tao_giao_dich = bool(data.get('tao_giao_dich'))
+    
+    loai_theo_id, mac_dinh = load_category_defaults(user_id)
+    now = datetime.utcnow()
+    parsed, errors = [], []
+    
+    for i, row in enumerate(receipts):
+        try:
+            values = parse_receipt_row(row, now)
+            danh_muc_id = None
+            if tao_giao_dich:
+                danh_muc_id, _, _ = parse_bulk_row(
+                    {'danh_muc_id': row.get('danh_muc_id'), 'so_tien': values['tong_tien'], 'loai': 'chi'},
+                    loai_theo_id, mac_dinh, now
+                )
+        except ValueError as e:
+            errors.append({'row': i, 'message': str(e)})
+            continue
+        parsed.append((i, row, values, danh_muc_id))
+    
+    if not parsed:
+        return jsonify({'message': 'Không có hóa đơn hợp lệ', 'inserted': 0, 'errors': errors}), 400
+    
+    # Hóa đơn đã lưu trước đó: một query theo hash; trùng ngay trong lô cũng gộp làm một
+    hoa_don_theo_hash = {
+        hd.ma_noi_dung: hd for hd in HoaDon.query.filter(
+            HoaDon.nguoi_dung_id == user_id,
+            HoaDon.ma_noi_dung.in_({values['ma_noi_dung'] for _, _, values, _ in parsed})
+        )
+    }
+    
     try:
-        user_id = int(get_jwt_identity())
-        search = request.args.get('search', '').lower()
-        
-        query = HoaDon.query.filter_by(nguoi_dung_id=user_id)
-        if search:
-            query = query.filter(
-                db.or_(
-                    HoaDon.ten_cua_hang.ilike(f'%{search}%'),
-                    db.cast(HoaDon.ngay_hoa_don, db.String).ilike(f'%{search}%'),
-                    db.cast(HoaDon.tong_tien, db.String).ilike(f'%{search}%')
+        rows, moi, can_giao_dich = [], [], {}
+        for i, row, values, danh_muc_id in parsed:
+            hoa_don = hoa_don_theo_hash.get(values['ma_noi_dung'])
+            duplicate = hoa_don is not None
+            if not hoa_don:
+                hoa_don = HoaDon(
+                    nguoi_dung_id=user_id,
+                    san_pham=json.dumps(row.get('items') or [], ensure_ascii=False),
+                    **values
                 )
-            )
+                db.session.add(hoa_don)
+                hoa_don_theo_hash[values['ma_noi_dung']] = hoa_don
+                moi.append((hoa_don, row))
+            if tao_giao_dich and hoa_don.giao_dich_id is None:
+                can_giao_dich.setdefault(values['ma_noi_dung'], (hoa_don, danh_muc_id))
+            rows.append((i, hoa_don, duplicate))
         
-        hoa_dons = query.order_by(HoaDon.created_at.desc()).all()
+        db.session.flush()
+        for hoa_don, row in moi:
+            add_items(db, SanPhamHoaDon, hoa_don.id, parse_items(row.get('items')), set(loai_theo_id))
         
-        return jsonify([{
-            'id': hd.id,
-            'storeName': hd.ten_cua_hang,
-            'date': hd.ngay_hoa_don.isoformat(),
-            'total': float(hd.tong_tien),
-            'items': json.loads(hd.san_pham) if hd.san_pham else [],
-            'rawText': hd.van_ban_goc or ''
-        } for hd in hoa_dons]), 200
+        mappings = []
+        if can_giao_dich:
+            giao_dichs = []
+            for hoa_don, danh_muc_id in can_giao_dich.values():
+                giao_dich = GiaoDich(
+                    danh_muc_id=danh_muc_id,
+                    nguoi_dung_id=user_id,
+                    so_tien=hoa_don.tong_tien,
+                    mo_ta=f"Hóa đơn từ {hoa_don.ten_cua_hang} - {hoa_don.ngay_hoa_don.strftime('%Y-%m-%d')}",
+                    ngay=hoa_don.ngay_hoa_don
+                )
+                giao_dichs.append((hoa_don, giao_dich))
+            db.session.add_all([gd for _, gd in giao_dichs])
+            db.session.flush()
+            for hoa_don, giao_dich in giao_dichs:
+                hoa_don.giao_dich_id = giao_dich.id
+                mappings.append({'id': giao_dich.id, 'danh_muc_id': giao_dich.danh_muc_id,
+                                 'so_tien': giao_dich.so_tien, 'ngay': giao_dich.ngay})
+            apply_transaction_effects(user_id, mappings, loai_theo_id)
+        
+        db.session.commit()
+    except IntegrityError:
+        # Cùng hóa đơn đang được lưu bởi request khác; gửi lại sẽ nhận bản đã lưu
+        db.session.rollback()
+        return jsonify({'message': 'Hóa đơn đang được lưu, vui lòng thử lại'}), 409
     except Exception as e:
-        return jsonify({'message': f'Lỗi tải hóa đơn: {str(e)}'}), 500
+        db.session.rollback()
+        return jsonify({'message': f'Lỗi lưu hóa đơn: {str(e)}'}), 500
+    
+    ai_job_id = ai_jobs.submit(('analysis', user_id), user_id, run_ai_analysis, user_id) if mappings else None
+    
+    return jsonify({
+        'message': 'Lưu hóa đơn thành công',
+        'inserted': len(moi),
+        'duplicates': sum(1 for _, _, duplicate in rows if duplicate),
+        'transactions': len(mappings),
+        'results': [{'row': i, 'id': hd.id, 'duplicate': duplicate, 'giao_dich_id': hd.giao_dich_id}
+                    for i, hd, duplicate in rows],
+        'errors': errors,
+        'ai_job_id': ai_job_id
+    }), 201 if moi or mappings else 200
+
+@app.route('/api/hoa-don/phan-tich', methods=['POST'])
+@jwt_required()
+def parse_receipt_text():
+    """{"text": "..."} -> một kết quả; {"texts": ["...", ...]} -> mảng kết quả cùng thứ tự"""
+    data = request.get_json(silent=True) or {}
+    
+    if isinstance(data.get('texts'), list):
+        texts = data['texts']
+        if len(texts) > MAX_BATCH:
+            return jsonify({'message': f'Tối đa {MAX_BATCH} văn bản mỗi lần'}), 400
+        if not all(isinstance(t, str) for t in texts):
+            return jsonify({'message': 'texts phải là mảng chuỗi'}), 400
+        return jsonify(receipt_parser.parse_many(texts)), 200
+    
+    if not isinstance(data.get('text'), str) or not data['text'].strip():
+        return jsonify({'message': 'Thiếu văn bản hóa đơn'}), 400
+    return jsonify(receipt_parser.parse(data['text'])), 200
+
+@app.route('/api/hoa-don', methods=['GET'])
+@jwt_required()
+@resource_versions.conditional('hoa-don')
+def get_receipts():
+    user_id = int(get_jwt_identity())
+    
+    try:
+        hoa_dons, total = search_receipts(db, HoaDon, user_id, request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    # Danh sách không kèm văn bản gốc và sản phẩm, xem chi tiết ở /api/hoa-don/<id>
+    return jsonify([{
+        'id': hd.id,
+        'storeName': hd.ten_cua_hang,
+        'date': hd.ngay_hoa_don.isoformat(),
+        'total': hd.tong_tien
+    } for hd in hoa_dons]), 200, {'X-Total-Count': str(total)}
+
+@app.route('/api/hoa-don/<int:receipt_id>', methods=['GET'])
+@jwt_required()
+def get_receipt(receipt_id):
+    user_id = int(get_jwt_identity())
+    hd = HoaDon.query.filter_by(id=receipt_id, nguoi_dung_id=user_id).first()
+    
+    if not hd:
+        return jsonify({'message': 'Không tìm thấy hóa đơn'}), 404
+    
+    items = SanPhamHoaDon.query.filter_by(hoa_don_id=hd.id).order_by(SanPhamHoaDon.id).all()
+    return jsonify({
+        'id': hd.id,
+        'storeName': hd.ten_cua_hang,
+        'date': hd.ngay_hoa_don.isoformat(),
+        'total': hd.tong_tien,
+        'items': [serialize_item(item) for item in items],
+        'rawText': hd.van_ban_goc or ''
+    }), 200
 
 @app.route('/api/hoa-don/<int:receipt_id>', methods=['DELETE'])
 @jwt_required()
+@response_cache.invalidates
+@resource_versions.bumps('hoa-don')
 def delete_receipt(receipt_id):
     try:
         user_id = int(get_jwt_identity())
@@ -592,6 +1149,7 @@ def delete_receipt(receipt_id):
         if not hoa_don:
             return jsonify({'message': 'Không tìm thấy hóa đơn'}), 404
         
+        SanPhamHoaDon.query.filter_by(hoa_don_id=hoa_don.id).delete(synchronize_session=False)
         db.session.delete(hoa_don)
         db.session.commit()
         
@@ -600,6 +1158,89 @@ def delete_receipt(receipt_id):
         db.session.rollback()
         return jsonify({'message': f'Lỗi xóa hóa đơn: {str(e)}'}), 500
 
+# Chi tiêu theo sản phẩm từ các dòng hóa đơn
+@app.route('/api/thong-ke/san-pham', methods=['GET'])
+@jwt_required()
+@response_cache.cached('thong-ke-san-pham')
+def get_product_statistics():
+    user_id = int(get_jwt_identity())
+    
+    try:
+        return jsonify(product_spending(db, HoaDon, SanPhamHoaDon, user_id, request.args)), 200
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+# Export Routes (stream NDJSON/CSV, không dựng cả danh sách trong bộ nhớ)
+def export_response(rows, fields, fmt, filename, to_dict=None):
+    return Response(
+        stream_with_context(stream_export(rows, fields, fmt, to_dict)),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename={filename}.{fmt}'}
+    )
+
+@app.route('/api/export/giao-dich', methods=['GET'])
+@jwt_required()
+def export_transactions():
+    user_id = int(get_jwt_identity())
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'message': 'format phải là ndjson hoặc csv'}), 400
+    
+    try:
+        start, end = parse_date_range(request.args.get('tu_ngay'), request.args.get('den_ngay'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    query = db.session.query(
+        GiaoDich.id,
+        GiaoDich.ngay,
+        GiaoDich.so_tien,
+        GiaoDich.mo_ta,
+        GiaoDich.danh_muc_id,
+        DanhMuc.ten_danh_muc,
+        DanhMuc.loai_danh_muc
+    ).join(DanhMuc, DanhMuc.id == GiaoDich.danh_muc_id).filter(GiaoDich.nguoi_dung_id == user_id)
+    if start:
+        query = query.filter(GiaoDich.ngay >= start)
+    if end:
+        query = query.filter(GiaoDich.ngay < end)
+    
+    # yield_per dùng server-side cursor (stream_results) nên chỉ giữ một lô dòng trong bộ nhớ
+    rows = query.order_by(GiaoDich.ngay, GiaoDich.id).yield_per(1000)
+    fields = ['id', 'ngay', 'so_tien', 'mo_ta', 'danh_muc_id', 'ten_danh_muc', 'loai_danh_muc']
+    return export_response(rows, fields, fmt, 'giao_dich')
+
+@app.route('/api/export/hoa-don', methods=['GET'])
+@jwt_required()
+def export_receipts():
+    user_id = int(get_jwt_identity())
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'message': 'format phải là ndjson hoặc csv'}), 400
+    
+    rows = db.session.query(
+        HoaDon.id,
+        HoaDon.ten_cua_hang,
+        HoaDon.ngay_hoa_don,
+        HoaDon.tong_tien,
+        HoaDon.san_pham,
+        HoaDon.van_ban_goc,
+        HoaDon.created_at
+    ).filter(HoaDon.nguoi_dung_id == user_id).order_by(HoaDon.id).yield_per(1000)
+    
+    def decode_items(item):
+        # NDJSON trả san_pham dạng mảng, CSV giữ nguyên chuỗi JSON
+        item['san_pham'] = json.loads(item['san_pham']) if item['san_pham'] else []
+        return item
+    
+    fields = ['id', 'ten_cua_hang', 'ngay_hoa_don', 'tong_tien', 'san_pham', 'van_ban_goc', 'created_at']
+    return export_response(rows, fields, fmt, 'hoa_don', decode_items if fmt == 'ndjson' else None)
+
+@app.route('/api/cache/stats', methods=['GET'])
+@jwt_required()
+def get_cache_stats():
+    return jsonify(response_cache.stats()), 200
+
 # Static file routes
 @app.route('/')
 def index():
@@ -612,6 +1253,10 @@ def static_files(filename):
 # Tạo bảng khi khởi động
 with app.app_context():
     db.create_all()
+    ensure_receipt_columns(db)
+    ensure_owner_column(db)
+    ensure_indexes(db)
+    ensure_search_index(db)
 
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
@@ -1,16 +1,21 @@
 from flask import Flask, jsonify, request
-from flask_jwt_extended import JWTManager, jwt_required, get_jwt_identity, create_access_token
+from flask_jwt_extended import JWTManager, jwt_required, get_jwt, get_jwt_identity, create_access_token
 from flask_cors import CORS
-from datetime import timedelta
+from datetime import datetime, timedelta
 import bcrypt
 import os
 from dotenv import load_dotenv
-from models import db, NguoiDung, DanhMuc, GiaoDich, VaiTro
+from models import db, NguoiDung, GiaoDich, VaiTro, ThongKeHeThong
+from roles import ADMIN, RoleCache
+from admin_queries import list_users
+from admin_stats import PeriodicTask, day_key, refresh_snapshot, serialize_snapshot
+from db_indexes import ensure_indexes
+from transaction_owner import ensure_owner_column
 
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['X-Total-Count'])
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///./instance/expense.db')
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-secret-key')
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=30)
@@ -18,6 +23,22 @@ app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=30)
 db.init_app(app)
 jwt = JWTManager(app)
 
+# Vai trò lấy từ claim 'vai_tro' trong token + bảng vai_tro/tập admin cache trong bộ nhớ
+roles = RoleCache(
+    lambda: db.session.query(VaiTro.id, VaiTro.loai_vai_tro).all(),
+    lambda role_ids: [id for (id,) in db.session.query(NguoiDung.id).filter(NguoiDung.vai_tro_id.in_(role_ids))],
+    refresh_interval=float(os.getenv('ROLE_REFRESH_SECONDS', 60))
+)
+roles.watch(VaiTro, NguoiDung)
+
+# Làm mới thong_ke_he_thong định kỳ (ADMIN_STATS_REFRESH_SECONDS, 0 = tắt)
+def refresh_admin_stats():
+    with app.app_context():
+        refresh_snapshot(db, NguoiDung, GiaoDich, ThongKeHeThong)
+
+stats_scheduler = PeriodicTask(float(os.getenv('ADMIN_STATS_REFRESH_SECONDS', 300)), refresh_admin_stats)
+stats_scheduler.start()
+
 # Admin Login
 @app.route('/api/auth/login', methods=['POST'])
 def admin_login():
@@ -32,43 +53,36 @@ def admin_login():
         return jsonify({'message': 'Email hoặc mật khẩu không đúng'}), 401
     
     # Kiểm tra quyền admin
-    if user.vai_tro_id != 1:
+    if roles.role_name(user.vai_tro_id) != ADMIN:
         return jsonify({'message': 'Bạn không có quyền truy cập'}), 403
     
     if user.trang_thai == 'Bị khóa':
         return jsonify({'message': 'Tài khoản đã bị khóa'}), 403
     
-    access_token = create_access_token(identity=str(user.id))
+    access_token = create_access_token(identity=str(user.id), additional_claims=roles.claims_for(user))
     return jsonify({'access_token': access_token, 'user_id': user.id}), 200
 
 # Get all users
 @app.route('/api/admin/users', methods=['GET'])
 @jwt_required()
 def get_all_users():
-    admin_id = int(get_jwt_identity())
-    admin = NguoiDung.query.get(admin_id)
-    
-    if admin.vai_tro_id != 1:
+    if not roles.is_admin(get_jwt_identity(), get_jwt()):
         return jsonify({'message': 'Không có quyền'}), 403
     
-    users = NguoiDung.query.all()
-    return jsonify([{
-        'id': u.id,
-        'ho_ten': u.ho_ten,
-        'email': u.email,
-        'so_du': u.so_du,
-        'trang_thai': u.trang_thai,
-        'vai_tro_id': u.vai_tro_id
-    } for u in users]), 200
+    try:
+        users, total = list_users(
+            db, NguoiDung, GiaoDich, request.args,
+            ('id', 'ho_ten', 'email', 'so_du', 'trang_thai', 'vai_tro_id', 'created_at')
+        )
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    return jsonify(users), 200, {'X-Total-Count': str(total)}
 
 # Lock user
 @app.route('/api/admin/users/<int:user_id>/lock', methods=['PUT'])
 @jwt_required()
 def lock_user(user_id):
-    admin_id = int(get_jwt_identity())
-    admin = NguoiDung.query.get(admin_id)
-    
-    if admin.vai_tro_id != 1:
+    if not roles.is_admin(get_jwt_identity(), get_jwt()):
         return jsonify({'message': 'Không có quyền'}), 403
     
     user = NguoiDung.query.get(user_id)
@@ -83,10 +97,7 @@ def lock_user(user_id):
 @app.route('/api/admin/users/<int:user_id>/unlock', methods=['PUT'])
 @jwt_required()
 def unlock_user(user_id):
-    admin_id = int(get_jwt_identity())
-    admin = NguoiDung.query.get(admin_id)
-    
-    if admin.vai_tro_id != 1:
+    if not roles.is_admin(get_jwt_identity(), get_jwt()):
         return jsonify({'message': 'Không có quyền'}), 403
     
     user = NguoiDung.query.get(user_id)
@@ -101,10 +112,7 @@ def unlock_user(user_id):
 @app.route('/api/admin/users/<int:user_id>', methods=['DELETE'])
 @jwt_required()
 def delete_user(user_id):
-    admin_id = int(get_jwt_identity())
-    admin = NguoiDung.query.get(admin_id)
-    
-    if admin.vai_tro_id != 1:
+    if not roles.is_admin(get_jwt_identity(), get_jwt()):
         return jsonify({'message': 'Không có quyền'}), 403
     
     user = NguoiDung.query.get(user_id)
@@ -119,24 +127,39 @@ def delete_user(user_id):
 @app.route('/api/admin/stats', methods=['GET'])
 @jwt_required()
 def get_admin_stats():
-    admin_id = int(get_jwt_identity())
-    admin = NguoiDung.query.get(admin_id)
-    
-    if admin.vai_tro_id != 1:
+    if not roles.is_admin(get_jwt_identity(), get_jwt()):
         return jsonify({'message': 'Không có quyền'}), 403
     
-    total_users = NguoiDung.query.count()
-    active_users = NguoiDung.query.filter_by(trang_thai='Hoạt động').count()
-    total_transactions = GiaoDich.query.count()
+    # Đọc một dòng snapshot của hôm nay; chưa có (ngày mới, lần chạy đầu) thì tính ngay
+    snapshot = ThongKeHeThong.query.filter_by(ngay=day_key(datetime.utcnow())).first()
+    if not snapshot or snapshot.tong_nguoi_dung is None:
+        snapshot = refresh_snapshot(db, NguoiDung, GiaoDich, ThongKeHeThong)
     
     return jsonify({
-        'total_users': total_users,
-        'active_users': active_users,
-        'total_transactions': total_transactions
+        'total_users': snapshot.tong_nguoi_dung,
+        'active_users': snapshot.nguoi_dung_hoat_dong,
+        'total_transactions': snapshot.tong_giao_dich,
+        'daily_active_users': snapshot.nguoi_dung_giao_dich,
+        'transactions_today': snapshot.so_giao_dich,
+        'volume_today': snapshot.tong_tien,
+        'updated_at': snapshot.cap_nhat_luc.isoformat() if snapshot.cap_nhat_luc else None
     }), 200
 
+# Lịch sử thống kê theo ngày (xu hướng)
+@app.route('/api/admin/stats/history', methods=['GET'])
+@jwt_required()
+def get_admin_stats_history():
+    if not roles.is_admin(get_jwt_identity(), get_jwt()):
+        return jsonify({'message': 'Không có quyền'}), 403
+    
+    days = max(1, min(request.args.get('days', 30, type=int), 366))
+    rows = ThongKeHeThong.query.order_by(ThongKeHeThong.ngay.desc()).limit(days).all()
+    return jsonify([serialize_snapshot(r) for r in reversed(rows)]), 200
+
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        ensure_owner_column(db)
+        ensure_indexes(db)
     print("🔐 Admin Backend chạy trên http://localhost:5111")
     app.run(debug=True, port=5111)
@@ -1,17 +1,19 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, verify_jwt_in_request, get_jwt_identity
-from models import db, NguoiDung
-from api_routes import api
+from flask_jwt_extended import JWTManager, verify_jwt_in_request, get_jwt, get_jwt_identity
+from models import db
+from api_routes import api, locked_users, roles
 from routes import auth_bp, transaction_bp, category_bp, user_bp, stats_bp
 import os
 from dotenv import load_dotenv
 from functools import wraps
+from db_indexes import ensure_indexes
+from transaction_owner import ensure_owner_column
 
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app, resources={r"/api/*": {"origins": "*", "methods": ["GET", "POST", "PUT", "DELETE"]}})
+CORS(app, resources={r"/api/*": {"origins": "*", "methods": ["GET", "POST", "PUT", "DELETE"], "expose_headers": ["X-Next-Cursor", "ETag", "X-Total-Count"]}})
 
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///expense.db')
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-secret-key')
@@ -20,7 +22,8 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
 jwt = JWTManager(app)
 
-# Middleware kiểm tra tài khoản bị khóa
+# Middleware kiểm tra tài khoản bị khóa: chỉ tra tập locked_users trong bộ nhớ, không query DB
+# (token không mang được trạng thái khóa: đăng nhập từ chối tài khoản bị khóa nên không có token nào như vậy)
 @app.before_request
 def check_user_status():
     if request.endpoint and 'auth' not in request.endpoint:
@@ -28,8 +31,7 @@ def check_user_status():
             verify_jwt_in_request(optional=True)
             user_id = get_jwt_identity()
             if user_id:
-                user = NguoiDung.query.get(user_id)
-                if user and user.trang_thai == 'Bị khóa':
+                if locked_users.is_locked(user_id):
                     return jsonify({'message': 'Tài khoản đã bị khóa'}), 403
         except:
             pass
@@ -39,9 +41,7 @@ def admin_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
         verify_jwt_in_request()
-        user_id = get_jwt_identity()
-        user = NguoiDung.query.get(user_id)
-        if not user or user.vai_tro_id != 1:
+        if not roles.is_admin(get_jwt_identity(), get_jwt()):
             return jsonify({'message': 'Không có quyền truy cập'}), 403
         return f(*args, **kwargs)
     return decorated
@@ -64,4 +64,6 @@ def server_error(e):
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        ensure_owner_column(db)
+        ensure_indexes(db)
     app.run(debug=True, port=5000)
@@ -6,11 +6,19 @@ from datetime import datetime, timedelta
 import bcrypt
 import os
 from dotenv import load_dotenv
+from transaction_queries import list_transactions, parse_date_range
+from stats_queries import dashboard_summary, expense_by_category
+from db_indexes import ensure_indexes
+from transaction_owner import ensure_owner_column, watch_owner
+from money import Money, money_sum, to_money
+from balance import balance_delta
+from ledger import (NGUON_GIAO_DICH, NGUON_THANH_TOAN, NGUON_TICH_LUY, NGUON_VAY_NO, Ledger, ledger_sources,
+                    thanh_toan_delta, tich_luy_delta, vay_no_delta)
 
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['X-Next-Cursor'])
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///expense.db')
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-secret-key')
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=30)
@@ -32,7 +40,7 @@ class NguoiDung(db.Model):
     ho_ten = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(100), unique=True, nullable=False)
     mat_khau = db.Column(db.String(255), nullable=False)
-    so_du = db.Column(db.Float, default=0)
+    so_du = db.Column(Money, default=0)
     trang_thai = db.Column(db.String(20), default='Hoạt động')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -45,46 +53,84 @@ class DanhMuc(db.Model):
     ten_danh_muc = db.Column(db.String(100), nullable=False)
     mo_ta = db.Column(db.String(255))
     icon = db.Column(db.String(50))
+    
+    # Danh mục của user theo loại (Chi tiêu / Thu nhập)
+    __table_args__ = (
+        db.Index('idx_danh_muc_nguoi_dung_loai', 'nguoi_dung_id', 'loai_danh_muc'),
+    )
 
 class GiaoDich(db.Model):
     __tablename__ = 'giao_dich'
     id = db.Column(db.Integer, primary_key=True)
     danh_muc_id = db.Column(db.Integer, db.ForeignKey('danh_muc.id'), nullable=False)
-    so_tien = db.Column(db.Float, nullable=False)
+    # Chủ của danh mục, chép sang để lọc theo user không cần join (transaction_owner.py).
+    # Cho phép NULL: giao dịch mồ côi (danh mục đã bị xóa) và dòng cũ chưa chạy migrate_giao_dich_owner.py
+    nguoi_dung_id = db.Column(db.Integer, db.ForeignKey('nguoi_dung.id'), nullable=True)
+    so_tien = db.Column(Money, nullable=False)
     mo_ta = db.Column(db.String(255))
     ngay = db.Column(db.DateTime, default=datetime.utcnow)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Giao dịch của user / của danh mục trong khoảng ngày, sắp theo ngày
+    __table_args__ = (
+        db.Index('idx_giao_dich_nguoi_dung_ngay', 'nguoi_dung_id', 'ngay'),
+        db.Index('idx_giao_dich_danh_muc_ngay', 'danh_muc_id', 'ngay'),
+    )
+
+class TongHopThang(db.Model):
+    # Tổng giao dịch theo (người dùng, danh mục, tháng), cập nhật khi thêm/xóa giao dịch
+    __tablename__ = 'tong_hop_thang'
+    __table_args__ = (db.UniqueConstraint('nguoi_dung_id', 'danh_muc_id', 'thang'),)
+    id = db.Column(db.Integer, primary_key=True)
+    nguoi_dung_id = db.Column(db.Integer, db.ForeignKey('nguoi_dung.id'), nullable=False)
+    danh_muc_id = db.Column(db.Integer, db.ForeignKey('danh_muc.id'), nullable=False)
+    thang = db.Column(db.String(7), nullable=False)  # 'YYYY-MM'
+    tong_tien = db.Column(Money, default=0)
+    so_giao_dich = db.Column(db.Integer, default=0)
 
 class GioiHanChiTieu(db.Model):
     __tablename__ = 'gioi_han_chi_tieu'
     id = db.Column(db.Integer, primary_key=True)
     danh_muc_id = db.Column(db.Integer, db.ForeignKey('danh_muc.id'), nullable=False)
-    so_tien_gioi_han = db.Column(db.Float, nullable=False)
+    so_tien_gioi_han = db.Column(Money, nullable=False)
     thang = db.Column(db.Integer)
     nam = db.Column(db.Integer)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Giới hạn của danh mục trong một tháng
+    __table_args__ = (
+        db.Index('idx_gioi_han_chi_tieu_danh_muc_thang', 'danh_muc_id', 'nam', 'thang'),
+    )
 
 class TichLuy(db.Model):
     __tablename__ = 'tich_luy'
     id = db.Column(db.Integer, primary_key=True)
     nguoi_dung_id = db.Column(db.Integer, db.ForeignKey('nguoi_dung.id'), nullable=False)
     ten_tich_luy = db.Column(db.String(100), nullable=False)
-    so_tien_muc_tieu = db.Column(db.Float, nullable=False)
-    so_tien_hien_tai = db.Column(db.Float, default=0)
+    so_tien_muc_tieu = db.Column(Money, nullable=False)
+    so_tien_hien_tai = db.Column(Money, default=0)
     ngay_ket_thuc = db.Column(db.DateTime)
     trang_thai = db.Column(db.String(20), default='Đang thực hiện')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_tich_luy_user', 'nguoi_dung_id'),
+    )
 
 class LichSuTichLuy(db.Model):
     __tablename__ = 'lich_su_tich_luy'
     id = db.Column(db.Integer, primary_key=True)
     tich_luy_id = db.Column(db.Integer, db.ForeignKey('tich_luy.id'), nullable=False)
-    so_tien = db.Column(db.Float, nullable=False)
+    so_tien = db.Column(Money, nullable=False)
     ngay = db.Column(db.DateTime, default=datetime.utcnow)
     mo_ta = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_lich_su_tich_luy', 'tich_luy_id'),
+    )
 
 class VayNo(db.Model):
     __tablename__ = 'vay_no'
@@ -93,22 +139,31 @@ class VayNo(db.Model):
     ho_ten_vay_no = db.Column(db.String(100), nullable=False)
     loai = db.Column(db.String(20), nullable=False)
     trang_thai = db.Column(db.String(20), default='Đang trả')
-    so_tien = db.Column(db.Float, nullable=False)
+    so_tien = db.Column(Money, nullable=False)
     lai_suat = db.Column(db.Float, default=0)
     ngay_vay_no = db.Column(db.DateTime, default=datetime.utcnow)
     han_tra = db.Column(db.DateTime)
     mo_ta = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Khoản vay của user theo trạng thái và hạn trả (nhắc nợ sắp đến hạn)
+    __table_args__ = (
+        db.Index('idx_vay_no_nguoi_dung_trang_thai_han_tra', 'nguoi_dung_id', 'trang_thai', 'han_tra'),
+    )
 
 class ThanhToan(db.Model):
     __tablename__ = 'thanh_toan'
     id = db.Column(db.Integer, primary_key=True)
     vay_no_id = db.Column(db.Integer, db.ForeignKey('vay_no.id'), nullable=False)
-    so_tien = db.Column(db.Float, nullable=False)
+    so_tien = db.Column(Money, nullable=False)
     mo_ta = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_thanh_toan_vay_no', 'vay_no_id'),
+    )
 
 class PhuongPhap(db.Model):
     __tablename__ = 'phuong_phap'
@@ -119,6 +174,62 @@ class PhuongPhap(db.Model):
     nhuoc_diem = db.Column(db.String(500))
     cach_van_dung = db.Column(db.String(500))
 
+class SoCai(db.Model):
+    """Sổ cái số dư (ledger.py): mỗi thay đổi so_du một dòng, chỉ thêm không sửa/xóa"""
+    __tablename__ = 'so_cai'
+    id = db.Column(db.Integer, primary_key=True)
+    nguoi_dung_id = db.Column(db.Integer, db.ForeignKey('nguoi_dung.id'), nullable=False)
+    so_tien = db.Column(Money, nullable=False)  # dương: cộng vào số dư, âm: trừ
+    nguon = db.Column(db.String(20), nullable=False)  # giao_dich, vay_no, thanh_toan, lich_su_tich_luy, so_du_dau
+    nguon_id = db.Column(db.Integer)
+    ngay_ghi = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # ngày của nguồn
+    
+    __table_args__ = (
+        db.Index('idx_so_cai_nguoi_dung_ngay_ghi', 'nguoi_dung_id', 'ngay_ghi'),
+    )
+
+class SoDuThang(db.Model):
+    """Ảnh chụp số dư cuối tháng tính từ so_cai (ledger.py)"""
+    __tablename__ = 'so_du_thang'
+    id = db.Column(db.Integer, primary_key=True)
+    nguoi_dung_id = db.Column(db.Integer, db.ForeignKey('nguoi_dung.id'), nullable=False)
+    thang = db.Column(db.String(7), nullable=False)  # 'YYYY-MM'
+    so_du = db.Column(Money, nullable=False)
+    so_but_toan = db.Column(db.Integer, nullable=False)  # số dòng sổ cái trong tháng
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('nguoi_dung_id', 'thang', name='uq_so_du_thang'),
+    )
+
+# Giao dịch thêm mới / đổi danh mục tự lấy nguoi_dung_id theo danh mục
+watch_owner(GiaoDich, DanhMuc)
+
+# Sổ cái số dư: mọi chỗ đổi so_du ghi qua ledger.post
+ledger = Ledger(db, NguoiDung, SoCai, SoDuThang, ledger_sources(GiaoDich, DanhMuc, VayNo, ThanhToan, LichSuTichLuy, TichLuy))
+
+def update_monthly_aggregate(user_id, danh_muc_id, ngay, so_tien, so_luong=1):
+    """Cộng dồn (hoặc trừ khi so_luong âm) vào tong_hop_thang, chưa commit"""
+    thang = (ngay or datetime.utcnow()).strftime('%Y-%m')
+    tong_hop = TongHopThang.query.filter_by(
+        nguoi_dung_id=user_id, danh_muc_id=danh_muc_id, thang=thang
+    ).first()
+    
+    if not tong_hop:
+        tong_hop = TongHopThang(
+            nguoi_dung_id=user_id, danh_muc_id=danh_muc_id, thang=thang,
+            tong_tien=0, so_giao_dich=0
+        )
+        db.session.add(tong_hop)
+    
+    tong_hop.tong_tien += so_tien
+    tong_hop.so_giao_dich += so_luong
+    if tong_hop.so_giao_dich <= 0:
+        if tong_hop in db.session.new:
+            db.session.expunge(tong_hop)
+        else:
+            db.session.delete(tong_hop)
+
 # Auth Routes
 @app.route('/api/auth/register', methods=['POST'])
 def register():
@@ -130,16 +241,23 @@ def register():
     if NguoiDung.query.filter_by(email=data['email']).first():
         return jsonify({'message': 'Email đã tồn tại'}), 400
     
+    try:
+        so_du = to_money(data.get('so_du', 0))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
     hashed_password = bcrypt.hashpw(data['mat_khau'].encode('utf-8'), bcrypt.gensalt())
     
     user = NguoiDung(
         ho_ten=data['ho_ten'],
         email=data['email'],
         mat_khau=hashed_password.decode('utf-8'),
-        so_du=data.get('so_du', 0)
+        so_du=so_du
     )
     
     db.session.add(user)
+    db.session.flush()
+    ledger.open(user.id, so_du)
     db.session.commit()
     
     return jsonify({'message': 'Đăng ký thành công', 'user_id': user.id}), 201
@@ -173,39 +291,45 @@ def create_transaction():
     if not danh_muc:
         return jsonify({'message': 'Danh mục không tồn tại'}), 404
     
+    try:
+        so_tien = to_money(data['so_tien'])
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
     giao_dich = GiaoDich(
         danh_muc_id=data['danh_muc_id'],
-        so_tien=data['so_tien'],
-        mo_ta=data.get('mo_ta', '')
+        nguoi_dung_id=danh_muc.nguoi_dung_id,
+        so_tien=so_tien,
+        mo_ta=data.get('mo_ta', ''),
+        ngay=datetime.utcnow()
     )
     
-    user = NguoiDung.query.get(user_id)
-    if danh_muc.loai_danh_muc == 'Chi tiêu':
-        user.so_du -= data['so_tien']
-    else:
-        user.so_du += data['so_tien']
-    
     db.session.add(giao_dich)
+    db.session.flush()
+    # Số dư (qua sổ cái) cập nhật trước: khóa dòng user để tong_hop_thang đọc sau đó không đua với request khác
+    so_du_moi = ledger.post(user_id, [(NGUON_GIAO_DICH, giao_dich.id, balance_delta(danh_muc.loai_danh_muc, so_tien), giao_dich.ngay)])
+    update_monthly_aggregate(user_id, danh_muc.id, giao_dich.ngay, giao_dich.so_tien)
     db.session.commit()
     
-    return jsonify({'message': 'Giao dịch thành công', 'so_du_moi': user.so_du}), 201
+    return jsonify({'message': 'Giao dịch thành công', 'so_du_moi': so_du_moi}), 201
 
 @app.route('/api/giao-dich', methods=['GET'])
 @jwt_required()
 def get_transactions():
     user_id = get_jwt_identity()
-    danh_mucs = DanhMuc.query.filter_by(nguoi_dung_id=user_id).all()
-    danh_muc_ids = [dm.id for dm in danh_mucs]
     
-    giao_dichs = GiaoDich.query.filter(GiaoDich.danh_muc_id.in_(danh_muc_ids)).order_by(GiaoDich.ngay.desc()).all()
+    try:
+        items, next_cursor = list_transactions(
+            GiaoDich, user_id, request.args,
+            default_fields=('id', 'danh_muc_id', 'so_tien', 'mo_ta', 'ngay')
+        )
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     
-    return jsonify([{
-        'id': g.id,
-        'danh_muc_id': g.danh_muc_id,
-        'so_tien': g.so_tien,
-        'mo_ta': g.mo_ta,
-        'ngay': g.ngay.isoformat()
-    } for g in giao_dichs]), 200
+    response = jsonify(items)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, 200
 
 @app.route('/api/giao-dich/<int:id>', methods=['DELETE'])
 @jwt_required()
@@ -220,12 +344,9 @@ def delete_transaction(id):
     if danh_muc.nguoi_dung_id != user_id:
         return jsonify({'message': 'Không có quyền'}), 403
     
-    user = NguoiDung.query.get(user_id)
-    if danh_muc.loai_danh_muc == 'Chi tiêu':
-        user.so_du += giao_dich.so_tien
-    else:
-        user.so_du -= giao_dich.so_tien
-    
+    # Sổ cái chỉ thêm: ghi dòng đảo cùng ngày với giao dịch bị xóa
+    ledger.post(user_id, [(NGUON_GIAO_DICH, giao_dich.id, -balance_delta(danh_muc.loai_danh_muc, giao_dich.so_tien), giao_dich.ngay)])
+    update_monthly_aggregate(user_id, danh_muc.id, giao_dich.ngay, -giao_dich.so_tien, so_luong=-1)
     db.session.delete(giao_dich)
     db.session.commit()
     
@@ -289,6 +410,11 @@ def set_spending_limit():
     if not danh_muc:
         return jsonify({'message': 'Danh mục không tồn tại'}), 404
     
+    try:
+        so_tien_gioi_han = to_money(data['so_tien_gioi_han'])
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
     now = datetime.utcnow()
     gioi_han = GioiHanChiTieu.query.filter_by(
         danh_muc_id=data['danh_muc_id'],
@@ -297,11 +423,11 @@ def set_spending_limit():
     ).first()
     
     if gioi_han:
-        gioi_han.so_tien_gioi_han = data['so_tien_gioi_han']
+        gioi_han.so_tien_gioi_han = so_tien_gioi_han
     else:
         gioi_han = GioiHanChiTieu(
             danh_muc_id=data['danh_muc_id'],
-            so_tien_gioi_han=data['so_tien_gioi_han'],
+            so_tien_gioi_han=so_tien_gioi_han,
             thang=now.month,
             nam=now.year
         )
@@ -329,11 +455,11 @@ def get_spending_limit(danh_muc_id):
     if not gioi_han:
         return jsonify({'so_tien_gioi_han': 0, 'chi_tieu_hien_tai': 0}), 200
     
-    chi_tieu = db.session.query(db.func.sum(GiaoDich.so_tien)).filter(
+    chi_tieu = db.session.query(money_sum(GiaoDich.so_tien)).filter(
         GiaoDich.danh_muc_id == danh_muc_id,
         db.extract('month', GiaoDich.ngay) == now.month,
         db.extract('year', GiaoDich.ngay) == now.year
-    ).scalar() or 0
+    ).scalar()
     
     return jsonify({
         'so_tien_gioi_han': gioi_han.so_tien_gioi_han,
@@ -348,10 +474,15 @@ def create_savings():
     user_id = get_jwt_identity()
     data = request.get_json()
     
+    try:
+        so_tien_muc_tieu = to_money(data['so_tien_muc_tieu'])
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
     tich_luy = TichLuy(
         nguoi_dung_id=user_id,
         ten_tich_luy=data['ten_tich_luy'],
-        so_tien_muc_tieu=data['so_tien_muc_tieu'],
+        so_tien_muc_tieu=so_tien_muc_tieu,
         ngay_ket_thuc=datetime.fromisoformat(data['ngay_ket_thuc']) if data.get('ngay_ket_thuc') else None
     )
     
@@ -385,18 +516,25 @@ def add_savings(id):
     if not tich_luy:
         return jsonify({'message': 'Mục tiêu không tồn tại'}), 404
     
-    tich_luy.so_tien_hien_tai += data['so_tien']
+    try:
+        so_tien = to_money(data['so_tien'])
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    tich_luy.so_tien_hien_tai += so_tien
     
     if tich_luy.so_tien_hien_tai >= tich_luy.so_tien_muc_tieu:
         tich_luy.trang_thai = 'Hoàn thành'
     
     lich_su = LichSuTichLuy(
         tich_luy_id=id,
-        so_tien=data['so_tien'],
+        so_tien=so_tien,
         mo_ta=data.get('mo_ta', '')
     )
     
     db.session.add(lich_su)
+    db.session.flush()
+    ledger.post(tich_luy.nguoi_dung_id, [(NGUON_TICH_LUY, lich_su.id, tich_luy_delta(so_tien), lich_su.ngay)])
     db.session.commit()
     
     return jsonify({'message': 'Thêm tiết kiệm thành công'}), 201
@@ -408,17 +546,24 @@ def create_debt():
     user_id = get_jwt_identity()
     data = request.get_json()
     
+    try:
+        so_tien = to_money(data['so_tien'])
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
     vay_no = VayNo(
         nguoi_dung_id=user_id,
         ho_ten_vay_no=data['ho_ten_vay_no'],
         loai=data['loai'],
-        so_tien=data['so_tien'],
+        so_tien=so_tien,
         lai_suat=data.get('lai_suat', 0),
         han_tra=datetime.fromisoformat(data['han_tra']) if data.get('han_tra') else None,
         mo_ta=data.get('mo_ta', '')
     )
     
     db.session.add(vay_no)
+    db.session.flush()
+    ledger.post(vay_no.nguoi_dung_id, [(NGUON_VAY_NO, vay_no.id, vay_no_delta(vay_no.loai, so_tien), vay_no.ngay_vay_no)])
     db.session.commit()
     
     return jsonify({'message': 'Thêm khoản vay nợ thành công', 'id': vay_no.id}), 201
@@ -449,13 +594,20 @@ def pay_debt(id):
     if not vay_no:
         return jsonify({'message': 'Khoản vay không tồn tại'}), 404
     
+    try:
+        so_tien = to_money(data['so_tien'])
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
     thanh_toan = ThanhToan(
         vay_no_id=id,
-        so_tien=data['so_tien'],
+        so_tien=so_tien,
         mo_ta=data.get('mo_ta', '')
     )
     
     db.session.add(thanh_toan)
+    db.session.flush()
+    ledger.post(vay_no.nguoi_dung_id, [(NGUON_THANH_TOAN, thanh_toan.id, thanh_toan_delta(vay_no.loai, so_tien), thanh_toan.created_at)])
     db.session.commit()
     
     return jsonify({'message': 'Thanh toán thành công'}), 201
@@ -509,60 +661,55 @@ def update_profile():
 @jwt_required()
 def get_statistics():
     user_id = get_jwt_identity()
-    danh_mucs = DanhMuc.query.filter_by(nguoi_dung_id=user_id).all()
-    danh_muc_ids = [dm.id for dm in danh_mucs]
-    
     now = datetime.utcnow()
     month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     
-    chi_tieu = db.session.query(db.func.sum(GiaoDich.so_tien)).filter(
-        GiaoDich.danh_muc_id.in_(danh_muc_ids),
-        GiaoDich.ngay >= month_start,
-        DanhMuc.loai_danh_muc == 'Chi tiêu'
-    ).join(DanhMuc).scalar() or 0
+    # Tổng tích lũy và vay nợ là scalar subquery nằm trong cùng câu SQL với thống kê tháng
+    tich_luy_total = db.session.query(
+        money_sum(TichLuy.so_tien_hien_tai)
+    ).filter(TichLuy.nguoi_dung_id == user_id).scalar_subquery()
     
-    thu_nhap = db.session.query(db.func.sum(GiaoDich.so_tien)).filter(
-        GiaoDich.danh_muc_id.in_(danh_muc_ids),
-        GiaoDich.ngay >= month_start,
-        DanhMuc.loai_danh_muc == 'Thu nhập'
-    ).join(DanhMuc).scalar() or 0
+    vay_no_total = db.session.query(
+        money_sum(VayNo.so_tien)
+    ).filter(VayNo.nguoi_dung_id == user_id, VayNo.trang_thai == 'Đang trả').scalar_subquery()
     
-    tich_luy_total = db.session.query(db.func.sum(TichLuy.so_tien_hien_tai)).filter(
-        TichLuy.nguoi_dung_id == user_id
-    ).scalar() or 0
-    
-    vay_no_total = db.session.query(db.func.sum(VayNo.so_tien)).filter(
-        VayNo.nguoi_dung_id == user_id,
-        VayNo.trang_thai == 'Đang trả'
-    ).scalar() or 0
+    stats = dashboard_summary(
+        db, NguoiDung, DanhMuc, GiaoDich, user_id, month_start,
+        extra_columns=(tich_luy_total.label('tich_luy_total'), vay_no_total.label('vay_no_total'))
+    )
+    if not stats:
+        return jsonify({'message': 'Người dùng không tồn tại'}), 404
     
     return jsonify({
-        'chi_tieu_thang_nay': chi_tieu,
-        'thu_nhap_thang_nay': thu_nhap,
-        'so_du': NguoiDung.query.get(user_id).so_du,
-        'tich_luy_total': tich_luy_total,
-        'vay_no_total': vay_no_total
+        'chi_tieu_thang_nay': stats.chi_tieu,
+        'thu_nhap_thang_nay': stats.thu_nhap,
+        'so_du': stats.so_du,
+        'tich_luy_total': stats.tich_luy_total,
+        'vay_no_total': stats.vay_no_total
     }), 200
 
 @app.route('/api/thong-ke/chi-tieu-theo-danh-muc', methods=['GET'])
 @jwt_required()
 def get_expense_by_category():
+    """
+    Chi tiêu theo danh mục, một câu GROUP BY.
+    Tham số tùy chọn: tu_ngay, den_ngay (ISO), chu_ky=day|week|month|year
+    Có chu_ky thì trả ma trận danh mục × kỳ, không thì trả danh sách như cũ
+    """
     user_id = get_jwt_identity()
-    danh_mucs = DanhMuc.query.filter_by(nguoi_dung_id=user_id, loai_danh_muc='Chi tiêu').all()
-    
-    result = []
-    for dm in danh_mucs:
-        total = db.session.query(db.func.sum(GiaoDich.so_tien)).filter(
-            GiaoDich.danh_muc_id == dm.id
-        ).scalar() or 0
-        result.append({
-            'ten_danh_muc': dm.ten_danh_muc,
-            'so_tien': total
-        })
+    try:
+        start, end = parse_date_range(request.args.get('tu_ngay'), request.args.get('den_ngay'))
+        result = expense_by_category(
+            db, DanhMuc, GiaoDich, user_id, start, end, request.args.get('chu_ky')
+        )
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     
     return jsonify(result), 200
 
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        ensure_owner_column(db)
+        ensure_indexes(db)
     app.run(debug=True, port=5000)
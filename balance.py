@@ -0,0 +1,19 @@
+# balance.py - Cập nhật nguoi_dung.so_du bằng một câu UPDATE so_du = so_du + :delta
+# thay cho đọc user rồi gán lại trong Python: nhiều worker gunicorn ghi cùng lúc không làm mất giao dịch nào.
+# UPDATE giữ khóa dòng nguoi_dung tới khi commit nên các bảng cộng dồn theo user (tong_hop_thang)
+# đọc SAU câu này cũng được tuần tự hóa theo user
+from sqlalchemy import func
+
+def balance_delta(loai_danh_muc, so_tien):
+    """Thay đổi số dư của một giao dịch: chi tiêu trừ, thu nhập cộng"""
+    return -so_tien if loai_danh_muc == 'Chi tiêu' else so_tien
+
+def adjust_balance(db, NguoiDung, user_id, delta):
+    """Cộng delta vào số dư ngay trong database, chưa commit; trả về số dư mới (None nếu không có user)"""
+    updated = db.session.query(NguoiDung).filter(NguoiDung.id == user_id).update(
+        {NguoiDung.so_du: func.coalesce(NguoiDung.so_du, 0) + delta}, synchronize_session=False
+    )
+    if not updated:
+        return None
+    # Đọc trong cùng transaction, dòng đang bị khóa nên là giá trị vừa ghi
+    return db.session.query(NguoiDung.so_du).filter(NguoiDung.id == user_id).scalar()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+So sánh tốc độ engine Python (ai_module) và engine numpy (ai_numpy)
+trên dữ liệu giả lập, đồng thời kiểm tra JSON trả về giống hệt nhau.
+    python benchmark_ai.py                    # 10k, 100k, 1M giao dịch
+    python benchmark_ai.py 5000 50000         # kích thước tùy chọn
+"""
+
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from ai_module import full_financial_analysis
+from ai_numpy import columnar_financial_analysis
+
+TEN_DANH_MUC = {1: 'Ăn uống', 2: 'Giải trí', 3: 'Mua sắm', 4: 'Di chuyển', 5: 'Lương', 6: 'Thưởng'}
+
+def make_columns(n, seed=42):
+    """Các cột như câu SQL trả về: ngay (datetime), danh_muc_id, so_tien"""
+    rnd = random.Random(seed)
+    start = datetime(2020, 1, 1)
+    ngay = [start + timedelta(minutes=rnd.randrange(5 * 365 * 24 * 60)) for _ in range(n)]
+    danh_muc_id = [rnd.choice(list(TEN_DANH_MUC)) for _ in range(n)]
+    so_tien = [float(rnd.randrange(1, 2000) * 1000) for _ in range(n)]
+    return ngay, danh_muc_id, so_tien
+
+def timed(func, *args):
+    t0 = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - t0
+
+def run(n):
+    ngay, danh_muc_id, so_tien = make_columns(n)
+
+    # Engine Python nhận list dict với ngày dạng ISO như route cũ vẫn dựng
+    transactions = [{
+        'danh_muc': TEN_DANH_MUC[d],
+        'so_tien': s,
+        'ngay': g.isoformat()
+    } for g, d, s in zip(ngay, danh_muc_id, so_tien)]
+
+    py_result, py_time = timed(full_financial_analysis, transactions)
+    np_result, np_time = timed(columnar_financial_analysis, ngay, danh_muc_id, so_tien, TEN_DANH_MUC)
+
+    identical = json.dumps(py_result, ensure_ascii=False) == json.dumps(np_result, ensure_ascii=False)
+    print(f"{n:>10,} | {py_time:9.3f}s | {np_time:9.3f}s | {py_time / np_time:6.1f}x | {'✅' if identical else '❌'}")
+    return identical
+
+if __name__ == "__main__":
+    sizes = [int(x) for x in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    print(f"{'giao dịch':>10} | {'python':>10} | {'numpy':>10} | {'tăng':>7} | giống hệt")
+    ok = all([run(n) for n in sizes])
+    sys.exit(0 if ok else 1)
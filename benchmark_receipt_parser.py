@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Đo tốc độ và độ chính xác của receipt_parser trên một tập văn bản OCR:
+    python benchmark_receipt_parser.py                 # 2000 hóa đơn sinh ngẫu nhiên
+    python benchmark_receipt_parser.py 10000
+    python benchmark_receipt_parser.py thu_muc/        # mọi file .txt trong thư mục
+Với thư mục, file abc.json cạnh abc.txt (storeName, date, total) dùng làm kết quả đúng để chấm điểm
+"""
+
+import json
+import os
+import random
+import sys
+import time
+
+from receipt_parser import ReceiptParser, parse_receipt
+from response_cache import MemoryCacheBackend
+
+STORES = ['CIRCLE K', 'HIGHLANDS COFFEE', 'PHỞ HÀ NỘI', 'Siêu thị Co.opmart', 'BÁCH HÓA XANH']
+PRODUCTS = ['Phở bò', 'Trà đá', 'Cà phê sữa', 'Bánh mì', 'Nước suối', 'Mì gói', 'Sữa tươi', 'Bánh bao']
+# Dòng sản phẩm: "Tên SL Đơn giá Thành tiền" / "Tên SL x Đơn giá Thành tiền"
+ITEM_LAYOUTS = ['{name} {qty} {price:,} {amount:,}', '{name} {qty} x {price:,} {amount:,}']
+
+def synthetic(n, seed=1):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(n):
+        store = rng.choice(STORES)
+        date = f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2026"
+        lines, total = [store, f"ĐT: 09{rng.randint(10000000, 99999999)}", f"Ngày: {date}"], 0
+        layout = rng.choice(ITEM_LAYOUTS)
+        for name in rng.sample(PRODUCTS, rng.randint(1, 6)):
+            qty, price = rng.randint(1, 3), rng.randint(5, 80) * 1000
+            total += qty * price
+            lines.append(layout.format(name=name, qty=qty, price=price, amount=qty * price).replace(',', '.'))
+        lines.append(f"Tổng cộng: {total:,}đ".replace(',', '.'))
+        day, month, year = date.split('/')
+        corpus.append(('\n'.join(lines), {'storeName': store, 'date': f'{year}-{month}-{day}', 'total': total}))
+    return corpus
+
+def load_dir(path):
+    corpus = []
+    for name in sorted(os.listdir(path)):
+        if not name.endswith('.txt'):
+            continue
+        with open(os.path.join(path, name), encoding='utf-8') as f:
+            text = f.read()
+        expected = None
+        json_path = os.path.join(path, name[:-4] + '.json')
+        if os.path.exists(json_path):
+            with open(json_path, encoding='utf-8') as f:
+                expected = json.load(f)
+        corpus.append((text, expected))
+    return corpus
+
+def main():
+    arg = sys.argv[1] if len(sys.argv) > 1 else '2000'
+    corpus = load_dir(arg) if os.path.isdir(arg) else synthetic(int(arg))
+    texts = [text for text, _ in corpus]
+
+    start = time.perf_counter()
+    results = [parse_receipt(text) for text in texts]
+    cold = time.perf_counter() - start
+
+    parser = ReceiptParser(MemoryCacheBackend(max_entries=len(texts) + 1))
+    parser.parse_many(texts)
+    start = time.perf_counter()
+    parser.parse_many(texts)
+    cached = time.perf_counter() - start
+
+    print(f"{len(texts)} hóa đơn")
+    print(f"  Phân tích:      {cold * 1000:8.1f} ms ({cold / len(texts) * 1e6:.0f} µs/hóa đơn)")
+    print(f"  Trúng cache:    {cached * 1000:8.1f} ms ({cached / len(texts) * 1e6:.0f} µs/hóa đơn)")
+
+    scored = [(r, e) for r, (_, e) in zip(results, corpus) if e]
+    if scored:
+        for field in ('storeName', 'date', 'total'):
+            ok = sum(1 for r, e in scored if field in e and r[field] == e[field])
+            print(f"  Đúng {field:<10} {ok}/{len(scored)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Đếm số câu SQL và thời gian cho GET /api/thong-ke (app_full.py, bản có đủ tích lũy/vay nợ):
+cách cũ (danh mục + 4 SUM + NguoiDung.get) so với một câu tổng hợp.
+    python benchmark_thong_ke.py              # 10000 giao dịch
+    python benchmark_thong_ke.py 100000
+Chạy trên file SQLite tạm, không đụng database thật
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+from sqlalchemy import event
+from flask_jwt_extended import create_access_token
+from app_full import app, db, NguoiDung, DanhMuc, GiaoDich, TichLuy, VayNo
+
+REQUESTS = 200
+
+def legacy_statistics(user_id):
+    """Bản get_statistics trước khi gộp, giữ lại để so sánh"""
+    danh_mucs = DanhMuc.query.filter_by(nguoi_dung_id=user_id).all()
+    danh_muc_ids = [dm.id for dm in danh_mucs]
+    month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    chi_tieu = db.session.query(db.func.sum(GiaoDich.so_tien)).filter(
+        GiaoDich.danh_muc_id.in_(danh_muc_ids), GiaoDich.ngay >= month_start,
+        DanhMuc.loai_danh_muc == 'Chi tiêu'
+    ).join(DanhMuc).scalar() or 0
+    thu_nhap = db.session.query(db.func.sum(GiaoDich.so_tien)).filter(
+        GiaoDich.danh_muc_id.in_(danh_muc_ids), GiaoDich.ngay >= month_start,
+        DanhMuc.loai_danh_muc == 'Thu nhập'
+    ).join(DanhMuc).scalar() or 0
+    tich_luy_total = db.session.query(db.func.sum(TichLuy.so_tien_hien_tai)).filter(
+        TichLuy.nguoi_dung_id == user_id
+    ).scalar() or 0
+    vay_no_total = db.session.query(db.func.sum(VayNo.so_tien)).filter(
+        VayNo.nguoi_dung_id == user_id, VayNo.trang_thai == 'Đang trả'
+    ).scalar() or 0
+
+    return {
+        'chi_tieu_thang_nay': chi_tieu,
+        'thu_nhap_thang_nay': thu_nhap,
+        'so_du': NguoiDung.query.get(user_id).so_du,
+        'tich_luy_total': tich_luy_total,
+        'vay_no_total': vay_no_total
+    }
+
+def seed(n):
+    db.create_all()
+    user = NguoiDung(ho_ten='Bench', email='bench@example.com', mat_khau='x', so_du=0)
+    db.session.add(user)
+    db.session.flush()
+
+    danh_mucs = [DanhMuc(nguoi_dung_id=user.id, loai_danh_muc=loai, ten_danh_muc=ten)
+                 for loai, ten in [('Chi tiêu', 'Ăn uống'), ('Chi tiêu', 'Mua sắm'), ('Thu nhập', 'Lương')]]
+    db.session.add_all(danh_mucs)
+    db.session.add(TichLuy(nguoi_dung_id=user.id, ten_tich_luy='Quỹ', so_tien_muc_tieu=100, so_tien_hien_tai=40))
+    db.session.add(VayNo(nguoi_dung_id=user.id, ho_ten_vay_no='A', loai='Cho Vay', so_tien=500))
+    db.session.flush()
+
+    rnd = random.Random(1)
+    now = datetime.utcnow()
+    db.session.bulk_insert_mappings(GiaoDich, [{
+        'danh_muc_id': rnd.choice(danh_mucs).id,
+        'nguoi_dung_id': user.id,
+        'so_tien': float(rnd.randrange(1, 500) * 1000),
+        'ngay': now - timedelta(days=rnd.randrange(365))
+    } for _ in range(n)])
+    db.session.commit()
+    return user.id
+
+def measure(label, call):
+    statements = []
+    listener = lambda *args: statements.append(1)
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        result = call()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+    t0 = time.perf_counter()
+    for _ in range(REQUESTS):
+        call()
+    elapsed = (time.perf_counter() - t0) / REQUESTS * 1000
+    print(f"{label:<12} | {len(statements):>8} | {elapsed:8.2f} ms")
+    return result
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    client = app.test_client()
+
+    with app.app_context():
+        user_id = seed(n)
+        headers = {'Authorization': f'Bearer {create_access_token(identity=str(user_id))}'}
+
+        print(f"{n:,} giao dịch, trung bình {REQUESTS} lần gọi")
+        print(f"{'cách':<12} | {'câu SQL':>8} | {'thời gian':>11}")
+        old = measure('cũ', lambda: legacy_statistics(user_id))
+        db.session.remove()
+        new = measure('gộp 1 câu', lambda: client.get('/api/thong-ke', headers=headers).get_json())
+
+    same = all(abs(float(old[k]) - float(new[k])) < 1e-6 for k in old)
+    print('Kết quả giống nhau' if same else f'Kết quả KHÁC nhau: {old} != {new}')
+    sys.exit(0 if same else 1)
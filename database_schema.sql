@@ -27,7 +27,7 @@ CREATE TABLE nguoi_dung (
     ho_ten VARCHAR(100) NOT NULL,
     email VARCHAR(100) NOT NULL UNIQUE,
     mat_khau VARCHAR(255) NOT NULL,      -- Bcrypt hashed
-    so_du FLOAT DEFAULT 0,
+    so_du BIGINT DEFAULT 0,
     trang_thai VARCHAR(20) DEFAULT 'Hoat dong',
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
@@ -36,6 +36,10 @@ CREATE TABLE nguoi_dung (
 
 CREATE INDEX idx_nguoi_dung_email ON nguoi_dung(email);
 CREATE INDEX idx_nguoi_dung_vai_tro ON nguoi_dung(vai_tro_id);
+CREATE INDEX idx_nguoi_dung_email_lower ON nguoi_dung(lower(email));
+CREATE INDEX idx_nguoi_dung_ho_ten_lower ON nguoi_dung(lower(ho_ten));
+CREATE INDEX idx_nguoi_dung_so_du ON nguoi_dung(so_du);
+CREATE INDEX idx_nguoi_dung_created_at ON nguoi_dung(created_at);
 
 -- ============================================================================
 -- 3. BANG DANH_MUC (Categories)
@@ -47,12 +51,13 @@ CREATE TABLE danh_muc (
     ten_danh_muc VARCHAR(100) NOT NULL,
     mo_ta VARCHAR(255),
     icon VARCHAR(50),
-    gioi_han FLOAT DEFAULT 0,            -- Gioi han chi tieu
+    gioi_han BIGINT DEFAULT 0,            -- Gioi han chi tieu
     FOREIGN KEY(nguoi_dung_id) REFERENCES nguoi_dung(id)
 );
 
 CREATE INDEX idx_danh_muc_user ON danh_muc(nguoi_dung_id);
 CREATE INDEX idx_danh_muc_loai ON danh_muc(loai_danh_muc);
+CREATE INDEX idx_danh_muc_nguoi_dung_loai ON danh_muc(nguoi_dung_id, loai_danh_muc);
 
 -- Du lieu mau
 INSERT INTO danh_muc VALUES (1, 1, 'Chi tieu', 'An uong', 'An uong hang ngay', '🍔', 5000000);
@@ -65,16 +70,20 @@ INSERT INTO danh_muc VALUES (3, 1, 'Thu nhap', 'Luong', 'Luong thang', '💰', 0
 CREATE TABLE giao_dich (
     id INTEGER NOT NULL PRIMARY KEY,
     danh_muc_id INTEGER NOT NULL,
-    so_tien FLOAT NOT NULL,
+    nguoi_dung_id INTEGER,               -- Chu cua danh muc (chep sang de loc theo user khong can join); NULL = giao dich mo coi
+    so_tien BIGINT NOT NULL,
     mo_ta VARCHAR(255),
     ngay DATETIME DEFAULT CURRENT_TIMESTAMP,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY(danh_muc_id) REFERENCES danh_muc(id)
+    FOREIGN KEY(danh_muc_id) REFERENCES danh_muc(id),
+    FOREIGN KEY(nguoi_dung_id) REFERENCES nguoi_dung(id)
 );
 
 CREATE INDEX idx_giao_dich_danh_muc ON giao_dich(danh_muc_id);
 CREATE INDEX idx_giao_dich_ngay ON giao_dich(ngay);
+CREATE INDEX idx_giao_dich_danh_muc_ngay ON giao_dich(danh_muc_id, ngay);
+CREATE INDEX idx_giao_dich_nguoi_dung_ngay ON giao_dich(nguoi_dung_id, ngay);
 
 -- ============================================================================
 -- 5. BANG TICH_LUY (Savings Goals)
@@ -83,7 +92,7 @@ CREATE TABLE tich_luy (
     id INTEGER NOT NULL PRIMARY KEY,
     nguoi_dung_id INTEGER NOT NULL,
     ten_tich_luy VARCHAR(100) NOT NULL,
-    so_tien_muc_tieu FLOAT NOT NULL,
+    so_tien_muc_tieu BIGINT NOT NULL,
     ngay_ket_thuc DATETIME,
     trang_thai VARCHAR(20) DEFAULT 'Dang thuc hien',
     FOREIGN KEY(nguoi_dung_id) REFERENCES nguoi_dung(id)
@@ -97,7 +106,7 @@ CREATE INDEX idx_tich_luy_user ON tich_luy(nguoi_dung_id);
 CREATE TABLE lich_su_tich_luy (
     id INTEGER NOT NULL PRIMARY KEY,
     tich_luy_id INTEGER NOT NULL,
-    so_tien FLOAT NOT NULL,
+    so_tien BIGINT NOT NULL,
     ngay DATETIME DEFAULT CURRENT_TIMESTAMP,
     mo_ta VARCHAR(255),
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
@@ -116,7 +125,7 @@ CREATE TABLE vay_no (
     ho_ten_vay_no VARCHAR(100) NOT NULL,
     loai VARCHAR(20) NOT NULL,           -- 'Cho Vay' hoac 'Muon No'
     trang_thai VARCHAR(20) DEFAULT 'Dang tra',
-    so_tien FLOAT NOT NULL,
+    so_tien BIGINT NOT NULL,
     lai_suat FLOAT DEFAULT 0,
     ngay_vay_no DATETIME DEFAULT CURRENT_TIMESTAMP,
     han_tra DATETIME,
@@ -128,6 +137,7 @@ CREATE TABLE vay_no (
 
 CREATE INDEX idx_vay_no_user ON vay_no(nguoi_dung_id);
 CREATE INDEX idx_vay_no_trang_thai ON vay_no(trang_thai);
+CREATE INDEX idx_vay_no_nguoi_dung_trang_thai_han_tra ON vay_no(nguoi_dung_id, trang_thai, han_tra);
 
 -- ============================================================================
 -- 8. BANG THANH_TOAN (Payments)
@@ -135,7 +145,7 @@ CREATE INDEX idx_vay_no_trang_thai ON vay_no(trang_thai);
 CREATE TABLE thanh_toan (
     id INTEGER NOT NULL PRIMARY KEY,
     vay_no_id INTEGER NOT NULL,
-    so_tien FLOAT NOT NULL,
+    so_tien BIGINT NOT NULL,
     mo_ta VARCHAR(255),
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
@@ -179,6 +189,35 @@ CREATE TABLE thong_tin_phuong_phap (
     FOREIGN KEY(mdlpp_id) REFERENCES danh_muc_loai_phuong_phap(id)
 );
 
+-- ============================================================================
+-- 12. BANG SO_CAI (Balance Ledger) - chi them, khong sua/xoa
+-- ============================================================================
+CREATE TABLE so_cai (
+    id INTEGER NOT NULL PRIMARY KEY,
+    nguoi_dung_id INTEGER NOT NULL,
+    so_tien BIGINT NOT NULL,
+    nguon VARCHAR(20) NOT NULL,  -- giao_dich, vay_no, thanh_toan, lich_su_tich_luy, so_du_dau
+    nguon_id INTEGER,
+    ngay_ghi DATETIME NOT NULL,  -- ngay cua nguon (giao_dich.ngay...)
+    FOREIGN KEY(nguoi_dung_id) REFERENCES nguoi_dung(id)
+);
+
+CREATE INDEX idx_so_cai_nguoi_dung_ngay_ghi ON so_cai(nguoi_dung_id, ngay_ghi);
+
+-- ============================================================================
+-- 13. BANG SO_DU_THANG (Monthly Balance Snapshots)
+-- ============================================================================
+CREATE TABLE so_du_thang (
+    id INTEGER NOT NULL PRIMARY KEY,
+    nguoi_dung_id INTEGER NOT NULL,
+    thang VARCHAR(7) NOT NULL,  -- YYYY-MM
+    so_du BIGINT NOT NULL,      -- so du cuoi thang
+    so_but_toan INTEGER NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY(nguoi_dung_id) REFERENCES nguoi_dung(id),
+    CONSTRAINT uq_so_du_thang UNIQUE (nguoi_dung_id, thang)
+);
+
 -- ============================================================================
 -- RELATIONSHIPS (ERD)
 -- ============================================================================
@@ -187,11 +226,14 @@ CREATE TABLE thong_tin_phuong_phap (
 -- NguoiDung (1) ----< (N) TichLuy
 -- NguoiDung (1) ----< (N) VayNo
 -- NguoiDung (1) ----< (N) PhuongPhap
+-- NguoiDung (1) ----< (N) GiaoDich (nguoi_dung_id chep tu danh_muc)
 -- DanhMuc (1) ----< (N) GiaoDich
 -- TichLuy (1) ----< (N) LichSuTichLuy
 -- VayNo (1) ----< (N) ThanhToan
 -- PhuongPhap (1) ----< (N) ThongTinPhuongPhap
 -- DanhMucLoaiPhuongPhap (1) ----< (N) ThongTinPhuongPhap
+-- NguoiDung (1) ----< (N) SoCai
+-- NguoiDung (1) ----< (N) SoDuThang
 
 -- ============================================================================
 -- USEFUL QUERIES
@@ -0,0 +1,35 @@
+# db_indexes.py - Tạo các index khai báo trong model (__table_args__) còn thiếu trên database cũ
+# db.create_all chỉ tạo index khi tạo bảng mới, bảng đã có thì bỏ qua
+from sqlalchemy import inspect, text
+
+def existing_index_names(db):
+    # Inspector của SQLite bỏ qua index theo biểu thức (lower(email)...) nên đọc thẳng catalog
+    dialect = db.engine.dialect.name
+    with db.engine.connect() as conn:
+        if dialect == 'sqlite':
+            return set(conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars())
+        if dialect == 'postgresql':
+            return set(conn.execute(text(
+                "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()"
+            )).scalars())
+    inspector = inspect(db.engine)
+    return {idx['name'] for table in inspector.get_table_names() for idx in inspector.get_indexes(table)}
+
+def missing_indexes(db):
+    """Các db.Index của model mà database chưa có (so theo tên), chỉ xét bảng đã tồn tại"""
+    tables = set(inspect(db.engine).get_table_names())
+    existing = existing_index_names(db)
+    return [
+        idx
+        for table in db.metadata.sorted_tables if table.name in tables
+        for idx in sorted(table.indexes, key=lambda i: i.name)
+        if idx.name not in existing
+    ]
+
+def ensure_indexes(db):
+    """Tạo index còn thiếu (gọi sau db.create_all()), trả về danh sách tên đã tạo"""
+    created = []
+    for idx in missing_indexes(db):
+        idx.create(bind=db.engine)
+        created.append(idx.name)
+    return created
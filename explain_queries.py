@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Gọi mọi route GET /api/... của app, ghi lại từng câu SQL phát sinh rồi chạy
+EXPLAIN QUERY PLAN (SQLite) / EXPLAIN (PostgreSQL) để tìm chỗ quét toàn bảng:
+    python explain_queries.py                   # app.py trên file SQLite tạm có dữ liệu mẫu
+    python explain_queries.py app_complete      # models.py + api_routes.py
+    python explain_queries.py app --strict      # exit 1 nếu có câu quét toàn bảng (dùng trong CI)
+Đặt DATABASE_URL để chạy trên database có sẵn (không ghi dữ liệu mẫu), EXPLAIN_USER_ID chọn user;
+trên PostgreSQL nên chạy với database thật vì bảng nhỏ thì planner luôn chọn Seq Scan
+"""
+
+import importlib
+import os
+import random
+import re
+import sys
+import tempfile
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+SEED = not os.getenv('DATABASE_URL')
+if SEED:
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'explain.db')
+# Tắt cache response để route nào cũng chạm database
+os.environ.setdefault('RESPONSE_CACHE', 'off')
+os.environ.setdefault('RESOURCE_VERSION_STORE', 'off')
+
+from sqlalchemy import event
+from flask_jwt_extended import create_access_token
+from roles import ADMIN
+
+# Tham số thêm cho từng route để đi qua các nhánh lọc / phân trang
+VARIANTS = {
+    '/api/giao-dich': ['', '?tu_ngay={tu_ngay}&den_ngay={den_ngay}', '?danh_muc_id=1&limit=20'],
+    '/api/hoa-don': ['', '?search=cafe', '?tu_ngay={tu_ngay}&min_tien=10000&page=2&per_page=5'],
+    '/api/thong-ke/san-pham': ['', '?tu_ngay={tu_ngay}&den_ngay={den_ngay}'],
+    '/api/export/giao-dich': ['?format=csv', '?format=csv&tu_ngay={tu_ngay}'],
+}
+STATEMENT_RE = re.compile(r'^\s*(SELECT|WITH|UPDATE|DELETE)\b', re.I)
+
+def seed(db, n=2000):
+    """Dữ liệu mẫu vừa đủ cho mọi bảng chính, ghi thẳng qua metadata nên dùng được cho mọi bộ model"""
+    tables = db.metadata.tables
+    rnd = random.Random(1)
+    now = datetime.utcnow()
+
+    def insert(name, rows):
+        if name not in tables or not rows:
+            return
+        table = tables[name]
+        db.session.execute(table.insert(), [{k: v for k, v in row.items() if k in table.c} for row in rows])
+
+    insert('vai_tro', [{'id': 1, 'loai_vai_tro': ADMIN}, {'id': 2, 'loai_vai_tro': 'User'}])
+    insert('nguoi_dung', [{
+        'id': i, 'ho_ten': f'User {i}', 'email': f'user{i}@example.com', 'mat_khau': 'x',
+        'so_du': 0, 'vai_tro_id': 1 if i == 1 else 2, 'trang_thai': 'Hoạt động', 'created_at': now
+    } for i in (1, 2)])
+    danh_mucs = [(i, 1 + (i > 5), 'Thu nhập' if i % 5 == 0 else 'Chi tiêu') for i in range(1, 11)]
+    insert('danh_muc', [{'id': i, 'nguoi_dung_id': u, 'loai_danh_muc': loai, 'ten_danh_muc': f'Danh mục {i}'}
+                        for i, u, loai in danh_mucs])
+    user_of = {i: u for i, u, _ in danh_mucs}
+    giao_dich = [{
+        'id': i, 'danh_muc_id': d, 'nguoi_dung_id': user_of[d], 'so_tien': float(rnd.randrange(1, 500) * 1000),
+        'mo_ta': 'mẫu', 'ngay': now - timedelta(days=rnd.randrange(730)), 'created_at': now
+    } for i, d in ((i, rnd.randint(1, 10)) for i in range(1, n + 1))]
+    insert('giao_dich', giao_dich)
+    tong_hop = {}
+    for gd in giao_dich:
+        key = (user_of[gd['danh_muc_id']], gd['danh_muc_id'], gd['ngay'].strftime('%Y-%m'))
+        tong_hop[key] = tong_hop.get(key, 0) + gd['so_tien']
+    insert('tong_hop_thang', [{'nguoi_dung_id': u, 'danh_muc_id': d, 'thang': t, 'tong_tien': s, 'so_giao_dich': 1}
+                              for (u, d, t), s in tong_hop.items()])
+    insert('so_cai', [{'nguoi_dung_id': user_of[gd['danh_muc_id']], 'nguon': 'giao_dich', 'nguon_id': gd['id'],
+                       'so_tien': gd['so_tien'], 'ngay_ghi': gd['ngay']} for gd in giao_dich])
+    insert('so_du_thang', [{'nguoi_dung_id': u, 'thang': t, 'so_du': 0, 'so_but_toan': 1, 'created_at': now}
+                           for u in (1, 2) for t in sorted({key[2] for key in tong_hop})[:-1]])
+    insert('tich_luy', [{'id': i, 'nguoi_dung_id': 1 + i % 2, 'ten_tich_luy': f'Quỹ {i}', 'so_tien_muc_tieu': 1e6,
+                         'so_tien_hien_tai': 0, 'created_at': now} for i in range(1, 21)])
+    insert('lich_su_tich_luy', [{'tich_luy_id': rnd.randint(1, 20), 'so_tien': 10000.0, 'ngay': now}
+                                for _ in range(100)])
+    insert('vay_no', [{
+        'id': i, 'nguoi_dung_id': 1 + i % 2, 'ho_ten_vay_no': f'Người {i}', 'loai': 'Cho Vay',
+        'trang_thai': rnd.choice(['Đang trả', 'Đã trả']), 'so_tien': 500000.0, 'ngay_vay_no': now,
+        'han_tra': now + timedelta(days=rnd.randrange(-30, 60)), 'created_at': now
+    } for i in range(1, 41)])
+    insert('thanh_toan', [{'vay_no_id': rnd.randint(1, 40), 'so_tien': 50000.0, 'created_at': now}
+                          for _ in range(100)])
+    insert('hoa_don', [{
+        'id': i, 'nguoi_dung_id': 2 - i % 2, 'ten_cua_hang': rnd.choice(['Cafe Sáng', 'Siêu thị Co.opmart']),
+        'ngay_hoa_don': now - timedelta(days=i), 'tong_tien': 45000.0, 'san_pham': '[]',
+        'van_ban_goc': 'cafe sữa 45.000', 'created_at': now - timedelta(days=i)
+    } for i in range(1, 101)])
+    insert('san_pham_hoa_don', [{'hoa_don_id': i, 'ten_san_pham': 'Cà phê sữa', 'so_luong': 1.0, 'don_gia': 45000.0}
+                                for i in range(1, 101)])
+    db.session.commit()
+
+def get_routes(app):
+    args = {'tu_ngay': (datetime.utcnow() - timedelta(days=90)).strftime('%Y-%m-%d'),
+            'den_ngay': datetime.utcnow().strftime('%Y-%m-%d')}
+    for rule in sorted(app.url_map.iter_rules(), key=lambda r: r.rule):
+        if 'GET' not in rule.methods or not rule.rule.startswith('/api/'):
+            continue
+        # Tham số đường dẫn kiểu số lấy bản ghi đầu tiên, kiểu chuỗi (job id...) thì bỏ qua
+        if any(conv.__class__.__name__ != 'IntegerConverter' for conv in rule._converters.values()):
+            continue
+        path = re.sub(r'<int:\w+>', '1', rule.rule)
+        for suffix in VARIANTS.get(rule.rule, ['']):
+            yield path + suffix.format(**args)
+
+def plan_warnings(dialect, plan):
+    """Dòng kế hoạch đáng chú ý: quét toàn bảng (full), quét toàn index / sắp xếp tạm (warn)"""
+    found = []
+    for line in plan:
+        if dialect == 'sqlite':
+            if line.startswith('SCAN ') and 'CONSTANT ROW' not in line and 'VIRTUAL TABLE' not in line:
+                found.append(('warn' if 'USING' in line else 'full', line))
+            elif 'USE TEMP B-TREE' in line:
+                found.append(('warn', line))
+        elif 'Seq Scan' in line:
+            found.append(('full', line.strip()))
+        elif re.search(r'\bSort\b', line) and 'Key' not in line:
+            found.append(('warn', line.strip()))
+    return found
+
+def explain(db, statement, parameters):
+    dialect = db.engine.dialect.name
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' else 'EXPLAIN '
+    with db.engine.connect() as conn:
+        rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+        conn.rollback()
+    # SQLite: (id, parent, notused, detail); PostgreSQL: một cột text mỗi dòng
+    return [row[-1] for row in rows]
+
+def main():
+    argv = [a for a in sys.argv[1:] if not a.startswith('--')]
+    strict = '--strict' in sys.argv
+    module = importlib.import_module(argv[0] if argv else 'app')
+    app, db = module.app, module.db
+
+    with app.app_context():
+        db.create_all()
+        if SEED:
+            seed(db)
+        user_id = int(os.getenv('EXPLAIN_USER_ID', 1))
+        token = create_access_token(identity=str(user_id), additional_claims={'vai_tro': ADMIN})
+
+    statements = OrderedDict()
+    current = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if current and not executemany and STATEMENT_RE.match(statement):
+            entry = statements.setdefault(statement, {'parameters': parameters, 'routes': []})
+            if current[0] not in entry['routes']:
+                entry['routes'].append(current[0])
+
+    client = app.test_client()
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            for url in get_routes(app):
+                current[:] = [url]
+                status = client.get(url, headers={'Authorization': f'Bearer {token}'}).status_code
+                current[:] = []
+                print(f"{status}  GET {url}")
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+
+        dialect = db.engine.dialect.name
+        full = 0
+        print(f"\n{len(statements)} câu SQL khác nhau ({dialect})")
+        for statement, entry in statements.items():
+            try:
+                warnings = plan_warnings(dialect, explain(db, statement, entry['parameters']))
+            except Exception as e:
+                warnings = [('error', str(e).splitlines()[0])]
+            if not warnings:
+                continue
+            full += sum(1 for kind, _ in warnings if kind == 'full')
+            print('\n' + '-' * 70)
+            print('Route: ' + ', '.join(entry['routes']))
+            print(re.sub(r'\s+', ' ', statement).strip()[:400])
+            for kind, line in warnings:
+                print(f"  [{kind.upper():<5}] {line}")
+
+    print(f"\n{'✅ Không có câu nào quét toàn bảng' if not full else f'⚠️  {full} chỗ quét toàn bảng'}")
+    sys.exit(1 if strict and full else 0)
+
+if __name__ == "__main__":
+    main()
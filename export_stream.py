@@ -0,0 +1,52 @@
+# export_stream.py - Sinh dữ liệu xuất NDJSON/CSV theo từng khối, bộ nhớ không phụ thuộc số dòng
+import csv
+import io
+import json
+from datetime import datetime
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+CHUNK_ROWS = 500
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def stream_export(rows, fields, fmt, to_dict=None):
+    """
+    rows: iterable lười (query.yield_per) trả về các dòng có thuộc tính theo fields
+    to_dict: tùy chọn, biến đổi dict một dòng trước khi ghi (vd: giải mã JSON)
+    Mỗi lần yield một khối tối đa CHUNK_ROWS dòng
+    """
+    buffer = io.StringIO()
+    writer = None
+
+    if fmt == 'csv':
+        # BOM để Excel đọc đúng tiếng Việt
+        buffer.write('\ufeff')
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+
+    count = 0
+    for row in rows:
+        item = {f: _plain(getattr(row, f)) for f in fields}
+        if to_dict:
+            item = to_dict(item)
+
+        if writer:
+            writer.writerow([item[f] for f in fields])
+        else:
+            buffer.write(json.dumps(item, ensure_ascii=False))
+            buffer.write('\n')
+
+        count += 1
+        if count % CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
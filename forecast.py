@@ -0,0 +1,133 @@
+# forecast.py - Dự báo chi tiêu theo tháng cho từng danh mục bằng làm trơn hàm mũ
+# Holt (mức + xu hướng) khi có ít nhất 3 tháng, Holt-Winters cộng tính (thêm mùa vụ 12 tháng) khi có từ 24 tháng.
+# Chỉ fit trên các tháng đã kết thúc; tham số fit được lưu theo user (mo_hinh_du_bao)
+# và chỉ fit lại khi có tháng mới kết thúc hoặc số liệu các tháng cũ thay đổi
+import json
+from datetime import datetime
+from itertools import product
+
+from sqlalchemy.exc import IntegrityError
+
+SEASON = 12
+MIN_TREND_MONTHS = 3
+ALPHAS = (0.1, 0.3, 0.5, 0.7, 0.9)
+BETAS = (0.0, 0.1, 0.2, 0.3)
+GAMMAS = (0.1, 0.3, 0.5)
+
+def month_index(key):
+    year, month = key.split('-')
+    return int(year) * 12 + int(month) - 1
+
+def month_key(index):
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+def closed_series(month_cat, today=None):
+    """
+    {danh mục: [tổng theo tháng]} trên các tháng đã kết thúc (trước tháng hiện tại),
+    tháng không có giao dịch = 0, mỗi chuỗi bắt đầu từ tháng đầu tiên danh mục có chi tiêu.
+    Trả về (series, tháng cuối đã kết thúc hoặc None)
+    """
+    current = month_index((today or datetime.utcnow()).strftime('%Y-%m'))
+    closed = sorted(m for m in month_cat if month_index(m) < current)
+    if not closed:
+        return {}, None
+
+    last = month_index(closed[-1])
+    series = {}
+    for cat in sorted({c for m in closed for c in month_cat[m]}):
+        first = min(month_index(m) for m in closed if cat in month_cat[m])
+        series[cat] = [float(month_cat.get(month_key(i), {}).get(cat, 0.0)) for i in range(first, last + 1)]
+    return series, closed[-1]
+
+def _holt(y, alpha, beta):
+    level, trend = y[0], y[1] - y[0]
+    sse = 0.0
+    for value in y[1:]:
+        sse += (value - level - trend) ** 2
+        new_level = alpha * value + (1 - alpha) * (level + trend)
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        level = new_level
+    return sse, level, trend
+
+def _holt_winters(y, alpha, beta, gamma):
+    level = sum(y[:SEASON]) / SEASON
+    trend = (sum(y[SEASON:2 * SEASON]) - sum(y[:SEASON])) / SEASON ** 2
+    seasonal = [v - level for v in y[:SEASON]]
+    sse = 0.0
+    for t in range(SEASON, len(y)):
+        s = seasonal[t % SEASON]
+        sse += (y[t] - level - trend - s) ** 2
+        new_level = alpha * (y[t] - s) + (1 - alpha) * (level + trend)
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        seasonal[t % SEASON] = gamma * (y[t] - new_level) + (1 - gamma) * s
+        level = new_level
+    return sse, level, trend, seasonal
+
+def fit_series(y):
+    """Chọn tham số có tổng bình phương sai số dự báo 1 bước nhỏ nhất (dò lưới), trả về dict lưu được JSON"""
+    n = len(y)
+    if n < MIN_TREND_MONTHS:
+        return {'method': 'average', 'n': n, 'level': sum(y) / n if n else 0.0}
+
+    if n >= 2 * SEASON:
+        best = min(
+            (_holt_winters(y, a, b, g) + (a, b, g) for a, b, g in product(ALPHAS, BETAS, GAMMAS)),
+            key=lambda r: r[0]
+        )
+        _, level, trend, seasonal, alpha, beta, gamma = best
+        return {'method': 'holt_winters', 'n': n, 'alpha': alpha, 'beta': beta, 'gamma': gamma,
+                'level': level, 'trend': trend, 'seasonal': seasonal}
+
+    best = min((_holt(y, a, b) + (a, b) for a, b in product(ALPHAS, BETAS)), key=lambda r: r[0])
+    _, level, trend, alpha, beta = best
+    return {'method': 'holt', 'n': n, 'alpha': alpha, 'beta': beta, 'level': level, 'trend': trend}
+
+def forecast(params, steps=1):
+    """Giá trị dự báo `steps` tháng sau tháng cuối đã fit (không âm)"""
+    value = params['level']
+    if params['method'] != 'average':
+        value += steps * params['trend']
+    if params['method'] == 'holt_winters':
+        value += params['seasonal'][(params['n'] - 1 + steps) % SEASON]
+    return max(value, 0.0)
+
+def fit_all(month_cat, today=None):
+    """Fit mọi danh mục, không lưu: (thang_cuoi, {danh mục: params})"""
+    series, last = closed_series(month_cat, today)
+    return last, {cat: fit_series(y) for cat, y in series.items()}
+
+def cached_models(db, MoHinhDuBao, user_id, month_cat, today=None):
+    """
+    Như fit_all nhưng dùng lại tham số đã lưu khi tháng cuối, số tháng và tổng lịch sử
+    của danh mục không đổi; danh mục khác thì fit lại và ghi đè. Có commit khi có thay đổi
+    """
+    series, last = closed_series(month_cat, today)
+    saved = {m.danh_muc: m for m in MoHinhDuBao.query.filter_by(nguoi_dung_id=user_id)}
+    models, changed = {}, False
+
+    for cat, y in series.items():
+        tong = round(sum(y), 2)
+        row = saved.pop(cat, None)
+        if row and row.thang_cuoi == last and row.so_thang == len(y) and row.tong_lich_su == tong:
+            models[cat] = json.loads(row.tham_so)
+            continue
+        models[cat] = fit_series(y)
+        if not row:
+            row = MoHinhDuBao(nguoi_dung_id=user_id, danh_muc=cat)
+            db.session.add(row)
+        row.thang_cuoi, row.so_thang, row.tong_lich_su = last, len(y), tong
+        row.tham_so = json.dumps(models[cat])
+        row.cap_nhat_luc = datetime.utcnow()
+        changed = True
+
+    for row in saved.values():
+        db.session.delete(row)
+        changed = True
+
+    if changed:
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Request khác vừa lưu cùng danh mục; kết quả fit vẫn dùng được
+            db.session.rollback()
+    return last, models
@@ -0,0 +1,153 @@
+# job_queue.py - Hàng đợi job nền (worker pool + store có thể thay thế)
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class MemoryJobStore:
+    """Lưu trạng thái job trong bộ nhớ của process (mặc định)"""
+
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def save(self, job):
+        with self._lock:
+            self._prune()
+            self._jobs[job['id']] = dict(job)
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _prune(self):
+        # Bỏ các job đã xong quá TTL để bộ nhớ không tăng mãi
+        cutoff = time.time() - self.ttl
+        expired = [k for k, j in self._jobs.items()
+                   if j['status'] in ('done', 'error') and j['updated_at'] < cutoff]
+        for k in expired:
+            del self._jobs[k]
+
+
+class SQLiteJobStore:
+    """Lưu job vào file SQLite để nhiều worker gunicorn cùng đọc được kết quả"""
+
+    def __init__(self, path, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS ai_job ('
+                'id TEXT PRIMARY KEY, owner_id INTEGER, status TEXT, '
+                'result TEXT, error TEXT, created_at REAL, updated_at REAL)'
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def save(self, job):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "DELETE FROM ai_job WHERE status IN ('done', 'error') AND updated_at < ?",
+                (time.time() - self.ttl,)
+            )
+            conn.execute(
+                'INSERT OR REPLACE INTO ai_job VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job['id'], job['owner_id'], job['status'], json.dumps(job['result']),
+                 job['error'], job['created_at'], job['updated_at'])
+            )
+
+    def update(self, job_id, **fields):
+        if 'result' in fields:
+            fields['result'] = json.dumps(fields['result'])
+        cols = ', '.join(f'{k} = ?' for k in fields)
+        with self._lock, self._connect() as conn:
+            conn.execute(f'UPDATE ai_job SET {cols} WHERE id = ?', (*fields.values(), job_id))
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT id, owner_id, status, result, error, created_at, updated_at '
+                'FROM ai_job WHERE id = ?', (job_id,)
+            ).fetchone()
+        if not row:
+            return None
+        return {
+            'id': row[0], 'owner_id': row[1], 'status': row[2],
+            'result': json.loads(row[3]) if row[3] else None, 'error': row[4],
+            'created_at': row[5], 'updated_at': row[6]
+        }
+
+
+def make_store(spec, ttl=3600):
+    """'memory' -> MemoryJobStore, còn lại coi là đường dẫn file SQLite"""
+    if not spec or spec == 'memory':
+        return MemoryJobStore(ttl=ttl)
+    if spec.startswith('sqlite:///'):
+        spec = spec[len('sqlite:///'):]
+    return SQLiteJobStore(spec, ttl=ttl)
+
+
+class JobQueue:
+    """
+    Worker pool chạy job nền, gộp (debounce) các job cùng key:
+    trong lúc job của một key còn chờ chạy, submit thêm sẽ trả lại job id cũ.
+    """
+
+    def __init__(self, store=None, max_workers=2, debounce=2.0):
+        self.store = store or MemoryJobStore()
+        self.debounce = debounce
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, owner_id, func, *args):
+        with self._lock:
+            job_id = self._pending.get(key)
+            if job_id:
+                return job_id
+
+            now = time.time()
+            job_id = uuid.uuid4().hex
+            self.store.save({
+                'id': job_id, 'owner_id': owner_id, 'status': 'queued',
+                'result': None, 'error': None, 'created_at': now, 'updated_at': now
+            })
+            self._pending[key] = job_id
+
+        if self.debounce > 0:
+            timer = threading.Timer(self.debounce, self._dispatch, (key, job_id, func, args))
+            timer.daemon = True
+            timer.start()
+        else:
+            self._dispatch(key, job_id, func, args)
+        return job_id
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def _dispatch(self, key, job_id, func, args):
+        self._executor.submit(self._run, key, job_id, func, args)
+
+    def _run(self, key, job_id, func, args):
+        # Job đã bắt đầu chạy -> ghi mới sau thời điểm này phải tạo job mới
+        with self._lock:
+            if self._pending.get(key) == job_id:
+                del self._pending[key]
+        self.store.update(job_id, status='running', updated_at=time.time())
+        try:
+            result = func(*args)
+            self.store.update(job_id, status='done', result=result, updated_at=time.time())
+        except Exception as e:
+            self.store.update(job_id, status='error', error=str(e), updated_at=time.time())
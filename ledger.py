@@ -0,0 +1,264 @@
+# ledger.py - Sổ cái số dư (so_cai) và ảnh chụp số dư cuối tháng (so_du_thang)
+# Mỗi thay đổi so_du (giao dịch, khoản vay nợ, thanh toán vay nợ, nạp tích lũy) là một dòng chỉ thêm,
+# không sửa/xóa; xóa hay sửa nguồn thì ghi thêm dòng đảo. ngay_ghi là ngày của nguồn (giao_dich.ngay...),
+# nên số dư tại một ngày = ảnh chụp tháng gần nhất trước đó + các dòng sau tháng đó, không phải cộng lại
+# toàn bộ lịch sử của user; ghi lùi ngày vào tháng đã chụp thì bỏ ảnh chụp từ tháng đó (reconcile chụp lại).
+# Mỗi app truyền db và model của mình như các module khác
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from balance import adjust_balance, balance_delta
+from money import money_sum
+from stats_queries import period_expression
+
+NGUON_GIAO_DICH = 'giao_dich'
+NGUON_VAY_NO = 'vay_no'
+NGUON_THANH_TOAN = 'thanh_toan'
+NGUON_TICH_LUY = 'lich_su_tich_luy'
+NGUON_SO_DU_DAU = 'so_du_dau'    # số dư lúc đăng ký, hoặc lúc mở sổ cho user cũ
+
+# so_du nhập lúc đăng ký là số dư trước mọi giao dịch ghi vào app (kể cả giao dịch nhập lùi ngày),
+# nên dòng số dư đầu đứng trước mọi ngày
+SO_DU_DAU_NGAY = datetime(1970, 1, 1)
+
+# Chỉ chụp tháng đã kết thúc quá khoảng này, để giao dịch cuối tháng ghi trễ không làm bỏ ảnh vừa chụp
+SNAPSHOT_GRACE = timedelta(days=1)
+
+def vay_no_delta(loai_vay_no, so_tien):
+    """Cho vay là tiền ra khỏi số dư, mượn nợ là tiền vào"""
+    return -so_tien if loai_vay_no == 'Cho Vay' else so_tien
+
+def thanh_toan_delta(loai_vay_no, so_tien):
+    """Thanh toán khoản cho vay là tiền về, khoản mượn nợ là tiền ra"""
+    return so_tien if loai_vay_no == 'Cho Vay' else -so_tien
+
+def tich_luy_delta(so_tien):
+    """Nạp vào quỹ tích lũy là tiền rời số dư"""
+    return -so_tien
+
+def ledger_sources(GiaoDich, DanhMuc, VayNo=None, ThanhToan=None, LichSuTichLuy=None, TichLuy=None):
+    """
+    {nguon: hàm(db, user_id) -> [(nguon_id, thay đổi số dư, ngày)]} cho các bảng nguồn app có;
+    dùng khi đối soát và khi mở sổ cho user cũ
+    """
+    def giao_dich(db, user_id):
+        rows = db.session.query(GiaoDich.id, DanhMuc.loai_danh_muc, GiaoDich.so_tien, GiaoDich.ngay).join(
+            DanhMuc, DanhMuc.id == GiaoDich.danh_muc_id
+        ).filter(GiaoDich.nguoi_dung_id == user_id)
+        return [(id, balance_delta(loai, so_tien), ngay) for id, loai, so_tien, ngay in rows]
+
+    def vay_no(db, user_id):
+        rows = db.session.query(VayNo.id, VayNo.loai, VayNo.so_tien, VayNo.ngay_vay_no).filter(
+            VayNo.nguoi_dung_id == user_id
+        )
+        return [(id, vay_no_delta(loai, so_tien), ngay) for id, loai, so_tien, ngay in rows]
+
+    def thanh_toan(db, user_id):
+        rows = db.session.query(ThanhToan.id, VayNo.loai, ThanhToan.so_tien, ThanhToan.created_at).join(
+            VayNo, VayNo.id == ThanhToan.vay_no_id
+        ).filter(VayNo.nguoi_dung_id == user_id)
+        return [(id, thanh_toan_delta(loai, so_tien), ngay) for id, loai, so_tien, ngay in rows]
+
+    def tich_luy(db, user_id):
+        rows = db.session.query(LichSuTichLuy.id, LichSuTichLuy.so_tien, LichSuTichLuy.ngay).join(
+            TichLuy, TichLuy.id == LichSuTichLuy.tich_luy_id
+        ).filter(TichLuy.nguoi_dung_id == user_id)
+        return [(id, tich_luy_delta(so_tien), ngay) for id, so_tien, ngay in rows]
+
+    sources = {NGUON_GIAO_DICH: giao_dich}
+    if VayNo is not None:
+        sources[NGUON_VAY_NO] = vay_no
+    if ThanhToan is not None:
+        sources[NGUON_THANH_TOAN] = thanh_toan
+    if LichSuTichLuy is not None:
+        sources[NGUON_TICH_LUY] = tich_luy
+    return sources
+
+def month_start(dt):
+    return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def next_month(thang):
+    """'YYYY-MM' -> đầu tháng sau (hết tháng đó)"""
+    year, month = map(int, thang.split('-'))
+    return datetime(year + month // 12, month % 12 + 1, 1)
+
+
+class Ledger:
+    """
+    Ghi và đọc sổ cái của một bộ model. Mọi hàm ghi đều chưa commit, để nằm chung transaction
+    với dòng nguồn (giao dịch, thanh toán...) vừa thêm
+    """
+
+    def __init__(self, db, NguoiDung, SoCai, SoDuThang, sources):
+        self.db = db
+        self.NguoiDung = NguoiDung
+        self.SoCai = SoCai
+        self.SoDuThang = SoDuThang
+        self.sources = sources
+
+    def _insert(self, user_id, entries):
+        """entries: [(nguon, nguon_id, so_tien, ngày của nguồn)], bỏ dòng 0 đồng"""
+        rows = [{'nguoi_dung_id': user_id, 'nguon': nguon, 'nguon_id': nguon_id, 'so_tien': so_tien,
+                 'ngay_ghi': ngay or datetime.utcnow()}
+                for nguon, nguon_id, so_tien, ngay in entries if so_tien]
+        if not rows:
+            return rows
+        self.db.session.bulk_insert_mappings(self.SoCai, rows)
+        # Tháng hiện tại chưa có ảnh chụp; dòng ghi lùi về tháng trước thì bỏ ảnh chụp từ tháng đó trở đi
+        earliest = min(row['ngay_ghi'] for row in rows)
+        if earliest < month_start(datetime.utcnow()):
+            self.SoDuThang.query.filter(
+                self.SoDuThang.nguoi_dung_id == user_id, self.SoDuThang.thang >= earliest.strftime('%Y-%m')
+            ).delete(synchronize_session=False)
+        return rows
+
+    def post(self, user_id, entries):
+        """Ghi các dòng [(nguon, nguon_id, so_tien, ngày)] và cộng tổng vào so_du bằng một UPDATE; trả về số dư mới"""
+        # UPDATE số dư trước để giữ khóa dòng user: ghi sổ và bỏ ảnh chụp không đua với reconcile
+        so_du = adjust_balance(self.db, self.NguoiDung, user_id, sum(e[2] for e in entries))
+        self._insert(user_id, entries)
+        return so_du
+
+    def open(self, user_id, so_du):
+        """Dòng số dư đầu (so_du đã ghi thẳng vào nguoi_dung lúc đăng ký); 0 đồng vẫn ghi để đánh dấu đã mở sổ"""
+        self.db.session.add(self.SoCai(
+            nguoi_dung_id=user_id, nguon=NGUON_SO_DU_DAU, so_tien=so_du, ngay_ghi=SO_DU_DAU_NGAY
+        ))
+
+    def balance_at(self, user_id, at=None):
+        """Số dư theo sổ cái trước thời điểm at theo ngày của nguồn (None: hiện tại) = ảnh chụp gần nhất + các dòng sau đó"""
+        SoCai, SoDuThang = self.SoCai, self.SoDuThang
+        snapshot = SoDuThang.query.filter(SoDuThang.nguoi_dung_id == user_id)
+        if at is not None:
+            snapshot = snapshot.filter(SoDuThang.thang < at.strftime('%Y-%m'))
+        snapshot = snapshot.order_by(SoDuThang.thang.desc()).first()
+
+        tail = self.db.session.query(money_sum(SoCai.so_tien)).filter(SoCai.nguoi_dung_id == user_id)
+        if snapshot:
+            tail = tail.filter(SoCai.ngay_ghi >= next_month(snapshot.thang))
+        if at is not None:
+            tail = tail.filter(SoCai.ngay_ghi < at)
+        return (snapshot.so_du if snapshot else 0) + tail.scalar()
+
+    def _monthly(self, user_id, since, until):
+        """[(thang, tổng, số dòng)] của sổ cái trong [since, until), tăng dần theo tháng"""
+        SoCai = self.SoCai
+        thang = period_expression(self.db, SoCai.ngay_ghi, 'month')
+        query = self.db.session.query(thang, money_sum(SoCai.so_tien), func.count(SoCai.id)).filter(
+            SoCai.nguoi_dung_id == user_id, SoCai.ngay_ghi < until
+        )
+        if since:
+            query = query.filter(SoCai.ngay_ghi >= since)
+        return sorted(query.group_by(thang).all())
+
+    def take_snapshots(self, user_id, now=None):
+        """Chụp các tháng đã kết thúc (quá SNAPSHOT_GRACE) sau ảnh chụp cuối; chỉ tháng có dòng mới có ảnh. Trả về số ảnh"""
+        SoDuThang = self.SoDuThang
+        limit = month_start((now or datetime.utcnow()) - SNAPSHOT_GRACE)
+        last = SoDuThang.query.filter_by(nguoi_dung_id=user_id).order_by(SoDuThang.thang.desc()).first()
+        since = next_month(last.thang) if last else None
+        if since and since >= limit:
+            return 0
+
+        so_du = last.so_du if last else 0
+        months = self._monthly(user_id, since, limit)
+        for thang, tong, so_dong in months:
+            so_du += tong
+            self.db.session.add(SoDuThang(
+                nguoi_dung_id=user_id, thang=thang, so_du=so_du, so_but_toan=so_dong, created_at=datetime.utcnow()
+            ))
+        return len(months)
+
+    def _bad_snapshots(self, user_id):
+        """Số ảnh chụp không khớp khi cộng lại từ đầu sổ cái"""
+        stored = {s.thang: (s.so_du, s.so_but_toan) for s in self.SoDuThang.query.filter_by(nguoi_dung_id=user_id)}
+        if not stored:
+            return 0
+        expected, so_du = {}, 0
+        for thang, tong, so_dong in self._monthly(user_id, None, next_month(max(stored))):
+            so_du += tong
+            expected[thang] = (so_du, so_dong)
+        return sum(1 for thang, value in stored.items() if expected.get(thang) != value)
+
+    def _missing_entries(self, user_id):
+        """
+        Dòng cần ghi thêm để tổng sổ cái của từng nguồn khớp bảng nguồn hiện tại:
+        nguồn chưa có dòng, số tiền đã đổi, hoặc nguồn đã bị xóa mà chưa có dòng đảo.
+        Ghi theo ngày của nguồn; dòng đảo cho nguồn đã xóa lấy ngày của dòng đầu tiên của nguồn đó
+        """
+        SoCai = self.SoCai
+        posted = {(nguon, nguon_id): (tong, ngay) for nguon, nguon_id, tong, ngay in self.db.session.query(
+            SoCai.nguon, SoCai.nguon_id, money_sum(SoCai.so_tien), func.min(SoCai.ngay_ghi)
+        ).filter(
+            SoCai.nguoi_dung_id == user_id, SoCai.nguon.in_(list(self.sources))
+        ).group_by(SoCai.nguon, SoCai.nguon_id)}
+
+        entries = []
+        for nguon, load in self.sources.items():
+            for nguon_id, delta, ngay in load(self.db, user_id):
+                tong, _ = posted.pop((nguon, nguon_id), (0, None))
+                if delta != tong:
+                    entries.append((nguon, nguon_id, delta - tong, ngay))
+        for (nguon, nguon_id), (tong, ngay) in posted.items():
+            if tong:
+                entries.append((nguon, nguon_id, -tong, ngay))
+        return entries
+
+    def reconcile(self, user_id, fix=False, full=False, now=None):
+        """
+        Đối soát một user trong một transaction, giữ khóa dòng user nên không đua với request ghi:
+        - so_du so với ảnh chụp gần nhất + các dòng sau đó (lệch thì kiểm tra lại các ảnh chụp)
+        - full: thêm bảng nguồn so với sổ cái, ảnh chụp so với cộng lại từ đầu
+        - user cũ chưa mở sổ: ghi các nguồn theo ngày của chúng + dòng số dư đầu để sổ cái khớp so_du hiện tại
+        fix: sửa (sổ cái là chuẩn: ghi dòng còn thiếu, chụp lại ảnh sai, đặt so_du theo sổ cái),
+        chụp các tháng mới kết thúc rồi commit; không fix thì rollback. Trả về dict kết quả (None nếu không có user)
+        """
+        db, SoCai = self.db, self.SoCai
+        try:
+            so_du = adjust_balance(db, self.NguoiDung, user_id, 0)
+            if so_du is None:
+                return None
+
+            opened = db.session.query(SoCai.id).filter_by(nguoi_dung_id=user_id, nguon=NGUON_SO_DU_DAU).first()
+            result = {'nguoi_dung_id': user_id, 'so_du': so_du, 'mo_so': not opened,
+                      'thieu_but_toan': 0, 'anh_chup_sai': 0, 'lech': 0, 'da_sua': False}
+
+            if not opened:
+                # Số dư đầu = so_du hiện tại trừ mọi nguồn; ảnh chụp cũ (nếu có) không còn đúng
+                missing = self._missing_entries(user_id)
+                result['thieu_but_toan'] = len(missing)
+                if fix:
+                    self._insert(user_id, missing)
+                    total = db.session.query(money_sum(SoCai.so_tien)).filter(SoCai.nguoi_dung_id == user_id).scalar()
+                    self.open(user_id, so_du - total)
+                    self.SoDuThang.query.filter_by(nguoi_dung_id=user_id).delete(synchronize_session=False)
+            else:
+                lech = so_du - self.balance_at(user_id)
+                if full or lech:
+                    # Lệch thì kiểm tra ảnh chụp trước khi tin sổ cái; ảnh sai thì bỏ hết (fix sẽ chụp lại)
+                    result['anh_chup_sai'] = self._bad_snapshots(user_id)
+                    if result['anh_chup_sai']:
+                        self.SoDuThang.query.filter_by(nguoi_dung_id=user_id).delete(synchronize_session=False)
+                        lech = so_du - self.balance_at(user_id)
+                result['lech'] = lech
+                if full:
+                    missing = self._missing_entries(user_id)
+                    result['thieu_but_toan'] = len(missing)
+                    if fix:
+                        self._insert(user_id, missing)
+
+            if not fix:
+                return result
+
+            db.session.flush()
+            ledger_so_du = self.balance_at(user_id)
+            if ledger_so_du != so_du:
+                adjust_balance(db, self.NguoiDung, user_id, ledger_so_du - so_du)
+            self.take_snapshots(user_id, now)
+            db.session.commit()
+            result['da_sua'] = bool(result['mo_so'] or result['thieu_but_toan'] or result['anh_chup_sai'] or result['lech'])
+            result['so_du'] = ledger_so_du
+            return result
+        finally:
+            db.session.rollback()
@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+"""
+Điền giao_dich.nguoi_dung_id (chủ của danh mục) cho giao dịch cũ theo lô, commit mỗi lô.
+App chỉ thêm cột lúc khởi động, không điền: chạy script này sau khi deploy lên database cũ
+(giao dịch chưa điền không hiện trong danh sách/thống kê của user cho tới khi chạy).
+Chỉ điền dòng còn trống nên chạy lại nhiều lần không sao:
+    python migrate_giao_dich_owner.py
+    python migrate_giao_dich_owner.py 20000     # số dòng mỗi lô
+"""
+
+import sys
+from app import app, db
+from transaction_owner import BACKFILL_BATCH, backfill_owner, ensure_owner_column
+
+def migrate(batch=BACKFILL_BATCH):
+    with app.app_context():
+        db.create_all()
+        ensure_owner_column(db)
+        done = backfill_owner(db, batch, progress=lambda n: print(f"  ... {n} giao dịch"))
+        print(f"✅ Đã điền nguoi_dung_id cho {done} giao dịch")
+
+if __name__ == "__main__":
+    migrate(int(sys.argv[1]) if len(sys.argv) > 1 else BACKFILL_BATCH)
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""
+Tạo trên database có sẵn các index khai báo trong model (db_indexes.py)
+app.py cũng tự chạy bước này lúc khởi động; chạy tay trước khi deploy khi bảng lớn:
+    python migrate_indexes.py
+"""
+
+from app import app, db
+from db_indexes import ensure_indexes
+
+def migrate():
+    with app.app_context():
+        db.create_all()
+        created = ensure_indexes(db)
+        for name in created:
+            print(f"  + {name}")
+        print(f"✅ Đã tạo {len(created)} index")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""
+Đổi các cột tiền cũ (FLOAT) sang số nguyên đồng (money.py):
+PostgreSQL đổi kiểu cột sang BIGINT, SQLite làm tròn giá trị đang lưu. Chạy lại không sao.
+Không chạy lúc khởi động vì ALTER COLUMN khóa bảng; chạy tay trước khi deploy:
+    python migrate_money.py
+"""
+
+from app import app, db
+from money import migrate_money_columns
+
+def migrate():
+    with app.app_context():
+        db.create_all()
+        done = migrate_money_columns(db)
+        for table, column, rows in done:
+            print(f"  ~ {table}.{column}" + (f": làm tròn {rows} dòng" if rows is not None else ": BIGINT"))
+        print(f"✅ Đã kiểm tra {len(done)} cột tiền")
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Tách sản phẩm trong chuỗi JSON hoa_don.san_pham ra bảng san_pham_hoa_don (dữ liệu cũ)
+Chỉ xử lý hóa đơn chưa có dòng nào nên chạy lại nhiều lần không bị nhân đôi:
+    python migrate_receipt_items.py
+"""
+
+from app import app, db, HoaDon, SanPhamHoaDon
+from receipt_items import add_items, items_from_json
+
+BATCH = 1000
+
+def migrate():
+    with app.app_context():
+        db.create_all()
+
+        done = db.session.query(SanPhamHoaDon.hoa_don_id).distinct()
+        query = db.session.query(HoaDon.id, HoaDon.san_pham).filter(
+            HoaDon.san_pham.isnot(None), HoaDon.id.notin_(done)
+        ).order_by(HoaDon.id)
+
+        # Đọc theo lô id tăng dần, commit mỗi lô
+        so_hoa_don = so_dong = 0
+        last_id = 0
+        while True:
+            rows = query.filter(HoaDon.id > last_id).limit(BATCH).all()
+            if not rows:
+                break
+            for hoa_don_id, san_pham in rows:
+                items = items_from_json(san_pham)
+                # JSON cũ chưa gắn danh mục nên không giữ danh_muc_id nào
+                add_items(db, SanPhamHoaDon, hoa_don_id, items, danh_muc_ids=set())
+                so_dong += len(items)
+            db.session.commit()
+            so_hoa_don += len(rows)
+            last_id = rows[-1].id
+
+        print(f"✅ Đã tách {so_dong} sản phẩm từ {so_hoa_don} hóa đơn")
+
+if __name__ == "__main__":
+    migrate()
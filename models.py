@@ -1,5 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from money import Money
+from transaction_owner import watch_owner
+from ledger import Ledger, ledger_sources
 
 db = SQLAlchemy()
 
@@ -16,10 +19,17 @@ class NguoiDung(db.Model):
     ho_ten = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(100), unique=True, nullable=False)
     mat_khau = db.Column(db.String(255), nullable=False)
-    so_du = db.Column(db.Float, default=0)
+    so_du = db.Column(Money, default=0)
     trang_thai = db.Column(db.String(20), default='Hoạt động')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Tìm theo tiền tố email/họ tên và sắp xếp danh sách admin (admin_queries.list_users)
+    __table_args__ = (
+        db.Index('idx_nguoi_dung_email_lower', db.func.lower(email)),
+        db.Index('idx_nguoi_dung_ho_ten_lower', db.func.lower(ho_ten)),
+        db.Index('idx_nguoi_dung_so_du', so_du),
+        db.Index('idx_nguoi_dung_created_at', created_at),
+    )
 
 class DanhMuc(db.Model):
     __tablename__ = 'danh_muc'
@@ -29,26 +39,44 @@ class DanhMuc(db.Model):
     ten_danh_muc = db.Column(db.String(100), nullable=False)
     mo_ta = db.Column(db.String(255))
     icon = db.Column(db.String(50))
-    gioi_han = db.Column(db.Float, default=0)
+    gioi_han = db.Column(Money, default=0)
+    
+    # Danh mục của user theo loại (Chi tiêu / Thu nhập)
+    __table_args__ = (
+        db.Index('idx_danh_muc_nguoi_dung_loai', 'nguoi_dung_id', 'loai_danh_muc'),
+    )
 
 class GiaoDich(db.Model):
     __tablename__ = 'giao_dich'
     id = db.Column(db.Integer, primary_key=True)
     danh_muc_id = db.Column(db.Integer, db.ForeignKey('danh_muc.id'), nullable=False)
-    so_tien = db.Column(db.Float, nullable=False)
+    # Chủ của danh mục, chép sang để lọc theo user không cần join (transaction_owner.py).
+    # Cho phép NULL: giao dịch mồ côi (danh mục đã bị xóa) và dòng cũ chưa chạy migrate_giao_dich_owner.py
+    nguoi_dung_id = db.Column(db.Integer, db.ForeignKey('nguoi_dung.id'), nullable=True)
+    so_tien = db.Column(Money, nullable=False)
     mo_ta = db.Column(db.String(255))
     ngay = db.Column(db.DateTime, default=datetime.utcnow)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Giao dịch của user / của danh mục trong khoảng ngày, sắp theo ngày
+    __table_args__ = (
+        db.Index('idx_giao_dich_nguoi_dung_ngay', 'nguoi_dung_id', 'ngay'),
+        db.Index('idx_giao_dich_danh_muc_ngay', 'danh_muc_id', 'ngay'),
+    )
 
 class TichLuy(db.Model):
     __tablename__ = 'tich_luy'
     id = db.Column(db.Integer, primary_key=True)
     nguoi_dung_id = db.Column(db.Integer, db.ForeignKey('nguoi_dung.id'), nullable=False)
     ten_tich_luy = db.Column(db.String(100), nullable=False)
-    so_tien_muc_tieu = db.Column(db.Float, nullable=False)
+    so_tien_muc_tieu = db.Column(Money, nullable=False)
     ngay_ket_thuc = db.Column(db.DateTime)
     trang_thai = db.Column(db.String(20), default='Đang thực hiện')
+    
+    __table_args__ = (
+        db.Index('idx_tich_luy_user', 'nguoi_dung_id'),
+    )
 
 class VayNo(db.Model):
     __tablename__ = 'vay_no'
@@ -57,22 +85,31 @@ class VayNo(db.Model):
     ho_ten_vay_no = db.Column(db.String(100), nullable=False)
     loai = db.Column(db.String(20), nullable=False)
     trang_thai = db.Column(db.String(20), default='Đang trả')
-    so_tien = db.Column(db.Float, nullable=False)
+    so_tien = db.Column(Money, nullable=False)
     lai_suat = db.Column(db.Float, default=0)
     ngay_vay_no = db.Column(db.DateTime, default=datetime.utcnow)
     han_tra = db.Column(db.DateTime)
     mo_ta = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Khoản vay của user theo trạng thái và hạn trả (nhắc nợ sắp đến hạn)
+    __table_args__ = (
+        db.Index('idx_vay_no_nguoi_dung_trang_thai_han_tra', 'nguoi_dung_id', 'trang_thai', 'han_tra'),
+    )
 
 class ThanhToan(db.Model):
     __tablename__ = 'thanh_toan'
     id = db.Column(db.Integer, primary_key=True)
     vay_no_id = db.Column(db.Integer, db.ForeignKey('vay_no.id'), nullable=False)
-    so_tien = db.Column(db.Float, nullable=False)
+    so_tien = db.Column(Money, nullable=False)
     mo_ta = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_thanh_toan_vay_no', 'vay_no_id'),
+    )
 
 class PhuongPhap(db.Model):
     __tablename__ = 'phuong_phap'
@@ -87,11 +124,15 @@ class LichSuTichLuy(db.Model):
     __tablename__ = 'lich_su_tich_luy'
     id = db.Column(db.Integer, primary_key=True)
     tich_luy_id = db.Column(db.Integer, db.ForeignKey('tich_luy.id'), nullable=False)
-    so_tien = db.Column(db.Float, nullable=False)
+    so_tien = db.Column(Money, nullable=False)
     ngay = db.Column(db.DateTime, default=datetime.utcnow)
     mo_ta = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_lich_su_tich_luy', 'tich_luy_id'),
+    )
 
 class DanhMucLoaiPhuongPhap(db.Model):
     __tablename__ = 'danh_muc_loai_phuong_phap'
@@ -106,3 +147,50 @@ class ThongTinPhuongPhap(db.Model):
     mdlpp_id = db.Column(db.Integer, db.ForeignKey('danh_muc_loai_phuong_phap.id'), nullable=False)
     loai = db.Column(db.String(50), nullable=False)
     mo_ta = db.Column(db.String(500), nullable=False)
+
+class ThongKeHeThong(db.Model):
+    """Thống kê hệ thống theo ngày cho admin (admin_stats.py)"""
+    __tablename__ = 'thong_ke_he_thong'
+    id = db.Column(db.Integer, primary_key=True)
+    ngay = db.Column(db.String(10), unique=True, nullable=False)  # 'YYYY-MM-DD'
+    so_giao_dich = db.Column(db.Integer, default=0)
+    tong_tien = db.Column(Money, default=0)
+    nguoi_dung_giao_dich = db.Column(db.Integer, default=0)  # số user có giao dịch trong ngày
+    tong_nguoi_dung = db.Column(db.Integer)
+    nguoi_dung_hoat_dong = db.Column(db.Integer)
+    tong_giao_dich = db.Column(db.Integer)
+    cap_nhat_luc = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SoCai(db.Model):
+    """Sổ cái số dư (ledger.py): mỗi thay đổi so_du một dòng, chỉ thêm không sửa/xóa"""
+    __tablename__ = 'so_cai'
+    id = db.Column(db.Integer, primary_key=True)
+    nguoi_dung_id = db.Column(db.Integer, db.ForeignKey('nguoi_dung.id'), nullable=False)
+    so_tien = db.Column(Money, nullable=False)  # dương: cộng vào số dư, âm: trừ
+    nguon = db.Column(db.String(20), nullable=False)  # giao_dich, vay_no, thanh_toan, lich_su_tich_luy, so_du_dau
+    nguon_id = db.Column(db.Integer)
+    ngay_ghi = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # ngày của nguồn
+    
+    __table_args__ = (
+        db.Index('idx_so_cai_nguoi_dung_ngay_ghi', 'nguoi_dung_id', 'ngay_ghi'),
+    )
+
+class SoDuThang(db.Model):
+    """Ảnh chụp số dư cuối tháng tính từ so_cai (ledger.py)"""
+    __tablename__ = 'so_du_thang'
+    id = db.Column(db.Integer, primary_key=True)
+    nguoi_dung_id = db.Column(db.Integer, db.ForeignKey('nguoi_dung.id'), nullable=False)
+    thang = db.Column(db.String(7), nullable=False)  # 'YYYY-MM'
+    so_du = db.Column(Money, nullable=False)
+    so_but_toan = db.Column(db.Integer, nullable=False)  # số dòng sổ cái trong tháng
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('nguoi_dung_id', 'thang', name='uq_so_du_thang'),
+    )
+
+# Giao dịch thêm mới / đổi danh mục tự lấy nguoi_dung_id theo danh mục
+watch_owner(GiaoDich, DanhMuc)
+
+# Sổ cái số dư: mọi chỗ đổi so_du ghi qua ledger.post
+ledger = Ledger(db, NguoiDung, SoCai, SoDuThang, ledger_sources(GiaoDich, DanhMuc, VayNo, ThanhToan, LichSuTichLuy, TichLuy))
@@ -0,0 +1,87 @@
+# money.py - Tiền lưu dạng số nguyên đơn vị nhỏ nhất; VND không có xu nên đơn vị là đồng, cột BIGINT
+# Cộng trừ, SUM trong SQL và tổng hợp trong ai_module đều là số nguyên nên không lệch như float
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from sqlalchemy import BigInteger, func, inspect, text, type_coerce
+from sqlalchemy.types import TypeDecorator
+
+# Giới hạn của cột BIGINT có dấu
+MONEY_MIN, MONEY_MAX = -2 ** 63, 2 ** 63 - 1
+
+def to_money(value):
+    """
+    Số tiền (int, float, Decimal, chuỗi '45000' / '45000.5') -> int đồng, làm tròn nửa lên;
+    sai hoặc ngoài khoảng BIGINT -> ValueError
+    """
+    if isinstance(value, bool):
+        raise ValueError('Số tiền không hợp lệ')
+    if isinstance(value, int):
+        amount = value
+    else:
+        try:
+            # Qua str để 0.1 thành Decimal('0.1') chứ không phải giá trị nhị phân của float
+            amount = value if isinstance(value, Decimal) else Decimal(str(value).strip())
+            if not amount.is_finite():
+                raise ValueError('Số tiền không hợp lệ')
+            # quantize báo InvalidOperation khi số quá lớn so với precision của context (vd: '1e30')
+            amount = int(amount.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+        except (InvalidOperation, ValueError):
+            raise ValueError('Số tiền không hợp lệ')
+    if not MONEY_MIN <= amount <= MONEY_MAX:
+        raise ValueError('Số tiền không hợp lệ')
+    return amount
+
+
+class Money(TypeDecorator):
+    """Cột tiền: ghi vào làm tròn về int, đọc ra luôn là int (kể cả cột FLOAT cũ chưa migrate, SUM numeric của Postgres)"""
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else to_money(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else to_money(value)
+
+
+def money_sum(expr):
+    """SUM của cột/biểu thức tiền, 0 khi không có dòng, đọc ra int"""
+    return type_coerce(func.coalesce(func.sum(expr), 0), Money())
+
+def money_columns(db):
+    """[(bảng, cột)] của mọi cột khai báo kiểu Money trong model"""
+    return [(table.name, column.name)
+            for table in db.metadata.sorted_tables
+            for column in table.columns if isinstance(column.type, Money)]
+
+def migrate_money_columns(db):
+    """
+    Đổi dữ liệu cột tiền cũ (FLOAT) sang số nguyên, chạy lại không sao. Trả về [(bảng, cột, số dòng)].
+    PostgreSQL: ALTER COLUMN ... TYPE BIGINT (làm tròn). SQLite không đổi được kiểu cột nên chỉ làm tròn giá trị;
+    cột FLOAT cũ vẫn trả số thực nguyên nhưng Money đọc ra int, database tạo mới đã là BIGINT
+    """
+    inspector = inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    dialect = db.engine.dialect.name
+    done = []
+    with db.engine.begin() as conn:
+        for table, column in money_columns(db):
+            if table not in tables:
+                continue
+            types = {c['name']: c['type'] for c in inspector.get_columns(table)}
+            if column not in types:
+                continue
+            if dialect == 'postgresql':
+                if isinstance(types[column], BigInteger):
+                    continue
+                conn.execute(text(
+                    f"ALTER TABLE {table} ALTER COLUMN {column} TYPE BIGINT USING round({column}::numeric)::bigint"
+                ))
+                done.append((table, column, None))
+            else:
+                result = conn.execute(text(
+                    f"UPDATE {table} SET {column} = CAST(round({column}) AS INTEGER) "
+                    f"WHERE {column} IS NOT NULL AND {column} != round({column})"
+                ))
+                done.append((table, column, result.rowcount))
+    return done
@@ -0,0 +1,49 @@
+# password_hasher.py - Băm/kiểm tra mật khẩu bcrypt trong pool giới hạn, quá tải thì từ chối ngay
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+
+class HasherBusy(Exception):
+    """Pool băm mật khẩu đã đầy, route nên trả 429"""
+
+
+class PasswordHasher:
+    """
+    bcrypt nhả GIL khi băm nên chạy trên thread pool riêng là đủ song song.
+    Tối đa max_workers phép băm chạy cùng lúc và max_pending phép chờ; vượt quá thì ném HasherBusy ngay.
+    Request đang băm hoặc đang chờ vẫn giữ thread của nó trong worker gunicorn, nên giới hạn chỉ có tác dụng
+    với worker gthread có số thread lớn hơn max_workers + max_pending (Procfile: --threads 8):
+    các thread còn lại luôn rảnh cho request khác thay vì cùng kẹt sau bcrypt.
+    Với worker sync (1 thread) mỗi process chỉ băm một mật khẩu một lúc và HasherBusy không bao giờ xảy ra.
+    rounds: work factor cho mật khẩu mới; hash cũ khác rounds được băm lại khi đăng nhập
+    """
+
+    def __init__(self, rounds=12, max_workers=2, max_pending=8, timeout=30):
+        self.rounds = rounds
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy('Hệ thống đang bận, vui lòng thử lại sau')
+        try:
+            return self._executor.submit(func, *args).result(timeout=self.timeout)
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        salt = bcrypt.gensalt(rounds=self.rounds)
+        return self._run(bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+    def verify(self, password, hashed):
+        return self._run(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed):
+        # Định dạng '$2b$12$...': phần thứ 3 là số rounds
+        try:
+            return int(hashed.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
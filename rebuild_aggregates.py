@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Dựng lại bảng tong_hop_thang từ giao_dich (backfill dữ liệu cũ)
+Chạy một lần sau khi deploy, hoặc khi nghi ngờ số liệu tổng hợp bị lệch:
+    python rebuild_aggregates.py          # tất cả người dùng
+    python rebuild_aggregates.py 3 7      # chỉ user 3 và 7
+"""
+
+import sys
+from collections import defaultdict
+from app import app, db, GiaoDich, TongHopThang
+
+def rebuild(user_ids=None):
+    with app.app_context():
+        db.create_all()
+
+        # Giao dịch mồ côi (danh mục đã xóa) không có chủ, bỏ qua như khi còn join danh_muc
+        query = db.session.query(
+            GiaoDich.nguoi_dung_id, GiaoDich.danh_muc_id, GiaoDich.ngay, GiaoDich.so_tien
+        ).filter(GiaoDich.nguoi_dung_id.isnot(None))
+        if user_ids:
+            query = query.filter(GiaoDich.nguoi_dung_id.in_(user_ids))
+
+        # Gộp trong bộ nhớ: chỉ giữ O(user × danh mục × tháng) dòng
+        tong = defaultdict(lambda: [0.0, 0])
+        for user_id, danh_muc_id, ngay, so_tien in query.yield_per(5000):
+            if not ngay:
+                continue
+            key = (user_id, danh_muc_id, ngay.strftime('%Y-%m'))
+            tong[key][0] += so_tien
+            tong[key][1] += 1
+
+        old = TongHopThang.query
+        if user_ids:
+            old = old.filter(TongHopThang.nguoi_dung_id.in_(user_ids))
+        old.delete(synchronize_session=False)
+
+        db.session.bulk_insert_mappings(TongHopThang, [{
+            'nguoi_dung_id': user_id,
+            'danh_muc_id': danh_muc_id,
+            'thang': thang,
+            'tong_tien': tong_tien,
+            'so_giao_dich': so_giao_dich
+        } for (user_id, danh_muc_id, thang), (tong_tien, so_giao_dich) in tong.items()])
+        db.session.commit()
+
+        print(f"✅ Đã dựng lại {len(tong)} dòng tong_hop_thang")
+
+if __name__ == "__main__":
+    rebuild([int(x) for x in sys.argv[1:]] or None)
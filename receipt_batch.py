@@ -0,0 +1,59 @@
+# receipt_batch.py - Lưu hóa đơn hàng loạt: kiểm tra từng dòng và chống lưu trùng theo hash nội dung
+import hashlib
+import re
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from money import to_money
+
+MAX_RECEIPTS = 100
+
+# Cột thêm sau vào hoa_don; database cũ được bổ sung lúc khởi động (db.create_all không thêm cột)
+HOA_DON_COLUMNS = {
+    'ma_noi_dung': 'VARCHAR(40)',
+    'giao_dich_id': 'INTEGER REFERENCES giao_dich(id)',
+}
+HASH_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS idx_hoa_don_ma_noi_dung ON hoa_don (nguoi_dung_id, ma_noi_dung)"
+
+def ensure_receipt_columns(db):
+    existing = {c['name'] for c in inspect(db.engine).get_columns('hoa_don')}
+    with db.engine.begin() as conn:
+        for name, ddl in HOA_DON_COLUMNS.items():
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE hoa_don ADD COLUMN {name} {ddl}"))
+        conn.execute(text(HASH_INDEX))
+
+def receipt_hash(ten_cua_hang, ngay, tong_tien, van_ban_goc):
+    """sha1 của cửa hàng + ngày + tổng tiền + văn bản gốc (chữ thường, gộp khoảng trắng)"""
+    # Giữ định dạng .2f cho tổng tiền (nay là int đồng) để hash của hóa đơn đã lưu vẫn khớp
+    normalized = re.sub(r'\s+', ' ', (van_ban_goc or '').lower()).strip()
+    raw = f"{ten_cua_hang.strip().lower()}|{ngay.strftime('%Y-%m-%d')}|{tong_tien:.2f}|{normalized}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def parse_receipt_row(row, now):
+    """Kiểm tra một hóa đơn {storeName, date, total, items, rawText}, trả về dict cột của hoa_don hoặc ValueError"""
+    if not isinstance(row, dict):
+        raise ValueError('Hóa đơn phải là object')
+    if not row.get('storeName') or not row.get('total'):
+        raise ValueError('Thiếu thông tin bắt buộc')
+
+    try:
+        tong_tien = to_money(row['total'])
+    except ValueError:
+        raise ValueError('total không hợp lệ')
+
+    try:
+        ngay = datetime.fromisoformat(row['date']) if row.get('date') else now
+    except (TypeError, ValueError):
+        raise ValueError('date không hợp lệ, dùng định dạng ISO (YYYY-MM-DD)')
+
+    ten_cua_hang = str(row['storeName'])
+    van_ban_goc = row.get('rawText') or ''
+    return {
+        'ten_cua_hang': ten_cua_hang,
+        'ngay_hoa_don': ngay,
+        'tong_tien': tong_tien,
+        'van_ban_goc': van_ban_goc,
+        'ma_noi_dung': receipt_hash(ten_cua_hang, ngay, tong_tien, van_ban_goc)
+    }
@@ -0,0 +1,116 @@
+# receipt_items.py - Dòng sản phẩm của hóa đơn (san_pham_hoa_don) tách khỏi chuỗi JSON hoa_don.san_pham
+# Hàm nhận db và class model làm tham số như các module truy vấn khác
+import json
+import re
+
+from sqlalchemy import func
+
+from money import money_sum, to_money
+from transaction_queries import parse_date_range
+
+MAX_PRODUCTS = 200
+
+THOUSANDS = re.compile(r'^\d{1,3}([.,]\d{3})+$')
+
+def parse_number(value, default):
+    if value in (None, ''):
+        return default
+    if isinstance(value, str):
+        value = value.strip().rstrip('đ₫').strip()
+        # "25.000" / "1,250,000" kiểu hóa đơn Việt Nam là dấu phân cách hàng nghìn
+        value = re.sub(r'[.,]', '', value) if THOUSANDS.match(value) else value.replace(',', '.')
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+def parse_price(value):
+    """Đơn giá -> int đồng, sai hoặc không có -> 0"""
+    try:
+        return to_money(parse_number(value, 0))
+    except ValueError:
+        return 0
+
+def parse_items(items):
+    """
+    Chuẩn hóa mảng items từ client/OCR: phần tử là chuỗi (chỉ tên) hoặc object
+    {name, quantity, price, danh_muc_id}; price là đơn giá. Bỏ qua dòng không có tên
+    """
+    if not isinstance(items, list):
+        return []
+    rows = []
+    for item in items:
+        if isinstance(item, str):
+            item = {'name': item}
+        if not isinstance(item, dict):
+            continue
+        ten = str(item.get('name') or item.get('ten_san_pham') or '').strip()
+        if not ten:
+            continue
+        danh_muc_id = item.get('danh_muc_id')
+        rows.append({
+            'ten_san_pham': ten[:200],
+            'so_luong': parse_number(item.get('quantity', item.get('so_luong')), 1),
+            'don_gia': parse_price(item.get('price', item.get('don_gia'))),
+            'danh_muc_id': int(danh_muc_id) if str(danh_muc_id or '').isdigit() else None
+        })
+    return rows
+
+def items_from_json(san_pham):
+    """Đọc chuỗi JSON cũ của hoa_don.san_pham (JSON hỏng -> không có dòng nào)"""
+    try:
+        return parse_items(json.loads(san_pham)) if san_pham else []
+    except ValueError:
+        return []
+
+def add_items(db, SanPhamHoaDon, hoa_don_id, rows, danh_muc_ids=None):
+    """Thêm các dòng sản phẩm, chưa commit; danh_muc_id không thuộc danh_muc_ids thì bỏ liên kết"""
+    mappings = []
+    for row in rows:
+        row = dict(row, hoa_don_id=hoa_don_id)
+        if danh_muc_ids is not None and row['danh_muc_id'] not in danh_muc_ids:
+            row['danh_muc_id'] = None
+        mappings.append(row)
+    if mappings:
+        db.session.bulk_insert_mappings(SanPhamHoaDon, mappings)
+
+def serialize_item(item):
+    return {
+        'name': item.ten_san_pham,
+        'quantity': item.so_luong,
+        'price': item.don_gia,
+        'danh_muc_id': item.danh_muc_id
+    }
+
+def product_spending(db, HoaDon, SanPhamHoaDon, user_id, args):
+    """
+    Chi tiêu theo sản phẩm (gộp theo tên, không phân biệt hoa thường), nhiều tiền nhất trước.
+    Tham số: tu_ngay, den_ngay (ngày hóa đơn), limit (mặc định 20, tối đa 200)
+    """
+    start, end = parse_date_range(args.get('tu_ngay'), args.get('den_ngay'))
+    try:
+        limit = max(1, min(int(args.get('limit', 20)), MAX_PRODUCTS))
+    except ValueError:
+        raise ValueError('limit không hợp lệ')
+
+    ten = func.lower(SanPhamHoaDon.ten_san_pham)
+    # so_luong có thể lẻ (1.5 kg) nên tích được làm tròn về đồng khi đọc ra
+    tong_tien = money_sum(SanPhamHoaDon.so_luong * SanPhamHoaDon.don_gia)
+    query = db.session.query(
+        func.min(SanPhamHoaDon.ten_san_pham).label('ten_san_pham'),
+        func.count(func.distinct(SanPhamHoaDon.hoa_don_id)).label('so_hoa_don'),
+        func.sum(SanPhamHoaDon.so_luong).label('so_luong'),
+        tong_tien.label('tong_tien')
+    ).join(HoaDon, HoaDon.id == SanPhamHoaDon.hoa_don_id).filter(HoaDon.nguoi_dung_id == user_id)
+    if start:
+        query = query.filter(HoaDon.ngay_hoa_don >= start)
+    if end:
+        query = query.filter(HoaDon.ngay_hoa_don < end)
+
+    rows = query.group_by(ten).order_by(tong_tien.desc()).limit(limit).all()
+    return [{
+        'ten_san_pham': r.ten_san_pham,
+        'so_hoa_don': r.so_hoa_don,
+        'so_luong': float(r.so_luong or 0),
+        'tong_tien': r.tong_tien
+    } for r in rows]
@@ -0,0 +1,178 @@
+# receipt_parser.py - Phân tích văn bản OCR hóa đơn trên server (không gọi API ngoài)
+# Bộ luật regex biên dịch sẵn, kết quả xác định (cùng văn bản -> cùng kết quả) nên cache được theo hash
+import copy
+import hashlib
+import re
+import unicodedata
+from datetime import datetime
+
+# Đổi khi sửa luật để bỏ kết quả cũ trong cache
+PARSER_VERSION = 2
+MAX_BATCH = 100
+# Đơn giá nhỏ hơn coi là số nhiễu (số bàn, số nhà...), không phải sản phẩm
+MIN_PRICE = 500
+
+# Số tiền: 45.000 / 1,250,000 / 45000 (có thể kèm đ, vnd)
+MONEY = r'\d{1,3}(?:[.,]\d{3})+|\d+'
+MONEY_RE = re.compile(rf'(?<![\d.,])({MONEY})(?:\s*(?:đ|₫|vnd|d))?(?![\d.,])', re.I)
+
+DATE_RES = [
+    (re.compile(r'(?<!\d)(\d{4})[/\-.](\d{1,2})[/\-.](\d{1,2})(?!\d)'), ('y', 'm', 'd')),
+    (re.compile(r'(?<!\d)(\d{1,2})[/\-.](\d{1,2})[/\-.](\d{4}|\d{2})(?!\d)'), ('d', 'm', 'y')),
+]
+
+# Từ khóa so trên văn bản đã bỏ dấu (OCR hay mất dấu); thứ tự = độ ưu tiên khi tìm tổng tiền
+TOTAL_KEYWORDS = [re.compile(p) for p in (
+    r'tong\s*cong', r'tong\s*thanh\s*toan', r'thanh\s*toan', r'tong\s*tien',
+    r'\btotal\b', r'\btong\b', r'\bcong\b', r'thanh\s*tien'
+)]
+# Dòng không phải sản phẩm dù có số tiền
+NOT_ITEM_RE = re.compile(
+    r'tong|total|\bcong\b|thanh\s*toan|tien\s*(mat|thua|khach|tra)|giam\s*gia|chiet\s*khau|'
+    r'\bvat\b|thue|change|cash|subtotal|\bs?dt\b|dien\s*thoai|\btel\b|hotline|ngay|'
+    r'hoa\s*don|so\s*hd|ma\s*so|mst|\bban\b|thu\s*ngan|nhan\s*vien'
+)
+# Sản phẩm: "Tên  SL  Đơn giá  Thành tiền" / "Tên x2 20.000" / "Tên 2 x 10.000" / "Tên 2 x 10.000 20.000" / "Tên 25.000"
+ITEM_RES = [
+    re.compile(rf'^(?P<name>.*?[^\W\d_].*?)\s+(?P<qty>\d{{1,3}}(?:[.,]\d+)?)\s+(?P<price>{MONEY})\s+(?P<amount>{MONEY})$'),
+    re.compile(rf'^(?P<name>.*?[^\W\d_].*?)\s+[xX*]\s*(?P<qty>\d{{1,3}})\s+(?P<amount>{MONEY})$'),
+    re.compile(rf'^(?P<name>.*?[^\W\d_].*?)\s+(?P<qty>\d{{1,3}})\s*[xX*]\s*(?P<price>{MONEY})$'),
+    re.compile(rf'^(?P<name>.*?[^\W\d_].*?)\s+(?P<qty>\d{{1,3}})\s*[xX*]\s*(?P<price>{MONEY})\s+(?P<amount>{MONEY})$'),
+    re.compile(rf'^(?P<name>.*?[^\W\d_].*?)\s+(?P<amount>{MONEY})$'),
+]
+CURRENCY_SUFFIX_RE = re.compile(r'\s*(?:đ|₫|vnd)$', re.I)
+
+STORE_KEYWORDS = re.compile(
+    r'cua\s*hang|sieu\s*thi|shop|store|mart|market|cong\s*ty|\bco\.|ltd|cafe|ca\s*phe|coffee|restaurant|nha\s*hang|quan'
+)
+STORE_SKIP_RES = [re.compile(p, re.I) for p in (
+    r'^\d+$', r'^\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4}$', r'^\d{1,2}:\d{2}', r'hoa\s*don|bill|receipt',
+    r'^[\s\-_=/*.]+$', r'^\d+[,.]\d+$', r'tong|total|\bcong\b(?!\s*ty)|thanh\s*tien', r'^[a-z]\s[a-z]$',
+    r'^/\s', r'^(dt|dc|d/c|sdt|tel|mst|q\.|tp\.)[\s:.]', r'^(duong|phuong|quan|tp|thanh\s*pho|district)\b',
+    r'^\d+[\s,/]'
+)]
+STORE_JUNK_RE = re.compile(r'[\-_=/\\]{2,}')
+
+def fold(text):
+    """Chữ thường, bỏ dấu tiếng Việt (đ -> d) để so từ khóa"""
+    text = unicodedata.normalize('NFD', text.lower().replace('đ', 'd'))
+    return ''.join(c for c in text if unicodedata.category(c) != 'Mn')
+
+def parse_money(value):
+    value = CURRENCY_SUFFIX_RE.sub('', value.strip())
+    if re.fullmatch(r'\d{1,3}(?:[.,]\d{3})+', value):
+        value = re.sub(r'[.,]', '', value)
+    try:
+        return float(value.replace(',', '.'))
+    except ValueError:
+        return 0.0
+
+def find_date(text):
+    for pattern, order in DATE_RES:
+        for match in pattern.finditer(text):
+            parts = dict(zip(order, (int(g) for g in match.groups())))
+            if parts['y'] < 100:
+                parts['y'] += 2000
+            try:
+                return datetime(parts['y'], parts['m'], parts['d']).strftime('%Y-%m-%d')
+            except ValueError:
+                continue
+    return None
+
+def find_total(lines, folded):
+    for keyword in TOTAL_KEYWORDS:
+        for line, low in zip(lines, folded):
+            if keyword.search(low):
+                amounts = MONEY_RE.findall(line)
+                if amounts:
+                    # Số cuối dòng là số tiền ("Tổng cộng (2 món): 90.000")
+                    return parse_money(amounts[-1])
+    return None
+
+def find_items(lines, folded):
+    items = []
+    for line, low in zip(lines, folded):
+        if NOT_ITEM_RE.search(low):
+            continue
+        line = CURRENCY_SUFFIX_RE.sub('', line)
+        for pattern in ITEM_RES:
+            match = pattern.match(line)
+            if not match:
+                continue
+            groups = match.groupdict()
+            so_luong = float(groups['qty'].replace(',', '.')) if groups.get('qty') else 1.0
+            if groups.get('price'):
+                don_gia = parse_money(groups['price'])
+            else:
+                don_gia = parse_money(groups['amount']) / so_luong if so_luong else 0
+            name = groups['name'].strip(' .:-*')
+            if len(name) >= 2 and don_gia >= MIN_PRICE:
+                items.append({'name': name, 'quantity': so_luong, 'price': round(don_gia, 2)})
+            break
+    return items
+
+def find_store_name(lines, folded):
+    best, best_score = None, None
+    for i, (line, low) in enumerate(zip(lines[:10], folded[:10])):
+        if len(line) < 3 or len(line) > 60 or not re.search(r'[^\W\d_]', line):
+            continue
+        if any(p.search(low) for p in STORE_SKIP_RES):
+            continue
+        score = 10 - i
+        if STORE_KEYWORDS.search(low):
+            score += 10
+        # Tên cửa hàng thường in hoa toàn bộ và ít khi có số (địa chỉ, số điện thoại thì có)
+        if line.isupper():
+            score += 5
+        if re.search(r'\d', line):
+            score -= 5
+        if 2 <= len(line.split()) <= 5:
+            score += 3
+        # Bằng điểm thì lấy dòng trên cùng
+        if best_score is None or score > best_score:
+            best, best_score = line, score
+    return STORE_JUNK_RE.sub('', best).strip(' /\\') if best else None
+
+def parse_receipt(text):
+    """Văn bản OCR -> {storeName, date (YYYY-MM-DD hoặc None), total, items[{name, quantity, price}]}"""
+    lines = [re.sub(r'\s+', ' ', line).strip() for line in (text or '').splitlines()]
+    lines = [line for line in lines if line]
+    folded = [fold(line) for line in lines]
+
+    items = find_items(lines, folded)
+    total = find_total(lines, folded)
+    if total is None:
+        # Không có dòng tổng: cộng các sản phẩm
+        total = float(sum(item['quantity'] * item['price'] for item in items))
+
+    return {
+        'storeName': find_store_name(lines, folded) or 'Không xác định',
+        'date': find_date(text or ''),
+        'total': total,
+        'items': items
+    }
+
+
+class ReceiptParser:
+    """parse_receipt + cache kết quả theo sha1 văn bản (backend của response_cache.make_backend)"""
+
+    def __init__(self, backend=None, ttl=30 * 24 * 3600):
+        self.backend = backend
+        self.ttl = ttl
+
+    def key(self, text):
+        return f'receipt:v{PARSER_VERSION}:' + hashlib.sha1((text or '').encode('utf-8')).hexdigest()
+
+    def parse(self, text):
+        if not self.backend:
+            return parse_receipt(text)
+        key = self.key(text)
+        result = self.backend.get(key)
+        if result is None:
+            result = parse_receipt(text)
+            self.backend.set(key, result, self.ttl)
+        # Backend bộ nhớ trả lại đúng object đang cache, không để người gọi sửa vào
+        return copy.deepcopy(result)
+
+    def parse_many(self, texts):
+        return [self.parse(text) for text in texts]
@@ -0,0 +1,118 @@
+# receipt_search.py - Tìm kiếm toàn văn hóa đơn (hoa_don): tên cửa hàng, tên sản phẩm, văn bản gốc
+# SQLite: bảng ảo FTS5 hoa_don_fts giữ đồng bộ bằng trigger
+# PostgreSQL: index GIN trên to_tsvector (không cần bảng phụ)
+import re
+
+from sqlalchemy import column, func, literal_column, table, text
+from sqlalchemy.orm import defer
+
+from admin_queries import parse_paging
+from transaction_queries import parse_date_range
+
+# remove_diacritics 2: "pho" khớp "Phở", "ca phe" khớp "Cà phê"
+SQLITE_FTS = "CREATE VIRTUAL TABLE hoa_don_fts USING fts5(" \
+             "ten_cua_hang, san_pham, van_ban_goc, tokenize = 'unicode61 remove_diacritics 2')"
+
+# Chỉ lấy tên sản phẩm trong JSON san_pham, bỏ qua JSON hỏng
+SQLITE_ITEMS = "CASE WHEN json_valid({row}.san_pham) THEN (" \
+               "SELECT group_concat(json_extract(value, '$.name'), ' ') " \
+               "FROM json_each({row}.san_pham) WHERE type = 'object') END"
+
+SQLITE_INSERT = "INSERT INTO hoa_don_fts(rowid, ten_cua_hang, san_pham, van_ban_goc) " \
+                "VALUES ({row}.id, {row}.ten_cua_hang, " + SQLITE_ITEMS + ", {row}.van_ban_goc);"
+
+SQLITE_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS hoa_don_fts_ai AFTER INSERT ON hoa_don BEGIN "
+    + SQLITE_INSERT.format(row='NEW') + " END",
+    "CREATE TRIGGER IF NOT EXISTS hoa_don_fts_ad AFTER DELETE ON hoa_don BEGIN "
+    "DELETE FROM hoa_don_fts WHERE rowid = OLD.id; END",
+    "CREATE TRIGGER IF NOT EXISTS hoa_don_fts_au AFTER UPDATE ON hoa_don BEGIN "
+    "DELETE FROM hoa_don_fts WHERE rowid = OLD.id; " + SQLITE_INSERT.format(row='NEW') + " END",
+]
+
+# Câu truy vấn phải dùng đúng biểu thức này thì PostgreSQL mới dùng index
+PG_VECTOR = "to_tsvector('simple', coalesce(ten_cua_hang, '') || ' ' || " \
+            "coalesce(san_pham, '') || ' ' || coalesce(van_ban_goc, ''))"
+PG_INDEX = f"CREATE INDEX IF NOT EXISTS idx_hoa_don_fts ON hoa_don USING GIN ({PG_VECTOR})"
+
+hoa_don_fts = table('hoa_don_fts', column('rowid'), column('rank'))
+
+def ensure_search_index(db):
+    """Tạo chỉ mục tìm kiếm nếu chưa có (gọi sau db.create_all()); lần đầu nạp sẵn hóa đơn cũ"""
+    dialect = db.engine.dialect.name
+    with db.engine.begin() as conn:
+        if dialect == 'postgresql':
+            conn.execute(text(PG_INDEX))
+        elif dialect == 'sqlite':
+            exists = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'hoa_don_fts'"
+            )).first()
+            if not exists:
+                conn.execute(text(SQLITE_FTS))
+                conn.execute(text(
+                    "INSERT INTO hoa_don_fts(rowid, ten_cua_hang, san_pham, van_ban_goc) "
+                    "SELECT hoa_don.id, hoa_don.ten_cua_hang, " + SQLITE_ITEMS.format(row='hoa_don')
+                    + ", hoa_don.van_ban_goc FROM hoa_don"
+                ))
+            for trigger in SQLITE_TRIGGERS:
+                conn.execute(text(trigger))
+
+def search_terms(search):
+    """Tách từ khóa người dùng gõ thành các từ (bỏ ký tự đặc biệt của cú pháp MATCH/tsquery)"""
+    return re.findall(r'\w+', (search or '').lower())
+
+def parse_amount(value, name):
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f'{name} không hợp lệ')
+
+def search_receipts(db, HoaDon, user_id, args):
+    """
+    Tham số (query string):
+      search               - từ khóa (khớp tiền tố mọi từ), kết quả xếp theo độ liên quan
+      tu_ngay, den_ngay    - lọc ngay_hoa_don (ISO)
+      min_tien, max_tien   - lọc tong_tien
+      page, per_page       - phân trang (mặc định 1, 50)
+    Không có search thì xếp mới nhất trước. Trả về (rows, total); tham số sai -> ValueError
+    """
+    page, per_page = parse_paging(args)
+    # Danh sách không cần hai cột văn bản lớn
+    query = HoaDon.query.options(defer(HoaDon.san_pham), defer(HoaDon.van_ban_goc)).filter(
+        HoaDon.nguoi_dung_id == user_id
+    )
+
+    start, end = parse_date_range(args.get('tu_ngay'), args.get('den_ngay'))
+    if start:
+        query = query.filter(HoaDon.ngay_hoa_don >= start)
+    if end:
+        query = query.filter(HoaDon.ngay_hoa_don < end)
+
+    min_tien = parse_amount(args.get('min_tien'), 'min_tien')
+    max_tien = parse_amount(args.get('max_tien'), 'max_tien')
+    if min_tien is not None:
+        query = query.filter(HoaDon.tong_tien >= min_tien)
+    if max_tien is not None:
+        query = query.filter(HoaDon.tong_tien <= max_tien)
+
+    order = [HoaDon.created_at.desc(), HoaDon.id.desc()]
+    terms = search_terms(args.get('search'))
+    if terms:
+        if db.engine.dialect.name == 'postgresql':
+            tsquery = func.to_tsquery(literal_column("'simple'"), ' & '.join(f'{t}:*' for t in terms))
+            vector = literal_column(PG_VECTOR)
+            query = query.filter(vector.op('@@')(tsquery))
+            order.insert(0, func.ts_rank(vector, tsquery).desc())
+        else:
+            match = ' '.join(f'"{t}"*' for t in terms)
+            query = query.join(hoa_don_fts, hoa_don_fts.c.rowid == HoaDon.id).filter(
+                literal_column('hoa_don_fts').op('MATCH')(match)
+            )
+            # rank của FTS5 là bm25, càng nhỏ càng liên quan
+            order.insert(0, hoa_don_fts.c.rank)
+
+    total = query.order_by(None).count()
+    rows = query.order_by(*order).offset((page - 1) * per_page).limit(per_page).all()
+    return rows, total
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Đối soát nguoi_dung.so_du với sổ cái (ledger.py) cho mọi user, song song nhiều thread.
+Lần đầu chạy --fix sẽ mở sổ cho user cũ (ghi lại nguồn cũ + dòng số dư đầu, giữ nguyên so_du).
+Nên chạy --fix định kỳ (cron đầu tháng) để chụp số dư các tháng vừa kết thúc:
+    python reconcile.py                         # app.py, chỉ kiểm tra; exit 1 nếu có user lệch
+    python reconcile.py app_full --fix          # sửa theo sổ cái rồi chụp tháng mới
+    python reconcile.py --full --workers 8      # kiểm tra thêm bảng nguồn và ảnh chụp từ đầu sổ
+    python reconcile.py app_complete --user 42
+"""
+
+import importlib
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+def option(name, default=None):
+    """Giá trị sau cờ --name trong sys.argv"""
+    if name in sys.argv[:-1]:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
+
+def main():
+    values = {option('--workers'), option('--user')}
+    argv = [a for a in sys.argv[1:] if not a.startswith('--') and a not in values]
+    fix, full = '--fix' in sys.argv, '--full' in sys.argv
+    workers = int(option('--workers', 4))
+
+    module = importlib.import_module(argv[0] if argv else 'app')
+    app, db = module.app, module.db
+    # app_complete dùng model và sổ cái trong models.py
+    ledger = getattr(module, 'ledger', None) or importlib.import_module('models').ledger
+
+    with app.app_context():
+        db.create_all()
+        if option('--user'):
+            user_ids = [int(option('--user'))]
+        else:
+            user_ids = [id for id, in db.session.query(ledger.NguoiDung.id).order_by(ledger.NguoiDung.id)]
+
+    def run(user_id):
+        # Mỗi thread một app context nên một session riêng
+        with app.app_context():
+            return ledger.reconcile(user_id, fix=fix, full=full)
+
+    with ThreadPoolExecutor(workers) as pool:
+        results = [r for r in pool.map(run, user_ids) if r]
+
+    bad = [r for r in results if r['mo_so'] or r['thieu_but_toan'] or r['anh_chup_sai'] or r['lech']]
+    for r in bad:
+        print(f"  {'~' if fix else '!'} user {r['nguoi_dung_id']}: so_du {r['so_du']:,}"
+              + (", chưa mở sổ" if r['mo_so'] else '')
+              + (f", thiếu {r['thieu_but_toan']} dòng sổ cái" if r['thieu_but_toan'] else '')
+              + (f", {r['anh_chup_sai']} ảnh chụp sai" if r['anh_chup_sai'] else '')
+              + (f", lệch {r['lech']:,}" if r['lech'] else ''))
+
+    if fix:
+        print(f"✅ Đã đối soát {len(results)} user, sửa {sum(1 for r in results if r['da_sua'])}")
+    elif bad:
+        print(f"❌ {len(bad)}/{len(results)} user lệch sổ cái, chạy lại với --fix để sửa")
+        sys.exit(1)
+    else:
+        print(f"✅ {len(results)} user khớp sổ cái")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+"""
+Tính lại bảng thong_ke_he_thong (thống kê admin theo ngày) từ giao_dich
+app_admin.py tự làm mới hôm nay định kỳ; script này dùng để backfill lịch sử:
+    python refresh_admin_stats.py          # 30 ngày gần nhất
+    python refresh_admin_stats.py 365      # 1 năm
+"""
+
+import sys
+from app import app, db, NguoiDung, GiaoDich, ThongKeHeThong
+from admin_stats import refresh_snapshot
+
+if __name__ == "__main__":
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    with app.app_context():
+        db.create_all()
+        refresh_snapshot(db, NguoiDung, GiaoDich, ThongKeHeThong, days=days)
+    print(f"✅ Đã tính lại thong_ke_he_thong cho {days} ngày")
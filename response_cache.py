@@ -0,0 +1,285 @@
+# response_cache.py - Cache response GET theo user (LRU + TTL, backend có thể thay thế) và ETag theo phiên bản dữ liệu
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+
+from flask import make_response, request
+from flask_jwt_extended import get_jwt_identity
+
+
+class MemoryCacheBackend:
+    """LRU trong bộ nhớ của process: chỉ đúng khi chạy một worker (worker khác không thấy lần xóa cache)"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        # Số phiên bản mất khi restart -> epoch mới để không trùng với ETag cũ của client
+        self.epoch = uuid.uuid4().hex[:8]
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return None
+            if entry[1] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def version(self, scope):
+        with self._lock:
+            return self._versions.get(scope, 0)
+
+    def bump(self, scope):
+        with self._lock:
+            self._versions[scope] = self._versions.get(scope, 0) + 1
+
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """Cache dùng chung qua file SQLite để mọi worker gunicorn thấy cùng dữ liệu và cùng lần xóa cache"""
+
+    def __init__(self, path, max_entries=1024):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS response_cache ('
+                'key TEXT PRIMARY KEY, value TEXT, expires_at REAL, used_at REAL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS response_cache_version ('
+                'scope TEXT PRIMARY KEY, version INTEGER)'
+            )
+            # Số phiên bản còn nguyên sau restart; file bị xóa/tạo lại thì epoch mới để không trùng ETag cũ
+            conn.execute('CREATE TABLE IF NOT EXISTS response_cache_epoch (epoch TEXT)')
+            conn.execute(
+                'INSERT INTO response_cache_epoch SELECT ? WHERE NOT EXISTS (SELECT 1 FROM response_cache_epoch)',
+                (uuid.uuid4().hex[:8],)
+            )
+            self.epoch = conn.execute('SELECT epoch FROM response_cache_epoch').fetchone()[0]
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, key):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT value FROM response_cache WHERE key = ? AND expires_at >= ?', (key, now)
+            ).fetchone()
+            if row:
+                conn.execute('UPDATE response_cache SET used_at = ? WHERE key = ?', (now, key))
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value), now + ttl, now)
+            )
+            # Bỏ dòng hết hạn và dòng ít dùng nhất khi vượt giới hạn
+            conn.execute('DELETE FROM response_cache WHERE expires_at < ?', (now,))
+            conn.execute(
+                'DELETE FROM response_cache WHERE key IN ('
+                'SELECT key FROM response_cache ORDER BY used_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+
+    def version(self, scope):
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT version FROM response_cache_version WHERE scope = ?', (scope,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, scope):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                'INSERT INTO response_cache_version VALUES (?, 1) '
+                'ON CONFLICT(scope) DO UPDATE SET version = version + 1', (scope,)
+            )
+
+    def size(self):
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM response_cache').fetchone()[0]
+
+
+def shared_store(database_url):
+    """
+    File SQLite mặc định trong thư mục tạm: mọi worker gunicorn cùng máy dùng chung,
+    mỗi database một file để cache của database này không lẫn sang database khác
+    """
+    name = hashlib.sha1((database_url or '').encode('utf-8')).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f'response_cache_{name}.db')
+
+def make_backend(spec, max_entries=1024):
+    """'memory' -> MemoryCacheBackend, 'off' -> None (tắt cache), còn lại là đường dẫn file SQLite"""
+    if spec == 'off':
+        return None
+    if not spec or spec == 'memory':
+        return MemoryCacheBackend(max_entries=max_entries)
+    if spec.startswith('sqlite:///'):
+        spec = spec[len('sqlite:///'):]
+    return SQLiteCacheBackend(spec, max_entries=max_entries)
+
+
+class ResponseCache:
+    """
+    Cache response JSON của các route GET theo (route, user, query string).
+    Mỗi user có một số phiên bản; route ghi dữ liệu tăng số này nên
+    mọi khóa cũ của user đó hết hiệu lực ngay mà không phải quét xóa.
+    Dùng sau @jwt_required():
+        @response_cache.cached('thong-ke')      # route đọc
+        @response_cache.invalidates             # route ghi
+    """
+
+    def __init__(self, backend=None, ttl=60):
+        self.backend = backend
+        self.ttl = ttl
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _count(self, name, field):
+        with self._lock:
+            metric = self._metrics.setdefault(name, {'hits': 0, 'misses': 0})
+            metric[field] += 1
+
+    def _key(self, name, user_id):
+        version = self.backend.version(f'user:{user_id}')
+        args = '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+        return f'{name}:{user_id}:{version}:{args}'
+
+    def cached(self, name):
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.backend is None:
+                    return view(*args, **kwargs)
+
+                key = self._key(name, get_jwt_identity())
+                entry = self.backend.get(key)
+                if entry:
+                    self._count(name, 'hits')
+                    response = make_response(entry['body'], entry['status'])
+                    response.mimetype = entry['mimetype']
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                self._count(name, 'misses')
+                response = make_response(view(*args, **kwargs))
+                # Chỉ cache kết quả thành công
+                if response.status_code == 200:
+                    self.backend.set(key, {
+                        'body': response.get_data(as_text=True),
+                        'status': response.status_code,
+                        'mimetype': response.mimetype
+                    }, self.ttl)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+    def invalidates(self, view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            response = make_response(view(*args, **kwargs))
+            if self.backend is not None and response.status_code < 400:
+                self.invalidate(get_jwt_identity())
+            return response
+        return wrapper
+
+    def invalidate(self, user_id):
+        if self.backend is not None:
+            self.backend.bump(f'user:{user_id}')
+
+    def stats(self):
+        with self._lock:
+            metrics = {name: dict(m) for name, m in self._metrics.items()}
+        hits = sum(m['hits'] for m in metrics.values())
+        misses = sum(m['misses'] for m in metrics.values())
+        return {
+            'enabled': self.backend is not None,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 4) if hits + misses else 0,
+            'entries': self.backend.size() if self.backend is not None else 0,
+            'routes': metrics
+        }
+
+
+class ResourceVersions:
+    """
+    Số phiên bản theo (user, tài nguyên), tăng mỗi khi route ghi thành công.
+    ETag của danh sách suy ra từ số này nên khi client gửi If-None-Match khớp
+    thì trả 304 ngay, không truy vấn dòng nào và không dựng JSON.
+    Dùng sau @jwt_required():
+        @resource_versions.conditional('danh-muc')   # route đọc danh sách
+        @resource_versions.bumps('danh-muc')         # route ghi
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+
+    def etag(self, resource, user_id):
+        version = self.backend.version(f'{resource}:{user_id}')
+        # Đường dẫn + query string nằm trong ETag vì mỗi bộ lọc là một danh sách khác
+        path = hashlib.sha1(request.full_path.encode('utf-8')).hexdigest()[:12]
+        return f'{resource}-{self.backend.epoch}-{version}-{path}'
+
+    def conditional(self, resource):
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.backend is None:
+                    return view(*args, **kwargs)
+
+                # Đọc phiên bản TRƯỚC khi truy vấn: ghi xen giữa chỉ làm ETag cũ hơn dữ liệu, không sai
+                etag = self.etag(resource, get_jwt_identity())
+                if request.if_none_match.contains_weak(etag):
+                    response = make_response('', 304)
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code not in (200, 304):
+                        return response
+
+                response.set_etag(etag, weak=True)
+                response.headers['Cache-Control'] = 'private, no-cache'
+                return response
+            return wrapper
+        return decorator
+
+    def bumps(self, *resources):
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                response = make_response(view(*args, **kwargs))
+                if self.backend is not None and response.status_code < 400:
+                    user_id = get_jwt_identity()
+                    for resource in resources:
+                        self.backend.bump(f'{resource}:{user_id}')
+                return response
+            return wrapper
+        return decorator
@@ -0,0 +1,77 @@
+# roles.py - Vai trò trong JWT claim + bảng vai_tro cache trong bộ nhớ, route admin không query DB mỗi lần
+import threading
+import time
+
+from sqlalchemy import event, inspect
+
+ADMIN = 'admin'
+# Dùng khi bảng vai_tro chưa có dữ liệu (id 1 luôn là admin như các script tạo admin)
+DEFAULT_ROLES = {1: ADMIN, 2: 'user'}
+
+
+class RoleCache:
+    """
+    Giữ trong bộ nhớ:
+    - bảng vai_tro {id: loai_vai_tro}, dùng để ghi claim 'vai_tro' lúc cấp token
+    - tập id user đang là admin, để token cũ của người đã bị hạ quyền hết tác dụng
+    Cả hai nạp lại sau refresh_interval giây, hoặc ngay lần đọc kế tiếp khi invalidate() được gọi
+    (watch() tự gọi khi vai_tro hay nguoi_dung.vai_tro_id thay đổi trong process này).
+    load_roles(): iterable (id, loai_vai_tro); load_admins(role_ids): iterable id user
+    """
+
+    def __init__(self, load_roles, load_admins, refresh_interval=60):
+        self.load_roles = load_roles
+        self.load_admins = load_admins
+        self.refresh_interval = refresh_interval
+        self._roles = dict(DEFAULT_ROLES)
+        self._admin_ids = set()
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def _refresh_if_stale(self):
+        if time.time() - self._loaded_at < self.refresh_interval:
+            return
+        with self._lock:
+            if time.time() - self._loaded_at < self.refresh_interval:
+                return
+            roles = dict(DEFAULT_ROLES)
+            roles.update(self.load_roles())
+            self._roles = roles
+            self._admin_ids = set(self.load_admins([id for id, ten in roles.items() if ten == ADMIN]))
+            self._loaded_at = time.time()
+
+    def role_name(self, vai_tro_id):
+        self._refresh_if_stale()
+        return self._roles.get(vai_tro_id)
+
+    def claims_for(self, user):
+        """additional_claims cho create_access_token"""
+        return {'vai_tro_id': user.vai_tro_id, 'vai_tro': self.role_name(user.vai_tro_id)}
+
+    def is_admin(self, user_id, claims):
+        # Claim cho biết token được cấp cho admin; tập admin_ids chặn token của người đã bị hạ quyền
+        if claims.get('vai_tro') != ADMIN or not user_id:
+            return False
+        self._refresh_if_stale()
+        return int(user_id) in self._admin_ids
+
+    def invalidate(self):
+        self._loaded_at = 0
+
+    def watch(self, VaiTro, NguoiDung):
+        """Hook: thêm/sửa/xóa vai trò, hoặc đổi vai_tro_id của user -> invalidate()"""
+        for name in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(VaiTro, name, lambda *args: self.invalidate())
+
+        # Thêm/xóa user thường không đổi tập admin, khỏi nạp lại mỗi lần đăng ký
+        def user_added_or_removed(mapper, connection, target):
+            if self._roles.get(target.vai_tro_id) == ADMIN:
+                self.invalidate()
+
+        def user_updated(mapper, connection, target):
+            if inspect(target).attrs.vai_tro_id.history.has_changes():
+                self.invalidate()
+
+        event.listen(NguoiDung, 'after_insert', user_added_or_removed)
+        event.listen(NguoiDung, 'after_delete', user_added_or_removed)
+        event.listen(NguoiDung, 'after_update', user_updated)
@@ -2,7 +2,12 @@ from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timedelta
 import bcrypt
-from models import db, NguoiDung, DanhMuc, GiaoDich, TichLuy, VayNo, ThanhToan
+from models import db, NguoiDung, DanhMuc, GiaoDich, TichLuy, VayNo, ThanhToan, ledger
+from transaction_queries import list_transactions
+from stats_queries import dashboard_summary
+from money import to_money
+from balance import balance_delta
+from ledger import NGUON_GIAO_DICH
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
 transaction_bp = Blueprint('transaction', __name__, url_prefix='/api')
@@ -21,17 +26,23 @@ def register():
     if NguoiDung.query.filter_by(email=data['email']).first():
         return jsonify({'message': 'Email đã tồn tại'}), 400
     
+    try:
+        so_du = to_money(data.get('so_du', 0))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
     hashed_password = bcrypt.hashpw(data['mat_khau'].encode('utf-8'), bcrypt.gensalt())
     
     user = NguoiDung(
         ho_ten=data['ho_ten'],
         email=data['email'],
         mat_khau=hashed_password.decode('utf-8'),
-        so_du=data.get('so_du', 0)
+        so_du=so_du
     )
     
     db.session.add(user)
     db.session.flush()  # Lấy user.id
+    ledger.open(user.id, so_du)
     
     # Tạo danh mục mặc định
     default_categories = [
@@ -73,7 +84,11 @@ def login():
     if user.trang_thai == 'Bị khóa':
         return jsonify({'message': 'Tài khoản đã bị khóa'}), 403
     
-    access_token = create_access_token(identity=user.id)
+    from api_routes import roles
+    
+    # Trạng thái và vai trò nằm trong token để app_complete khỏi query DB mỗi request
+    claims = {'trang_thai': user.trang_thai, **roles.claims_for(user)}
+    access_token = create_access_token(identity=str(user.id), additional_claims=claims)
     return jsonify({'access_token': access_token, 'user_id': user.id}), 200
 
 # Transaction Routes
@@ -87,38 +102,42 @@ def create_transaction():
     if not danh_muc:
         return jsonify({'message': 'Danh mục không tồn tại'}), 404
     
+    try:
+        so_tien = to_money(data['so_tien'])
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
     giao_dich = GiaoDich(
         danh_muc_id=data['danh_muc_id'],
-        so_tien=data['so_tien'],
+        nguoi_dung_id=danh_muc.nguoi_dung_id,
+        so_tien=so_tien,
         mo_ta=data.get('mo_ta', '')
     )
     
-    user = NguoiDung.query.get(user_id)
-    if danh_muc.loai_danh_muc == 'Chi tiêu':
-        user.so_du -= data['so_tien']
-    else:
-        user.so_du += data['so_tien']
-    
     db.session.add(giao_dich)
+    db.session.flush()
+    so_du_moi = ledger.post(user_id, [(NGUON_GIAO_DICH, giao_dich.id, balance_delta(danh_muc.loai_danh_muc, so_tien), giao_dich.ngay)])
     db.session.commit()
     
-    return jsonify({'message': 'Giao dịch thành công', 'so_du_moi': user.so_du}), 201
+    return jsonify({'message': 'Giao dịch thành công', 'so_du_moi': so_du_moi}), 201
 
 @transaction_bp.route('/giao-dich', methods=['GET'])
 @jwt_required()
 def get_transactions():
     user_id = get_jwt_identity()
-    danh_mucs = DanhMuc.query.filter_by(nguoi_dung_id=user_id).all()
-    danh_muc_ids = [dm.id for dm in danh_mucs]
     
-    giao_dichs = GiaoDich.query.filter(GiaoDich.danh_muc_id.in_(danh_muc_ids)).all()
+    try:
+        items, next_cursor = list_transactions(
+            GiaoDich, user_id, request.args,
+            default_fields=('id', 'so_tien', 'mo_ta', 'ngay')
+        )
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     
-    return jsonify([{
-        'id': g.id,
-        'so_tien': g.so_tien,
-        'mo_ta': g.mo_ta,
-        'ngay': g.ngay.isoformat()
-    } for g in giao_dichs]), 200
+    response = jsonify(items)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, 200
 
 # Category Routes
 @category_bp.route('/danh-muc', methods=['POST'])
@@ -188,26 +207,16 @@ def update_profile():
 @jwt_required()
 def get_statistics():
     user_id = get_jwt_identity()
-    danh_mucs = DanhMuc.query.filter_by(nguoi_dung_id=user_id).all()
-    danh_muc_ids = [dm.id for dm in danh_mucs]
-    
     now = datetime.utcnow()
     month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     
-    chi_tieu = db.session.query(db.func.sum(GiaoDich.so_tien)).filter(
-        GiaoDich.danh_muc_id.in_(danh_muc_ids),
-        GiaoDich.ngay >= month_start,
-        DanhMuc.loai_danh_muc == 'Chi tiêu'
-    ).join(DanhMuc).scalar() or 0
-    
-    thu_nhap = db.session.query(db.func.sum(GiaoDich.so_tien)).filter(
-        GiaoDich.danh_muc_id.in_(danh_muc_ids),
-        GiaoDich.ngay >= month_start,
-        DanhMuc.loai_danh_muc == 'Thu nhập'
-    ).join(DanhMuc).scalar() or 0
+    # Một câu SQL cho cả số dư, chi tiêu và thu nhập tháng này
+    stats = dashboard_summary(db, NguoiDung, DanhMuc, GiaoDich, user_id, month_start)
+    if not stats:
+        return jsonify({'message': 'Người dùng không tồn tại'}), 404
     
     return jsonify({
-        'chi_tieu_thang_nay': chi_tieu,
-        'thu_nhap_thang_nay': thu_nhap,
-        'so_du': NguoiDung.query.get(user_id).so_du
+        'chi_tieu_thang_nay': stats.chi_tieu,
+        'thu_nhap_thang_nay': stats.thu_nhap,
+        'so_du': stats.so_du
     }), 200
@@ -0,0 +1,137 @@
+# stats_queries.py - Truy vấn thống kê dùng chung cho app.py, routes.py, app_full.py
+# Mỗi app có bộ model riêng nên các hàm nhận db và các class model làm tham số
+from datetime import datetime, timedelta
+from sqlalchemy import and_, case, func
+
+from money import money_sum
+
+def dashboard_summary(db, NguoiDung, DanhMuc, GiaoDich, user_id, since, extra_columns=()):
+    """
+    Số dư + tổng chi/thu từ `since` trong MỘT câu SQL:
+    SUM(CASE loai_danh_muc ...) trên nguoi_dung ⟕ giao_dich (theo nguoi_dung_id, ngay) ⟕ danh_muc.
+    extra_columns: các scalar subquery thêm vào cùng câu (vd: tổng tích lũy, vay nợ).
+    Trả về Row (so_du, chi_tieu, thu_nhap, *extra) hoặc None nếu không có user
+    """
+    chi_tieu = money_sum(case((DanhMuc.loai_danh_muc == 'Chi tiêu', GiaoDich.so_tien), else_=0))
+    thu_nhap = money_sum(case((DanhMuc.loai_danh_muc == 'Thu nhập', GiaoDich.so_tien), else_=0))
+
+    return db.session.query(
+        NguoiDung.so_du,
+        chi_tieu.label('chi_tieu'),
+        thu_nhap.label('thu_nhap'),
+        *extra_columns
+    ).select_from(NguoiDung).outerjoin(
+        GiaoDich, and_(GiaoDich.nguoi_dung_id == NguoiDung.id, GiaoDich.ngay >= since)
+    ).outerjoin(
+        DanhMuc, DanhMuc.id == GiaoDich.danh_muc_id
+    ).filter(
+        NguoiDung.id == user_id
+    ).group_by(NguoiDung.id, NguoiDung.so_du).first()
+
+PERIODS = ('day', 'week', 'month', 'year')
+MAX_PERIODS = 1000
+
+def period_expression(db, column, chu_ky):
+    """
+    Biểu thức SQL đổi ngày thành khóa kỳ dạng chuỗi:
+    day 'YYYY-MM-DD', week = ngày thứ Hai đầu tuần 'YYYY-MM-DD', month 'YYYY-MM', year 'YYYY'
+    """
+    if db.engine.dialect.name == 'postgresql':
+        if chu_ky == 'week':
+            return func.to_char(func.date_trunc('week', column), 'YYYY-MM-DD')
+        return func.to_char(column, {'day': 'YYYY-MM-DD', 'month': 'YYYY-MM', 'year': 'YYYY'}[chu_ky])
+
+    # SQLite: 'weekday 0' nhảy tới Chủ nhật gần nhất (hoặc giữ nguyên), lùi 6 ngày là thứ Hai
+    if chu_ky == 'week':
+        return func.date(column, 'weekday 0', '-6 days')
+    return func.strftime({'day': '%Y-%m-%d', 'month': '%Y-%m', 'year': '%Y'}[chu_ky], column)
+
+def period_key(dt, chu_ky):
+    """Khóa kỳ tính bằng Python, cùng định dạng với period_expression"""
+    if chu_ky == 'week':
+        dt = dt - timedelta(days=dt.weekday())
+    return dt.strftime({'day': '%Y-%m-%d', 'week': '%Y-%m-%d', 'month': '%Y-%m', 'year': '%Y'}[chu_ky])
+
+def parse_period_key(key, chu_ky):
+    """Ngược của period_key: ngày bắt đầu kỳ"""
+    return datetime.strptime(key, {'day': '%Y-%m-%d', 'week': '%Y-%m-%d', 'month': '%Y-%m', 'year': '%Y'}[chu_ky])
+
+def period_keys(start, end, chu_ky):
+    """Mọi khóa kỳ từ start tới end (gồm cả hai đầu) để biểu đồ không bị hụt kỳ trống"""
+    keys = []
+    current = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    if chu_ky == 'week':
+        current -= timedelta(days=current.weekday())
+    elif chu_ky == 'month':
+        current = current.replace(day=1)
+    elif chu_ky == 'year':
+        current = current.replace(month=1, day=1)
+
+    while current <= end:
+        keys.append(period_key(current, chu_ky))
+        if len(keys) > MAX_PERIODS:
+            raise ValueError(f'Khoảng thời gian quá dài (tối đa {MAX_PERIODS} kỳ)')
+        if chu_ky == 'day':
+            current += timedelta(days=1)
+        elif chu_ky == 'week':
+            current += timedelta(days=7)
+        elif chu_ky == 'month':
+            current = current.replace(year=current.year + current.month // 12, month=current.month % 12 + 1)
+        else:
+            current = current.replace(year=current.year + 1)
+    return keys
+
+def expense_by_category(db, DanhMuc, GiaoDich, user_id, start=None, end=None, chu_ky=None):
+    """
+    Tổng chi tiêu theo danh mục (và theo kỳ nếu có chu_ky) trong MỘT câu GROUP BY.
+    Danh mục chưa có giao dịch vẫn xuất hiện với 0 nhờ LEFT JOIN.
+    Không có chu_ky: [{'ten_danh_muc', 'so_tien'}] như trước.
+    Có chu_ky: ma trận {'chu_ky', 'ky': [...], 'danh_muc': [{'id', 'ten_danh_muc', 'so_tien': [...], 'tong'}]}
+    """
+    if chu_ky and chu_ky not in PERIODS:
+        raise ValueError(f"chu_ky phải là một trong: {', '.join(PERIODS)}")
+
+    join_on = [GiaoDich.danh_muc_id == DanhMuc.id]
+    if start:
+        join_on.append(GiaoDich.ngay >= start)
+    if end:
+        join_on.append(GiaoDich.ngay < end)
+
+    columns = [DanhMuc.id, DanhMuc.ten_danh_muc]
+    if chu_ky:
+        columns.append(period_expression(db, GiaoDich.ngay, chu_ky).label('ky'))
+
+    rows = db.session.query(
+        *columns, money_sum(GiaoDich.so_tien).label('tong')
+    ).outerjoin(GiaoDich, and_(*join_on)).filter(
+        DanhMuc.nguoi_dung_id == user_id,
+        DanhMuc.loai_danh_muc == 'Chi tiêu'
+    ).group_by(*columns).order_by(DanhMuc.id).all()
+
+    if not chu_ky:
+        return [{'ten_danh_muc': r.ten_danh_muc, 'so_tien': r.tong or 0} for r in rows]
+
+    # Dựng ma trận danh mục × kỳ, lấp các kỳ trống trong khoảng
+    cells = {}
+    danh_mucs = {}
+    for r in rows:
+        danh_mucs[r.id] = r.ten_danh_muc
+        if r.ky is not None:
+            cells[(r.id, r.ky)] = r.tong or 0
+
+    present = sorted({ky for _, ky in cells})
+    range_start = start or (parse_period_key(present[0], chu_ky) if present else None)
+    range_end = (end - timedelta(microseconds=1)) if end else (parse_period_key(present[-1], chu_ky) if present else None)
+    ky = period_keys(range_start, range_end, chu_ky) if range_start and range_end else []
+    ky = sorted(set(ky) | set(present))
+
+    return {
+        'chu_ky': chu_ky,
+        'ky': ky,
+        'danh_muc': [{
+            'id': id,
+            'ten_danh_muc': ten,
+            'so_tien': [cells.get((id, k), 0) for k in ky],
+            'tong': sum(cells.get((id, k), 0) for k in ky)
+        } for id, ten in danh_mucs.items()]
+    }
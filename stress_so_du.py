@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Kiểm tra số dư khi nhiều worker ghi cùng lúc (như gunicorn nhiều worker, nhiều thread):
+các process song song gửi POST /api/giao-dich và /api/giao-dich/bulk cho CÙNG một user,
+xong so sánh so_du với số dư ban đầu + tổng các giao dịch đã ghi, với sổ cái, và tong_hop_thang với giao_dich.
+    python stress_so_du.py                  # 2000 request, 8 process × 4 thread, SQLite tạm
+    python stress_so_du.py 5000 16 8        # số request, số process, số thread mỗi process
+Đặt DATABASE_URL để chạy trên database có sẵn (PostgreSQL...): tạo một user mới, không đụng user khác
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+
+# Process con (spawn) nhận lại biến môi trường của process cha nên dùng chung database
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'stress.db')
+os.environ.setdefault('RESPONSE_CACHE', 'off')
+os.environ.setdefault('RESOURCE_VERSION_STORE', 'off')
+# Không để job AI chạy chen vào lúc đo
+os.environ.setdefault('AI_JOB_DEBOUNCE', '3600')
+os.environ.setdefault('BCRYPT_ROUNDS', '4')
+
+SO_DU_BAN_DAU = 1_000_000_000
+BULK_EVERY = 20
+BULK_ROWS = 5
+
+worker = {}
+
+def init_worker(user_id):
+    from flask_jwt_extended import create_access_token
+    from app import app
+    with app.app_context():
+        token = create_access_token(identity=str(user_id))
+    # Lỗi 500 (vd: SQLite hết thời gian chờ khóa) đã được đếm, không in traceback
+    app.logger.disabled = True
+    worker['client'] = app.test_client()
+    worker['headers'] = {'Authorization': f'Bearer {token}'}
+
+def send(task):
+    """Một request; trả về (status, số giao dịch đã ghi)"""
+    kind, payload = task
+    if kind == 'bulk':
+        response = worker['client'].post('/api/giao-dich/bulk', json=payload, headers=worker['headers'])
+        return response.status_code, len(payload) if response.status_code == 201 else 0
+    response = worker['client'].post('/api/giao-dich', json=payload, headers=worker['headers'])
+    return response.status_code, 1 if response.status_code == 201 else 0
+
+def run_chunk(args):
+    """Chạy một phần việc bằng nhiều thread trong process con; trả về [(chỉ số task, status, số giao dịch)]"""
+    tasks, threads = args
+    with ThreadPoolExecutor(threads) as pool:
+        results = list(pool.map(send, [task for _, task in tasks]))
+    return [(i, status, count) for (i, _), (status, count) in zip(tasks, results)]
+
+def make_tasks(n, chi_id, thu_id, seed=7):
+    """Xen kẽ chi/thu với số tiền ngẫu nhiên; cứ BULK_EVERY request có một lô bulk"""
+    rnd = random.Random(seed)
+    tasks = []
+    for i in range(n):
+        if i % BULK_EVERY == BULK_EVERY - 1:
+            tasks.append(('bulk', [{'danh_muc_id': rnd.choice((chi_id, thu_id)), 'so_tien': rnd.randrange(1, 1000) * 1000}
+                                   for _ in range(BULK_ROWS)]))
+        else:
+            tasks.append(('one', {'danh_muc_id': rnd.choice((chi_id, thu_id)), 'so_tien': rnd.randrange(1, 1000) * 1000}))
+    return tasks
+
+def task_delta(task, chi_id):
+    rows = task[1] if task[0] == 'bulk' else [task[1]]
+    return sum(-r['so_tien'] if r['danh_muc_id'] == chi_id else r['so_tien'] for r in rows)
+
+def main():
+    numbers = [int(a) for a in sys.argv[1:]]
+    n, processes, threads = (numbers + [2000, 8, 4][len(numbers):])[:3]
+
+    from app import app, db, ledger, NguoiDung, DanhMuc, GiaoDich, TongHopThang
+    from money import money_sum
+
+    with app.app_context():
+        db.create_all()
+    email = f'stress-{int(time.time() * 1000)}@example.com'
+    client = app.test_client()
+    response = client.post('/api/auth/register', json={
+        'ho_ten': 'Stress', 'email': email, 'mat_khau': 'stress-test', 'so_du': SO_DU_BAN_DAU
+    })
+    user_id = response.get_json()['user_id']
+    with app.app_context():
+        danh_mucs = {dm.loai_danh_muc: dm.id for dm in DanhMuc.query.filter_by(nguoi_dung_id=user_id)}
+        dialect = db.engine.dialect.name
+    chi_id, thu_id = danh_mucs['Chi tiêu'], danh_mucs['Thu nhập']
+
+    tasks = list(enumerate(make_tasks(n, chi_id, thu_id)))
+    chunks = [(tasks[i::processes], threads) for i in range(processes)]
+    print(f"{n} request ({sum(1 for _, t in tasks if t[0] == 'bulk')} bulk), "
+          f"{processes} process × {threads} thread, {dialect}")
+
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(processes, mp_context=get_context('spawn'),
+                             initializer=init_worker, initargs=(user_id,)) as pool:
+        results = [r for chunk in pool.map(run_chunk, chunks) for r in chunk]
+    elapsed = time.perf_counter() - t0
+
+    ok = [i for i, status, _ in results if status == 201]
+    failed = {}
+    for _, status, _ in results:
+        if status != 201:
+            failed[status] = failed.get(status, 0) + 1
+    expected = SO_DU_BAN_DAU + sum(task_delta(tasks[i][1], chi_id) for i in ok)
+    written = sum(count for _, _, count in results)
+
+    with app.app_context():
+        so_du = db.session.query(NguoiDung.so_du).filter_by(id=user_id).scalar()
+        rows = db.session.query(GiaoDich.danh_muc_id, money_sum(GiaoDich.so_tien), db.func.count(GiaoDich.id)).filter(
+            GiaoDich.nguoi_dung_id == user_id
+        ).group_by(GiaoDich.danh_muc_id).all()
+        tong_hop = db.session.query(
+            TongHopThang.danh_muc_id, money_sum(TongHopThang.tong_tien), db.func.sum(TongHopThang.so_giao_dich)
+        ).filter(TongHopThang.nguoi_dung_id == user_id).group_by(TongHopThang.danh_muc_id).all()
+        doi_soat = ledger.reconcile(user_id, full=True)
+
+    from_rows = SO_DU_BAN_DAU + sum(-tong if d == chi_id else tong for d, tong, _ in rows)
+    checks = [
+        ('so_du = ban đầu + các request thành công', so_du == expected),
+        ('so_du = ban đầu + tổng giao_dich', so_du == from_rows),
+        ('số giao_dich = số đã ghi', sum(c for _, _, c in rows) == written),
+        ('tong_hop_thang = tổng giao_dich', sorted(tong_hop) == sorted(rows)),
+        ('so_du = sổ cái, sổ cái đủ dòng', not doi_soat['lech'] and not doi_soat['thieu_but_toan']),
+    ]
+
+    print(f"{len(ok)}/{n} request thành công trong {elapsed:.1f}s ({n / elapsed:.0f} req/s), {written} giao dịch"
+          + (f", lỗi: {failed}" if failed else ''))
+    print(f"so_du = {so_du:,}, kỳ vọng {expected:,}")
+    for name, passed in checks:
+        print(f"  {'✅' if passed else '❌'} {name}")
+    sys.exit(0 if all(passed for _, passed in checks) else 1)
+
+if __name__ == "__main__":
+    main()
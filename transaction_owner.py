@@ -0,0 +1,59 @@
+# transaction_owner.py - Cột giao_dich.nguoi_dung_id: chủ sở hữu chép từ danh_muc
+# để truy vấn theo user chỉ cần quét khoảng index (nguoi_dung_id, ngay), không join/IN danh mục
+from sqlalchemy import event, inspect, select, text
+
+OWNER_COLUMN_DDL = "ALTER TABLE giao_dich ADD COLUMN nguoi_dung_id INTEGER REFERENCES nguoi_dung(id)"
+BACKFILL_BATCH = 5000
+
+def backfill_owner(db, batch=BACKFILL_BATCH, progress=None):
+    """
+    Điền nguoi_dung_id còn trống từ danh_muc theo lô id tăng dần, commit mỗi lô.
+    Giao dịch mồ côi (danh mục đã bị xóa) giữ NULL. Trả về số dòng đã điền
+    """
+    done, last_id = 0, 0
+    while True:
+        with db.engine.begin() as conn:
+            ids = conn.execute(text(
+                "SELECT id FROM giao_dich WHERE nguoi_dung_id IS NULL AND id > :last ORDER BY id LIMIT :batch"
+            ), {'last': last_id, 'batch': batch}).scalars().all()
+            if not ids:
+                return done
+            done += conn.execute(text(
+                "UPDATE giao_dich SET nguoi_dung_id = "
+                "(SELECT danh_muc.nguoi_dung_id FROM danh_muc WHERE danh_muc.id = giao_dich.danh_muc_id) "
+                "WHERE id >= :first AND id <= :last AND nguoi_dung_id IS NULL "
+                "AND danh_muc_id IN (SELECT id FROM danh_muc)"
+            ), {'first': ids[0], 'last': ids[-1]}).rowcount
+        last_id = ids[-1]
+        if progress:
+            progress(done)
+
+def ensure_owner_column(db):
+    """
+    Thêm cột vào database cũ (db.create_all không thêm cột). Không điền dữ liệu: quét dòng NULL
+    trên bảng lớn quá chậm cho lúc khởi động, việc đó dành cho migrate_giao_dich_owner.py
+    """
+    existing = {c['name'] for c in inspect(db.engine).get_columns('giao_dich')}
+    if 'nguoi_dung_id' not in existing:
+        with db.engine.begin() as conn:
+            conn.execute(text(OWNER_COLUMN_DDL))
+
+def watch_owner(GiaoDich, DanhMuc):
+    """
+    Hook: thêm giao dịch chưa gán nguoi_dung_id, hoặc đổi danh_muc_id -> chép chủ của danh mục.
+    bulk_insert_mappings bỏ qua hook nên mapping phải tự có nguoi_dung_id
+    """
+    def owner_of(connection, danh_muc_id):
+        return connection.execute(
+            select(DanhMuc.nguoi_dung_id).where(DanhMuc.id == danh_muc_id)
+        ).scalar()
+
+    @event.listens_for(GiaoDich, 'before_insert')
+    def set_owner(mapper, connection, target):
+        if target.nguoi_dung_id is None:
+            target.nguoi_dung_id = owner_of(connection, target.danh_muc_id)
+
+    @event.listens_for(GiaoDich, 'before_update')
+    def sync_owner(mapper, connection, target):
+        if inspect(target).attrs.danh_muc_id.history.has_changes():
+            target.nguoi_dung_id = owner_of(connection, target.danh_muc_id)
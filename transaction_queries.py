@@ -0,0 +1,117 @@
+# transaction_queries.py - Truy vấn danh sách giao dịch dùng chung cho app.py, routes.py, app_full.py
+# Mỗi app có bộ model riêng nên các hàm nhận class GiaoDich làm tham số
+import base64
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_
+
+TRANSACTION_FIELDS = ('id', 'danh_muc_id', 'so_tien', 'mo_ta', 'ngay')
+MAX_LIMIT = 500
+
+def encode_cursor(ngay, id):
+    """Cursor = vị trí (ngay, id) của dòng cuối trang, mã hóa base64 cho gọn URL; ngay NULL ghi là chuỗi rỗng"""
+    raw = f"{ngay.isoformat() if ngay else ''}|{id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor):
+    """-> (ngay hoặc None, id)"""
+    try:
+        ngay, id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        return (datetime.fromisoformat(ngay) if ngay else None), int(id)
+    except Exception:
+        raise ValueError('Cursor không hợp lệ')
+
+def after_cursor(GiaoDich, c_ngay, c_id):
+    """Điều kiện các dòng đứng sau cursor theo thứ tự (ngay DESC NULLS LAST, id DESC)"""
+    if c_ngay is None:
+        return and_(GiaoDich.ngay.is_(None), GiaoDich.id < c_id)
+    return or_(
+        GiaoDich.ngay < c_ngay,
+        and_(GiaoDich.ngay == c_ngay, GiaoDich.id < c_id),
+        GiaoDich.ngay.is_(None)
+    )
+
+def parse_date_range(tu_ngay, den_ngay):
+    """den_ngay chỉ có ngày (YYYY-MM-DD) thì tính trọn ngày đó"""
+    try:
+        start = datetime.fromisoformat(tu_ngay) if tu_ngay else None
+        end = datetime.fromisoformat(den_ngay) if den_ngay else None
+    except ValueError:
+        raise ValueError('Ngày không hợp lệ, dùng định dạng ISO (YYYY-MM-DD)')
+    if end and len(den_ngay) == 10:
+        end += timedelta(days=1)
+    return start, end
+
+def parse_fields(fields, default_fields):
+    if not fields:
+        return list(default_fields)
+    selected = [f.strip() for f in fields.split(',') if f.strip()]
+    unknown = [f for f in selected if f not in TRANSACTION_FIELDS]
+    if unknown:
+        raise ValueError(f"Trường không hỗ trợ: {', '.join(unknown)}")
+    return selected
+
+def serialize_transaction(row, fields):
+    item = {}
+    for f in fields:
+        value = getattr(row, f)
+        if f == 'ngay':
+            value = value.isoformat() if value else None
+        item[f] = value
+    return item
+
+def list_transactions(GiaoDich, user_id, args, default_fields):
+    """
+    Danh sách giao dịch của user, mới nhất trước, sắp theo (ngay, id).
+    Tham số (query string):
+      limit, cursor        - phân trang keyset; không có limit thì trả hết như cũ
+      tu_ngay, den_ngay    - lọc khoảng ngày (ISO)
+      danh_muc_id          - một hoặc nhiều id, cách nhau dấu phẩy
+      fields               - chỉ trả các trường cần (vd: fields=so_tien,ngay)
+    Trả về (items, next_cursor); tham số sai -> ValueError
+    """
+    fields = parse_fields(args.get('fields'), default_fields)
+
+    # Lọc theo cột chủ sở hữu của giao_dich: quét khoảng index (nguoi_dung_id, ngay), không join danh mục
+    query = GiaoDich.query.filter(GiaoDich.nguoi_dung_id == user_id)
+
+    start, end = parse_date_range(args.get('tu_ngay'), args.get('den_ngay'))
+    if start:
+        query = query.filter(GiaoDich.ngay >= start)
+    if end:
+        query = query.filter(GiaoDich.ngay < end)
+
+    if args.get('danh_muc_id'):
+        try:
+            danh_muc_ids = [int(x) for x in args['danh_muc_id'].split(',') if x.strip()]
+        except ValueError:
+            raise ValueError('danh_muc_id không hợp lệ')
+        query = query.filter(GiaoDich.danh_muc_id.in_(danh_muc_ids))
+
+    if args.get('cursor'):
+        c_ngay, c_id = decode_cursor(args['cursor'])
+        query = query.filter(after_cursor(GiaoDich, c_ngay, c_id))
+
+    # id và ngay luôn được chọn vì cần cho cursor
+    columns = [getattr(GiaoDich, f) for f in TRANSACTION_FIELDS
+               if f in fields or f in ('id', 'ngay')]
+    # Dòng cũ ngay NULL xếp cuối ở mọi database (PostgreSQL mặc định để NULL đầu khi DESC)
+    query = query.with_entities(*columns).order_by(GiaoDich.ngay.desc().nulls_last(), GiaoDich.id.desc())
+
+    limit = args.get('limit')
+    if limit is None:
+        rows = query.all()
+        return [serialize_transaction(r, fields) for r in rows], None
+
+    try:
+        limit = max(1, min(int(limit), MAX_LIMIT))
+    except ValueError:
+        raise ValueError('limit không hợp lệ')
+
+    # Lấy dư 1 dòng để biết còn trang sau hay không
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].ngay, rows[-1].id)
+
+    return [serialize_transaction(r, fields) for r in rows], next_cursor